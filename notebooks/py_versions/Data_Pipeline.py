@@ -17,16 +17,42 @@
 
 # %%
 # Import Libraries
-from ElexonDataPortal import api
 import pandas as pd
 import os
-import numpy as np
 from datetime import timedelta
+import bmrs_data
+import bmrs_fetch
+import generation_calc
+import generation_outputs
+import nowcast
 import pipeline_fns as plfns
+import pipeline_instrumentation
+import pipeline_schema
+import pipeline_storage
+import psd
+import wind_correction
 import warnings
 
 warnings.filterwarnings(action="ignore", category=UserWarning)
 
+# %% [markdown]
+# Every call to a function of the pipeline modules made by this notebook is recorded with its duration, rows in/out and peak memory, and written to "data/BMRS/Final/run_report.json" at the end of the run (or when the run fails). Set the PIPELINE_PROFILE environment variable to "cprofile" and/or "tracemalloc" (comma separated) to also profile the run.
+
+# %%
+run_report = pipeline_instrumentation.RunReport("Data_Pipeline")
+pipeline_modules = [
+    plfns,
+    bmrs_fetch,
+    bmrs_data,
+    generation_calc,
+    generation_outputs,
+    nowcast,
+    pipeline_storage,
+    psd,
+    wind_correction,
+]
+restore_pipeline_modules = run_report.instrument(pipeline_modules, exclude=["run_generation_stages"])
+
 # %%
 osdp_folder = os.environ.get("OSDP")
 # osdp_folder
@@ -41,165 +67,105 @@ osdp_folder = os.environ.get("OSDP")
     location_BMRS_Final,
 ) = plfns.create_folder_structure(osdp_folder=osdp_folder)
 
+run_report.write_on_exit(location_BMRS_Final)
+
 # %% [markdown]
 # ### Data Diff Querying / Change Data Capture (CDC)
 # For both the B1610 data and the PHYBMDATA we want to check if these datasets already exist in the "OSDP" directory, and create them if not. <br> <br>
 # We then want to check for the difference since the pipeline was last run as this will be more efficient than requesting all the historic and BM data each time the pipeline is run. <br><br>
 # In order to achieve this, the script first checks for updates to the historic generation by BMU (B1610 report), i.e. whether new B1610 data is available since the pipeline was last run. NB, this report only updates once daily for one entire day. If the B1610 data hasn't been updated for longer than the "num_days" variable, then the function will automatically cause the  "get_setup_B1610_data" function to run to create a new dataset. <br><br>
 # Once the B1610 data has been updated, the script then checks for updates to the Balancing Mechanism Physical data: it removes any data that has now been replaced with historic data, then proceeds to query for new physical data. The period queried will be the first period since the physical data was last queried until the end of the current day. NB, physical data is updated half-hourly. Hence, this script should eventually run every 30 min.<br><br>
-# At the end, the updated dataframes overwrite the existing ones.
+# The raw responses of both reports are cached in "data/BMRS/cache" for each settlement period, so that reruns don't request data that has already been downloaded (and can't have changed since). <br><br>
+# At the end, the updated B1610 dataframe overwrites the existing one if days were added or dropped. It is stored as an Arrow file ("B1610.arrow") with one compressed record batch per settlement date, and a small JSON sidecar of the latest settlement date and the number of rows of each day, so that the latest date is known without reading the data and single days can be read from the file without decompressing the others (see read_B1610_data). The PHYBMDATA is stored as one file per settlement date, so only the days that received new data are rewritten and days now covered by the B1610 data are deleted.
 
 # %%
-df_B1610 = plfns.setup_update_B1610_data(location_BMRS_B1610=location_BMRS_B1610, num_days=14, hist_days=45)
+location_BMRS_cache = os.path.join(location_BMRS, "cache")
+
+df_B1610 = bmrs_data.setup_update_B1610_data(
+    location_BMRS_B1610=location_BMRS_B1610, num_days=14, hist_days=45, cache_location=location_BMRS_cache
+)
 
 # %%
 BM_start_date = pd.to_datetime(df_B1610["settlementDate"].max() + timedelta(days=1)).replace(tzinfo=None)
 
 # %%
-df_PHYBMDATA = plfns.setup_update_PHYBM_data(
-    BM_start_date=BM_start_date, location_BMRS_PHYBMDATA=location_BMRS_PHYBMDATA
+df_PHYBMDATA = bmrs_data.setup_update_PHYBM_data(
+    BM_start_date=BM_start_date, location_BMRS_PHYBMDATA=location_BMRS_PHYBMDATA, cache_location=location_BMRS_cache
 )
 
 # %% [markdown]
-# ### Reducing the BM data to follow a similar patterns as the historic data
-# Next, the balancing mechanism data should be filtered and transformed so that it follows a similar pattern as the B1610 data. <br> <br>
-# Abbreviations (https://www.bmreports.com/bmrs/?q=help/glossary): <br>
-# * **FPN**: Final Physical Notification - "A Physical Notification is the best estimate of the level of generation or demand that a participant in the BM expects a BM Unit to export or import, respectively, in a Settlement Period."
-# * **BOAL(F)**: Bid Offer Acceptance Level - subsequent "last minute" changes to this notified generation, e.g. due to curtailment or due to balancing demands. "A Bid-Offer Acceptance is a formalised representation of the purchase and/or sale of Offers and/or Bids (see Bid-Offer Data below) by the System Operator in its operation of the Balancing Mechanism."
-# * **MEL**: Maximum Export Level - It is the maximum power export level of a particular BM Unit at a particular time. It is submitted as a series of point MW values and associated times. <br><br>
-# The actions to turn the BM data into long format and resolve it to minutely level will only be performed on the latest BM data to reduce the processing time and compute required. The rest of the BM data will be read from the previous version of the output dataset, i.e. anything between the BM_Start_date and 90min from the end date of the previous version of the "Generation_Combined.csv" output.
+# ### BMU lookup table
+# Each BMU is matched to its name, location and fuel type in the BMU lookup table compiled from the merged Power Station Dictionary by the "PSD_dataprep" notebook. BMUs that are not in the dictionary get default values for the dashboard.
 
 # %%
-df_generation, df_fpn, df_mel, df_boal = plfns.filter_and_rename_physical_Data(
-    location_BMRS_Final, df_B1610, df_PHYBMDATA
-)
+with run_report.stage("read_BMU_metadata"):
+    df_bmu_metadata = psd.read_BMU_metadata(location)
 
 # %% [markdown]
-# The half-hourly or sub-half-hourly data is resampled to minutely resolution so that actions that happen at different times during each half-hour period can be joined together.
-
-# %%
-df_boal_long = plfns.convert_physical_data_to_long(df_boal)
-unit_boal_resolved = plfns.resolve_applied_bid_offer_level(df_boal_long)
-
-# %%
-df_fpn_long = plfns.convert_physical_data_to_long(df_fpn)
-unit_fpn_resolved = plfns.resolve_FPN_MEL_level(df_fpn_long)
-
-# %%
-df_mel_long = plfns.convert_physical_data_to_long(df_mel)
-unit_mel_resolved = plfns.resolve_FPN_MEL_level(df_mel_long)
-
-# %%
-# After resampling the data to minutely resolution (Time), join the FPN, BOAL and MEL data.
-
-df_fpn_boal = pd.merge(
-    unit_fpn_resolved, unit_boal_resolved, how="outer", on=["Time", "bmUnitID"], suffixes=["_fpn", "_boal"]
-)
-
-df_fpn_mel_boal = pd.merge(df_fpn_boal, unit_mel_resolved, how="outer", on=["Time", "bmUnitID"]).rename(
-    columns={"Level": "Level_mel"}
-)
-
-# %%
-df_fpn_mel_boal["quantity"] = df_fpn_mel_boal["Level_boal"].fillna(
-    df_fpn_mel_boal["Level_fpn"], inplace=False
-)  # If a BOAL value exists, use it. Otherwise, retain the FPN value (which will always exist).
-df_fpn_mel_boal["quantity"] = np.where(
-    df_fpn_mel_boal["quantity"] > df_fpn_mel_boal["Level_mel"],
-    df_fpn_mel_boal["Level_mel"],
-    df_fpn_mel_boal["quantity"],
-)  # If the MEL is lower than the BOAL or FPN value, cap the generation at the level of the MEL.
-
-# %%
-# Aggregate back up to the settlement period (SP) level and calculate the mean generation during each SP
-df_fpn_mel_boal["settlementPeriod_fpn"] = df_fpn_mel_boal["settlementPeriod_fpn"].astype(str)
-df_fpn_mel_boal_agg = (
-    df_fpn_mel_boal.groupby(["local_datetime_fpn", "settlementDate", "settlementPeriod", "bmUnitID"])
-    .mean()
-    .reset_index()
+# ### Generation stages
+# The steps below are run in order by "run_generation_stages", which the resident mode of the pipeline ("pipeline_daemon.py") runs as well, so that both give the same output. Each step is recorded as a stage of the run report, with its input and output rows. Their settings are all in the cell below. <br><br>
+# **Wind FPN correction** ("correct_wind_FPN"): The FPNs of wind farms rely on forecasts and are much less accurate than those of conventional generators (see "Limitations to be aware of" in the README). With "correct_wind_FPN", the FPN levels of every wind BMU are corrected by a linear model (metered = intercept + scale * FPN), fitted per BMU on the historic FPN and B1610 data of the same settlement periods. As the Physical BM Data is deleted once the B1610 data covers it, the mean FPN of the wind BMUs is kept in "data/BMRS/Final/WindCorrection" for every complete settlement date. The model is only refitted when the B1610 data has new days, otherwise the stored model is applied. BMUs with fewer than two days of history are not corrected. <br><br>
+# **Change tracking** ("sp_aggregation_mode"): Only the settlement periods whose Physical BM Data has changed since the output dataset was last written are recalculated. The records of each BMU and settlement period are summarised by a fingerprint, which is compared to the fingerprints stored alongside the output dataset ("data/BMRS/Final/PHYBMDATA_fingerprints.parquet"). New and revised settlement periods are "dirty". Everything is recalculated if there are no fingerprints, or if they were stored for another "sp_aggregation_mode". <br><br>
+# **Reducing the BM data to follow a similar pattern as the historic data**: Next, the balancing mechanism data should be filtered and transformed so that it follows a similar pattern as the B1610 data. <br><br>
+# Abbreviations (https://www.bmreports.com/bmrs/?q=help/glossary): <br>
+# * **FPN**: Final Physical Notification - "A Physical Notification is the best estimate of the level of generation or demand that a participant in the BM expects a BM Unit to export or import, respectively, in a Settlement Period."
+# * **BOAL(F)**: Bid Offer Acceptance Level - subsequent "last minute" changes to this notified generation, e.g. due to curtailment or due to balancing demands. "A Bid-Offer Acceptance is a formalised representation of the purchase and/or sale of Offers and/or Bids (see Bid-Offer Data below) by the System Operator in its operation of the Balancing Mechanism."
+# * **MEL**: Maximum Export Level - It is the maximum power export level of a particular BM Unit at a particular time. It is submitted as a series of point MW values and associated times. <br><br>
+# The actions to turn the BM data into long format and resolve it to minutely level will only be performed on the BM data of the dirty settlement periods (and the records of neighbouring settlement periods they overlap) to reduce the processing time and compute required. The rest of the BM data will be read from the previous version of the output dataset. <br><br>
+# The FPN, BOAL and MEL data is then combined into the mean generation of each BMU during each settlement period (SP): if a BOAL value exists it is used, otherwise the FPN value is retained, and the generation is capped at the level of the MEL. <br><br>
+# Two modes are available for this step, set with "sp_aggregation_mode":
+# * **minutely**: the half-hourly or sub-half-hourly data is resampled to minutely resolution so that actions that happen at different times during each half-hour period can be joined together, and then aggregated back up to the SP level.
+# * **analytic**: the FPN, BOAL and MEL records are integrated over each SP directly, without upsampling. This gives the same results as the minutely mode for a fraction of the memory and runtime. <br><br>
+# **Merging the BMRS data with the Power Station Dictionary Names and Locations**: The BM derived data is combined with the B1610 data and the previous version of the output dataset. BM data with a negative value (not a generator) or a value of 0 is filtered out (B1610 only has positive values). Each BMU is then matched to its name, location and fuel type in the BMU lookup table read above. <br><br>
+# **Writing the output** ("write_csv", "n_workers", "stream_by_settlement_day", "memory_budget_mb"): The combined dataset is written to "data/BMRS/Final/Generation_Combined" as one parquet file per settlement date, which is much faster to write and read back in on the next run than a CSV. Set "write_csv" to also write it to "Generation_Combined.csv", the original output of the pipeline. <br><br>
+# With "n_workers" above 1, the BMUs are split into shards that are resolved in parallel processes. This gives the same output as a single process. <br><br>
+# With "stream_by_settlement_day", the steps above are run for one settlement date at a time, with the BMUs of each day split into batches that fit within "memory_budget_mb", and each day is written out as soon as it is processed. This gives the same output while bounding the memory used to resolve the settlement periods, which is the largest part of the peak. The budget does not cover the input data, which is still loaded in full. <br><br>
+# **Rollups** ("write_derived_csv"): For dashboards, the combined dataset is also summed by fuel type, low carbon and renewable flag and station (Power Station Dictionary ID), per settlement period and per day, in "data/BMRS/Final/Rollups" (one parquet file, and CSV file with "write_derived_csv", per rollup, e.g. "Generation_Rollup_fuel_settlement_period.parquet"). Only the settlement dates whose partition of the combined dataset has changed since the rollups were last updated are recalculated. <br><br>
+# **Changefeed**: So that consumers don't need to download the whole dataset after every run, the rows of the combined dataset that each run inserted, updated or deleted are published to "data/BMRS/Final/Changefeed/Generation_Changes_<sequence>.parquet", with the sequence number of the run. Every 48 runs that change the dataset (a day), it is compacted into a snapshot ("Generation_Snapshot_<sequence>.parquet"), and the change files before the previous snapshot are deleted. "changefeed.json" lists the latest sequence number, the snapshot and the change files. A consumer applies the change files after its sequence number to its copy (see read_changes and apply_changes), or starts again from the snapshot if they have been compacted. As for the rollups, only the settlement dates whose partition has changed are compared, against the keys and hash of each row as last published, which are kept per settlement date in "Changefeed/State". <br><br>
+# **Nowcast** ("nowcast_resolution"): For the live map, the latest generation of each BMU is also published at a sub-half-hourly resolution ("nowcast_resolution": "1min", "5min" or "15min", or None to not publish it) for the current and next three settlement periods, to "data/BMRS/Final/Nowcast/Generation_Nowcast_<resolution>.parquet" (and ".csv" with "write_derived_csv"). It is calculated from the minutely FPN, BOAL and MEL levels as in the "minutely" mode, averaged over each interval rather than each settlement period, and doesn't change the settlement period dataset above. Only the intervals whose Physical BM Data has changed since the nowcast was last published, and those of the settlement periods that have just entered it, are recalculated. A JSON sidecar records the time span covered and when it was published.
+
+# %%
+correct_wind_FPN = True
+sp_aggregation_mode = "minutely"  # "minutely" or "analytic"
+write_csv = True
+write_derived_csv = False
+stream_by_settlement_day = False
+memory_budget_mb = 512
+n_workers = 1
+nowcast_resolution = "5min"
+
+# %%
+outputs = plfns.run_generation_stages(
+    location_BMRS_Final,
+    df_B1610,
+    df_PHYBMDATA,
+    df_bmu_metadata,
+    mode=sp_aggregation_mode,
+    n_workers=n_workers,
+    write_csv=write_csv,
+    write_derived_csv=write_derived_csv,
+    correct_wind_FPN=correct_wind_FPN,
+    nowcast_resolution=nowcast_resolution,
+    stream_by_settlement_day=stream_by_settlement_day,
+    memory_budget_mb=memory_budget_mb,
+    run_report=run_report,
 )
-df_fpn_mel_boal_agg = df_fpn_mel_boal_agg.rename(columns={"local_datetime_fpn": "local_datetime"})
-df_fpn_mel_boal_agg = df_fpn_mel_boal_agg[
-    ["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID", "quantity"]
-]
-
-# %%
-df_B1610["quantity"] = df_B1610["quantity"].astype("float")
-
-# %%
-df_generation = pd.concat((df_B1610, df_generation, df_fpn_mel_boal_agg), axis=0)
-df_generation = df_generation[
-    df_generation["quantity"] > 0
-].copy()  # Filter out BM data with a negative value (not a generator) or a value of 0 (B1610 only has positive values)
 
 # %% [markdown]
-# ### Merging the BMRS data with the Power Station Dictionary Names and Locations
-
-# %%
-df_psd_merged = pd.read_csv(os.path.join(location, "merged_psd.csv"), header=0, index_col=0)
+# All datasets are kept in the compact column types defined in "pipeline_schema.py": categoricals for the BMU IDs, record types, names and fuel types, int8 for the settlement periods, float32 for the MW levels and int32 for the acceptance numbers. The table below compares their memory footprint with the default pandas types (object strings, int64 and float64).
 
 # %%
-df_generation = df_generation.merge(df_psd_merged, how="left", left_on="bmUnitID", right_on="sett_bmuID")
-df_generation = df_generation[
-    [
-        "local_datetime",
-        "settlementDate",
-        "settlementPeriod",
-        "bmUnitID",
-        "quantity",
-        "dictionary_id",
-        "common_name",
-        "longitude",
-        "latitude",
-        "fuel",
-    ]
-]
-df_generation = df_generation.rename(
-    columns={
-        "local_datetime": "localDateTime",
-        "bmUnitID": "BMUnitID",
-        "dictionary_id": "dictionaryID",
-        "common_name": "commonName",
+df_memory_footprint = pipeline_schema.memory_footprint(
+    {
+        "B1610": df_B1610,
+        "PHYBMDATA": outputs["df_PHYBMDATA"],
+        "FPN": outputs["df_fpn"],
+        "MEL": outputs["df_mel"],
+        "BOAL": outputs["df_boal"],
     }
 )
+df_memory_footprint
 
 # %%
-# Create default values for dashboard
-df_generation["dictionaryID"] = np.where(df_generation["dictionaryID"].isnull(), 99999, df_generation["dictionaryID"])
-df_generation["commonName"] = np.where(
-    df_generation["commonName"].isnull(), "Unknown Name/Location", df_generation["commonName"]
-)
-df_generation["longitude"] = np.where(df_generation["longitude"].isnull(), -2.547855, df_generation["longitude"])
-df_generation["latitude"] = np.where(df_generation["latitude"].isnull(), 54.00366, df_generation["latitude"])
-df_generation["fuel"] = np.where(df_generation["fuel"].isnull(), "Unknown Fuel", df_generation["fuel"])
-
-
-# Split data into renewable/non-renewable
-df_generation["lowCarbonGeneration"] = np.where(
-    df_generation["fuel"].isin(["BIOMASS", "NPSHYD", "NUCLEAR", "PS", "WIND", "Wind"]),
-    "Low Carbon Generation",
-    "Carbon Intensive Generation",
-)
-df_generation["renewableGeneration"] = np.where(
-    df_generation["fuel"].isin(["BIOMASS", "NPSHYD", "PS", "WIND", "Wind"]),
-    "Renewable Generation",
-    "Non-Renewable Generation",
-)
-
-# Give the Fuel Types a more friendly name
-fuel_type_friendly = {
-    "BIOMASS": "Biomass",
-    "CCGT": "Combined-cycle Gas Turbine",
-    "COAL": "Coal",
-    "OCGT": "Open-cycle Gas Turbine",
-    "NPSHYD": "Other Hydro",
-    "NUCLEAR": "Nuclear",
-    "PS": "Pumped Storage Hydro",
-    "WIND": "Wind",
-    "Wind": "Wind",
-}
-
-df_generation["fuel"] = df_generation["fuel"].replace(to_replace=fuel_type_friendly)
-
-# %%
-df_generation.to_csv(os.path.join(location_BMRS_Final, "Generation_Combined.csv"), index=False)
+restore_pipeline_modules()
+run_report.write(location_BMRS_Final)
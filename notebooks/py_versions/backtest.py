@@ -0,0 +1,286 @@
+"""
+Backtests of the settlement period generation calculated from the Physical BM Data, against the metered B1610
+data of the same settlement periods, over historic Physical BM Data kept for the purpose.
+"""
+
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from bmrs_data import (
+    backfill_B1610_data,
+    format_PHYBM_data,
+    list_PHYBM_partitions,
+    read_B1610_data,
+    read_B1610_metadata,
+    read_PHYBM_partitions,
+    upsert_PHYBM_partitions,
+)
+from bmrs_fetch import fetch_BMRS_data
+from generation_calc import calculate_settlement_period_generation, split_physical_data
+from psd import get_BMU_metadata_rows
+from settlement_calendar import NANOSECONDS_PER_PERIOD, get_settlement_date_labels, get_settlement_period
+
+
+# Length of a settlement period in hours, to convert the B1610 energy (MWh) to the mean generation (MW) of the
+# estimate, and number of settlement dates replayed at a time by run_backtest
+HOURS_PER_SETTLEMENT_PERIOD = 0.5
+BACKTEST_BATCH_DAYS = 7
+
+
+def get_backtest_location(location_BMRS: str) -> str:
+    """
+    Returns the folder of the backtests (see run_backtest), which also holds the historic Physical BM Data they
+    replay and the B1610 data they are compared with ("PHYBMDATA" and "B1610"), as the live pipeline deletes its
+    PHYBMDATA partitions once the B1610 data covers them, and only keeps the last "hist_days" days of B1610 data.
+
+    Args:
+        location_BMRS (str): BMRS directory from create_folder_structure.
+
+    Returns:
+        str: path of the backtest folder.
+    """
+    return os.path.join(location_BMRS, "Backtest")
+
+
+def backfill_PHYBM_data(
+    location_BMRS_PHYBMDATA: str, start_date: pd.Timestamp, end_date: pd.Timestamp, cache_location: str = None
+) -> list:
+    """
+    Requests the Physical BM Data of the settlement dates from start_date to end_date that have no partition yet,
+    and stores it as partitions (see upsert_PHYBM_partitions), e.g. to replay the estimate of past dates.
+
+    Args:
+        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA partitions.
+        start_date (pd.Timestamp): first settlement date.
+        end_date (pd.Timestamp): last settlement date.
+        cache_location (str, optional): folder of the BMRS response cache, None to not use the cache.
+
+    Returns:
+        list: settlement dates (YYYY-MM-DD) of the partitions that were written.
+    """
+    os.makedirs(location_BMRS_PHYBMDATA, exist_ok=True)
+    partitions = list_PHYBM_partitions(location_BMRS_PHYBMDATA)
+    settlement_dates = pd.date_range(pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date(), freq="D")
+    missing_dates = [day for day in settlement_dates if day.strftime("%Y-%m-%d") not in partitions]
+    if not missing_dates:
+        return []
+
+    # The dates are local (Europe/London) dates, as the BM start date of setup_update_PHYBM_data
+    df_PHYBMDATA = fetch_BMRS_data(
+        "PHYBMDATA", missing_dates[0], missing_dates[-1] + timedelta(days=1), cache_location=cache_location
+    )
+    df_PHYBMDATA = format_PHYBM_data(df_PHYBMDATA)
+    missing_labels = [day.strftime("%Y-%m-%d") for day in missing_dates]
+    df_PHYBMDATA = df_PHYBMDATA.loc[np.isin(get_settlement_date_labels(df_PHYBMDATA["settlementDate"]), missing_labels)]
+
+    return upsert_PHYBM_partitions(df_PHYBMDATA, location_BMRS_PHYBMDATA)
+
+
+def backfill_missing_B1610_data(
+    location_BMRS_B1610: str, start_date: pd.Timestamp, end_date: pd.Timestamp, cache_location: str = None
+) -> list:
+    """
+    Requests the B1610 data of the settlement dates from start_date to end_date that are not stored yet, and
+    merges it into the stored B1610 dataset (see backfill_B1610_data), e.g. to compare past dates in a backtest.
+
+    Args:
+        location_BMRS_B1610 (str): location of the B1610 dataset (see write_B1610_data).
+        start_date (pd.Timestamp): first settlement date.
+        end_date (pd.Timestamp): last settlement date.
+        cache_location (str, optional): folder of the BMRS response cache, None to not use the cache.
+
+    Returns:
+        list: settlement dates (YYYY-MM-DD) that were requested.
+    """
+    metadata = read_B1610_metadata(location_BMRS_B1610) or {"rows_per_day": {}}
+    settlement_dates = pd.date_range(pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date(), freq="D")
+    missing_dates = [day for day in settlement_dates if day.strftime("%Y-%m-%d") not in metadata["rows_per_day"]]
+    if not missing_dates:
+        return []
+
+    # The dates are local (Europe/London) dates, as in backfill_PHYBM_data, so that only the settlement periods of
+    # the missing dates are requested
+    os.makedirs(location_BMRS_B1610, exist_ok=True)
+    backfill_B1610_data(
+        location_BMRS_B1610, missing_dates[0], missing_dates[-1] + timedelta(days=1), cache_location=cache_location
+    )
+
+    return [day.strftime("%Y-%m-%d") for day in missing_dates]
+
+
+def align_generation_estimate(df_estimate: pd.DataFrame, df_B1610: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aligns the BM derived estimate of the generation with the B1610 data per BMU and settlement period. As in
+    the output dataset (see combine_generation_data), only positive values are kept, so a BMU and settlement
+    period missing from one of the datasets counts as 0 generation in it. The two datasets are matched on an
+    integer key (settlement period since the epoch and BMU code) rather than merged on the column values.
+
+    Args:
+        df_estimate (pd.DataFrame): output of calculate_settlement_period_generation (mean MW).
+        df_B1610 (pd.DataFrame): B1610 data with the types of B1610_SCHEMA (MWh).
+
+    Returns:
+        pd.DataFrame: estimate_MW, metered_MW (the B1610 energy divided by HOURS_PER_SETTLEMENT_PERIOD) and
+        error_MW (estimate minus metered) by local_datetime, settlementDate, settlementPeriod and bmUnitID, in
+        time and BMU ID order.
+    """
+    df_estimate = df_estimate.loc[df_estimate["quantity"] > 0]
+    df_B1610 = df_B1610.loc[df_B1610["quantity"] > 0]
+
+    bmu_estimate = df_estimate["bmUnitID"].astype("category")
+    bmu_B1610 = df_B1610["bmUnitID"].astype("category")
+    bmu_ids = pd.Index(np.union1d(bmu_estimate.cat.categories, bmu_B1610.cat.categories))
+    n_bmus = max(len(bmu_ids), 1)
+
+    def get_keys(df: pd.DataFrame, bmus: pd.Series) -> np.ndarray:
+        periods = df["local_datetime"].to_numpy(dtype="datetime64[ns]").astype("int64") // NANOSECONDS_PER_PERIOD
+        bmu_codes = bmu_ids.get_indexer(bmus.cat.categories)[bmus.cat.codes.to_numpy()]
+        return periods * n_bmus + bmu_codes
+
+    keys_estimate = get_keys(df_estimate, bmu_estimate)
+    keys_B1610 = get_keys(df_B1610, bmu_B1610)
+    keys = np.union1d(keys_estimate, keys_B1610)
+
+    estimate = np.bincount(
+        np.searchsorted(keys, keys_estimate), weights=df_estimate["quantity"].to_numpy("float64"), minlength=len(keys)
+    )
+    metered = np.bincount(
+        np.searchsorted(keys, keys_B1610), weights=df_B1610["quantity"].to_numpy("float64"), minlength=len(keys)
+    )
+    metered = metered / HOURS_PER_SETTLEMENT_PERIOD
+
+    local_datetime = pd.to_datetime((keys // n_bmus) * NANOSECONDS_PER_PERIOD, utc=True)
+    settlement_date, settlement_period = get_settlement_period(local_datetime)
+
+    return pd.DataFrame(
+        {
+            "local_datetime": local_datetime,
+            "settlementDate": settlement_date,
+            "settlementPeriod": settlement_period,
+            "bmUnitID": pd.Categorical.from_codes(keys % n_bmus, categories=bmu_ids),
+            "estimate_MW": estimate,
+            "metered_MW": metered,
+            "error_MW": estimate - metered,
+        }
+    )
+
+
+def calculate_backtest_metrics(df_backtest: pd.DataFrame, by: str = "bmUnitID") -> pd.DataFrame:
+    """
+    Calculates the error metrics of the estimate per group of an aligned backtest dataset.
+
+    Args:
+        df_backtest (pd.DataFrame): output of run_backtest or align_generation_estimate.
+        by (str): column to group by, e.g. "bmUnitID" or "fuel".
+
+    Returns:
+        pd.DataFrame: by group, the number of settlement periods, the estimated and metered energy (MWh), the mean
+        error (bias_MW), mean absolute error (MAE_MW), root mean square error (RMSE_MW) and the absolute error
+        relative to the metered energy (nMAE).
+    """
+    error = df_backtest["error_MW"].to_numpy()
+    df_errors = pd.DataFrame(
+        {
+            by: df_backtest[by].to_numpy(),
+            "n_periods": 1,
+            "estimate_MWh": df_backtest["estimate_MW"].to_numpy() * HOURS_PER_SETTLEMENT_PERIOD,
+            "metered_MWh": df_backtest["metered_MW"].to_numpy() * HOURS_PER_SETTLEMENT_PERIOD,
+            "error_MW": error,
+            "absolute_error_MW": np.abs(error),
+            "squared_error_MW": error**2,
+        }
+    )
+    df_metrics = df_errors.groupby(by, observed=True, sort=True).sum()
+
+    n_periods = df_metrics["n_periods"]
+    df_metrics["bias_MW"] = df_metrics["error_MW"] / n_periods
+    df_metrics["MAE_MW"] = df_metrics["absolute_error_MW"] / n_periods
+    df_metrics["RMSE_MW"] = np.sqrt(df_metrics["squared_error_MW"] / n_periods)
+    df_metrics["nMAE"] = (df_metrics["absolute_error_MW"] * HOURS_PER_SETTLEMENT_PERIOD) / df_metrics[
+        "metered_MWh"
+    ].where(df_metrics["metered_MWh"] > 0)
+
+    return df_metrics[["n_periods", "estimate_MWh", "metered_MWh", "bias_MW", "MAE_MW", "RMSE_MW", "nMAE"]]
+
+
+def run_backtest(
+    location_BMRS_PHYBMDATA: str,
+    location_BMRS_B1610: str,
+    df_bmu_metadata: pd.DataFrame,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    mode: str = "analytic",
+    n_workers: int = 1,
+    batch_days: int = BACKTEST_BATCH_DAYS,
+) -> pd.DataFrame:
+    """
+    Replays the BM derived estimate of the generation for the settlement dates from start_date to end_date from
+    stored Physical BM Data, and aligns it with the B1610 data (see align_generation_estimate). Only the dates with
+    both Physical BM Data and B1610 data are compared, as a date without B1610 data would be compared with 0 MW. The
+    dates are replayed in batches of batch_days, with the partitions of the day before and after each batch, so that
+    only a batch is in memory at a time. Error metrics are calculated with calculate_backtest_metrics.
+
+    Args:
+        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA partitions, e.g. in the backtest folder (see
+                                       get_backtest_location and backfill_PHYBM_data).
+        location_BMRS_B1610 (str): location of the B1610 dataset, e.g. in the backtest folder (see
+                                   backfill_missing_B1610_data).
+        df_bmu_metadata (pd.DataFrame): BMU lookup table from read_BMU_metadata, for the fuel of each BMU.
+        start_date (pd.Timestamp): first settlement date.
+        end_date (pd.Timestamp): last settlement date.
+        mode (str): "minutely" or "analytic", see calculate_settlement_period_generation. Defaults to "analytic".
+        n_workers (int): number of processes resolving the BMUs in parallel. Defaults to 1.
+        batch_days (int): number of settlement dates replayed at a time. Defaults to BACKTEST_BATCH_DAYS.
+
+    Returns:
+        pd.DataFrame: output of align_generation_estimate with the fuel of each BMU, for the settlement dates with
+        stored Physical BM Data and B1610 data.
+
+    Raises:
+        ValueError: if no settlement date in the range has both Physical BM Data and B1610 data.
+    """
+    settlement_dates = pd.date_range(pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date(), freq="D", tz="UTC")
+    frames = []
+    for batch_start in range(0, len(settlement_dates), batch_days):
+        batch_dates = settlement_dates[batch_start : batch_start + batch_days]
+        df_PHYBMDATA = read_PHYBM_partitions(
+            location_BMRS_PHYBMDATA,
+            start_date=batch_dates[0] - timedelta(days=1),
+            end_date=batch_dates[-1] + timedelta(days=1),
+        )
+        if df_PHYBMDATA.empty:
+            continue
+
+        # Only the dates of the batch that have both Physical BM Data and B1610 data are compared
+        df_B1610 = read_B1610_data(location_BMRS_B1610, start_date=batch_dates[0], end_date=batch_dates[-1])
+        replayed_dates = batch_dates[
+            batch_dates.isin(df_PHYBMDATA["settlementDate"].unique()) & batch_dates.isin(df_B1610["settlementDate"])
+        ]
+        if replayed_dates.empty:
+            continue
+
+        df_fpn, df_mel, df_boal = split_physical_data(df_PHYBMDATA)
+        df_estimate = calculate_settlement_period_generation(df_fpn, df_mel, df_boal, mode=mode, n_workers=n_workers)
+        df_estimate = df_estimate.loc[df_estimate["settlementDate"].isin(replayed_dates)]
+        df_B1610 = df_B1610.loc[df_B1610["settlementDate"].isin(replayed_dates)]
+
+        frames.append(align_generation_estimate(df_estimate, df_B1610))
+
+    if not frames:
+        raise ValueError(
+            f"No settlement date from {pd.Timestamp(start_date):%Y-%m-%d} to {pd.Timestamp(end_date):%Y-%m-%d} has"
+            " both Physical BM Data and B1610 data to compare"
+        )
+
+    df_backtest = pd.concat(frames, ignore_index=True)
+    df_backtest["bmUnitID"] = df_backtest["bmUnitID"].astype("category")
+
+    df_backtest["fuel"] = (
+        df_bmu_metadata["fuel"].take(get_BMU_metadata_rows(df_backtest["bmUnitID"], df_bmu_metadata)).values
+    )
+    df_backtest["fuel"] = df_backtest["fuel"].astype("category")
+
+    return df_backtest
@@ -0,0 +1,338 @@
+"""
+Benchmarks the stages of the live generation pipeline offline, on synthetic B1610 and Physical BM Data (see
+synthetic_data.py), at several scales. The wall time, peak memory and number of rows in/out of every stage are
+appended to a JSON lines file together with the git commit, so that the results of different commits can be
+compared:
+
+    python benchmark_pipeline.py --scales small medium --repeat 3
+    python benchmark_pipeline.py --scales small --compare <baseline commit>
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import generation_calc
+import psd
+import synthetic_data
+
+REPO_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+BENCHMARK_RESULTS = os.path.join(REPO_FOLDER, "data", "benchmarks", "benchmark_results.jsonl")
+
+BENCHMARK_SCALES = {
+    "small": {"n_bmu": 50, "n_days": 1, "B1610_days": 14, "boal_density": 0.2, "overlap_fraction": 0.3},
+    "medium": {"n_bmu": 300, "n_days": 2, "B1610_days": 14, "boal_density": 0.2, "overlap_fraction": 0.3},
+    "large": {"n_bmu": 1000, "n_days": 2, "B1610_days": 45, "boal_density": 0.3, "overlap_fraction": 0.3},
+}
+
+# Each stage: name, input names, function of the inputs, output names
+BENCHMARK_STAGES = [
+    (
+        "filter_and_rename_physical_Data",
+        ["location_BMRS_Final", "df_B1610", "df_PHYBMDATA"],
+        generation_calc.filter_and_rename_physical_Data,
+        ["df_generation", "df_fpn", "df_mel", "df_boal"],
+    ),
+    (
+        "convert_physical_data_to_long",
+        ["df_fpn", "df_mel", "df_boal"],
+        lambda *frames: tuple(generation_calc.convert_physical_data_to_long(df) for df in frames),
+        ["fpn_long", "mel_long", "boal_long"],
+    ),
+    (
+        "resolve_applied_bid_offer_level",
+        ["boal_long"],
+        generation_calc.resolve_applied_bid_offer_level,
+        ["unit_boal_resolved"],
+    ),
+    (
+        "resolve_FPN_MEL_level",
+        ["fpn_long", "mel_long"],
+        lambda *frames: tuple(generation_calc.resolve_FPN_MEL_level(df) for df in frames),
+        ["unit_fpn_resolved", "unit_mel_resolved"],
+    ),
+    (
+        "merge_fpn_boal_mel_levels",
+        ["unit_fpn_resolved", "unit_boal_resolved", "unit_mel_resolved"],
+        generation_calc.merge_fpn_boal_mel_levels,
+        ["df_fpn_mel_boal"],
+    ),
+    (
+        "combine_levels_sorted",
+        ["unit_fpn_resolved", "unit_boal_resolved", "unit_mel_resolved"],
+        generation_calc.combine_levels_sorted,
+        ["df_fpn_mel_boal_sorted"],
+    ),
+    (
+        "aggregate_to_settlement_periods",
+        ["df_fpn_mel_boal"],
+        generation_calc.aggregate_to_settlement_periods,
+        ["df_fpn_mel_boal_agg"],
+    ),
+    (
+        "calculate_settlement_period_generation_analytic",
+        ["df_fpn", "df_mel", "df_boal"],
+        generation_calc.calculate_settlement_period_generation_analytic,
+        ["df_fpn_mel_boal_agg_analytic"],
+    ),
+    (
+        "combine_generation_data",
+        ["df_B1610", "df_generation", "df_fpn_mel_boal_agg"],
+        generation_calc.combine_generation_data,
+        ["df_combined"],
+    ),
+    (
+        "compile_BMU_metadata",
+        ["df_psd_merged"],
+        psd.compile_BMU_metadata,
+        ["df_bmu_metadata"],
+    ),
+    (
+        "add_BMU_metadata",
+        ["df_combined", "df_bmu_metadata"],
+        psd.add_BMU_metadata,
+        ["df_generation_final"],
+    ),
+]
+
+
+def get_commit() -> str:
+    """
+    Returns the short hash of the current git commit, with a "-dirty" suffix if there are uncommitted changes.
+
+    Returns:
+        str: commit hash, or None if git is not available.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_FOLDER, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=REPO_FOLDER,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return f"{commit}-dirty" if status else commit
+
+
+def make_benchmark_data(scale: dict, location_BMRS_Final: str, seed: int = 0) -> dict:
+    """
+    Creates the inputs of the first benchmark stage: synthetic B1610 data for the days before the synthetic
+    Physical BM Data, and the Power Station Dictionary, whose BMU IDs are used for the synthetic data.
+
+    Args:
+        scale (dict): parameters of the synthetic data, see BENCHMARK_SCALES.
+        location_BMRS_Final (str): an empty folder, as the previous version of the output dataset.
+        seed (int): random seed.
+
+    Returns:
+        dict: inputs by name.
+    """
+    df_psd_merged = pd.read_csv(os.path.join(REPO_FOLDER, "data", "merged_psd.csv"), header=0, index_col=0)
+    known_bmu_ids = df_psd_merged["sett_bmuID"].dropna().tolist()
+    BM_start_date = pd.Timestamp("2024-06-01") + pd.Timedelta(days=scale["B1610_days"])
+
+    df_B1610 = synthetic_data.make_synthetic_B1610(
+        n_bmu=scale["n_bmu"],
+        n_days=scale["B1610_days"],
+        start_date="2024-06-01",
+        known_bmu_ids=known_bmu_ids,
+        seed=seed,
+    )
+    df_PHYBMDATA = synthetic_data.make_synthetic_PHYBMDATA(
+        n_bmu=scale["n_bmu"],
+        n_days=scale["n_days"],
+        start_date=BM_start_date.strftime("%Y-%m-%d"),
+        boal_density=scale["boal_density"],
+        overlap_fraction=scale["overlap_fraction"],
+        known_bmu_ids=known_bmu_ids,
+        seed=seed,
+    )
+
+    return {
+        "location_BMRS_Final": location_BMRS_Final,
+        "df_B1610": df_B1610,
+        "df_PHYBMDATA": df_PHYBMDATA,
+        "df_psd_merged": df_psd_merged,
+    }
+
+
+def count_rows(values: list) -> int:
+    """
+    Returns the total number of rows of the dataframes in a list.
+
+    Args:
+        values (list): stage inputs or outputs.
+
+    Returns:
+        int: number of rows.
+    """
+    return sum(len(value) for value in values if isinstance(value, pd.DataFrame))
+
+
+def run_stage(function, inputs: list, repeat: int = 1) -> tuple:
+    """
+    Runs a benchmark stage once while tracing the memory allocations to find its peak memory use, then "repeat"
+    more times without tracing, as tracing slows it down, to find its fastest wall time.
+
+    Args:
+        function (callable): stage function.
+        inputs (list): stage inputs.
+        repeat (int): number of timed runs.
+
+    Returns:
+        tuple: the stage outputs, the wall time in seconds and the peak memory in MB.
+    """
+    tracemalloc.start()
+    outputs = function(*inputs)
+    peak_memory = tracemalloc.get_traced_memory()[1] / 1024**2
+    tracemalloc.stop()
+
+    wall_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*inputs)
+        wall_times.append(time.perf_counter() - start)
+
+    return outputs if isinstance(outputs, tuple) else (outputs,), min(wall_times), peak_memory
+
+
+def run_benchmarks(scales: list, repeat: int = 1, seed: int = 0) -> list:
+    """
+    Runs all benchmark stages on synthetic data at each scale. The outputs of each stage are the inputs of the
+    next ones, as in Data_Pipeline.py.
+
+    Args:
+        scales (list): names of the scales in BENCHMARK_SCALES.
+        repeat (int): number of timed runs of each stage.
+        seed (int): random seed of the synthetic data.
+
+    Returns:
+        list: one result dict per scale and stage.
+    """
+    commit = get_commit()
+    timestamp = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    results = []
+    for scale_name in scales:
+        scale = BENCHMARK_SCALES[scale_name]
+        with tempfile.TemporaryDirectory() as location_BMRS_Final:
+            data = make_benchmark_data(scale, location_BMRS_Final, seed=seed)
+
+            for stage_name, input_names, function, output_names in BENCHMARK_STAGES:
+                inputs = [data[name] for name in input_names]
+                outputs, wall_time, peak_memory = run_stage(function, inputs, repeat=repeat)
+                data.update(zip(output_names, outputs))
+
+                results.append(
+                    {
+                        "timestamp": timestamp,
+                        "commit": commit,
+                        "python": platform.python_version(),
+                        "pandas": pd.__version__,
+                        "scale": scale_name,
+                        **scale,
+                        "seed": seed,
+                        "stage": stage_name,
+                        "rows_in": count_rows(inputs),
+                        "rows_out": count_rows(outputs),
+                        "wall_time_s": round(wall_time, 4),
+                        "peak_memory_mb": round(peak_memory, 2),
+                    }
+                )
+
+    return results
+
+
+def save_results(results: list, path: str = BENCHMARK_RESULTS):
+    """
+    Appends benchmark results to a JSON lines file.
+
+    Args:
+        results (list): result dicts from run_benchmarks.
+        path (str): JSON lines file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+
+def load_results(path: str = BENCHMARK_RESULTS) -> pd.DataFrame:
+    """
+    Reads the benchmark results of all previous runs.
+
+    Args:
+        path (str): JSON lines file.
+
+    Returns:
+        pd.DataFrame: one row per run, scale and stage.
+    """
+    if not os.path.isfile(path):
+        return pd.DataFrame()
+
+    return pd.read_json(path, lines=True, dtype={"commit": str})
+
+
+def compare_results(df_results: pd.DataFrame, baseline: str, candidate: str) -> pd.DataFrame:
+    """
+    Compares the latest results of two commits for every scale and stage they both ran.
+
+    Args:
+        df_results (pd.DataFrame): results from load_results.
+        baseline (str): commit to compare against.
+        candidate (str): commit to compare.
+
+    Returns:
+        pd.DataFrame: wall time and peak memory of both commits and their ratio (candidate / baseline) by scale
+        and stage.
+    """
+    latest = df_results.sort_values("timestamp").groupby(["commit", "scale", "stage"]).last()
+    columns = ["wall_time_s", "peak_memory_mb"]
+
+    df_comparison = latest.loc[baseline, columns].join(
+        latest.loc[candidate, columns], how="inner", lsuffix="_baseline", rsuffix="_candidate"
+    )
+    for column in columns:
+        df_comparison[f"{column}_ratio"] = (
+            df_comparison[f"{column}_candidate"] / df_comparison[f"{column}_baseline"]
+        ).round(2)
+
+    return df_comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the live generation pipeline stages on synthetic data.")
+    parser.add_argument("--scales", nargs="+", choices=list(BENCHMARK_SCALES), default=["small"])
+    parser.add_argument("--repeat", type=int, default=1, help="number of timed runs of each stage")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic data")
+    parser.add_argument("--results", default=BENCHMARK_RESULTS, help="JSON lines file to append the results to")
+    parser.add_argument("--compare", metavar="COMMIT", help="compare the results with those of another commit")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, repeat=args.repeat, seed=args.seed)
+    save_results(results, args.results)
+
+    df_results = pd.DataFrame(results).set_index(["scale", "stage"])
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(df_results[["rows_in", "rows_out", "wall_time_s", "peak_memory_mb"]])
+
+        if args.compare:
+            print(compare_results(load_results(args.results), args.compare, results[0]["commit"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,579 @@
+"""
+The input datasets of the live generation pipeline, kept up to date from the BMRS API: the B1610 (metered
+generation) data, stored as one Arrow IPC file with a record batch per settlement date, and the Physical BM Data
+(FPN, MEL and BOAL records), stored as one parquet partition per settlement date.
+"""
+
+import json
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from bmrs_fetch import fetch_BMRS_data
+from pipeline_schema import B1610_SCHEMA, PHYBMDATA_SCHEMA, apply_schema
+from pipeline_storage import list_partitions, write_json_atomically, write_parquet_atomically
+from settlement_calendar import add_settlement_period_start, get_settlement_date_labels
+
+
+# Compression of the record batches of the stored B1610 dataset, about 4.5 times smaller than uncompressed
+B1610_COMPRESSION = "zstd"
+
+
+def get_B1610_path(location_BMRS_B1610: str) -> str:
+    """
+    Returns the path of the stored B1610 dataset, a compressed Arrow IPC file with one record batch per settlement
+    date.
+
+    Args:
+        location_BMRS_B1610 (str): location of the B1610 dataset.
+
+    Returns:
+        str: path of the Arrow file.
+    """
+    return os.path.join(location_BMRS_B1610, "B1610.arrow")
+
+
+def get_B1610_metadata_path(location_BMRS_B1610: str) -> str:
+    """
+    Returns the path of the metadata sidecar of the stored B1610 dataset, see write_B1610_data.
+
+    Args:
+        location_BMRS_B1610 (str): location of the B1610 dataset.
+
+    Returns:
+        str: path of the JSON sidecar.
+    """
+    return os.path.join(location_BMRS_B1610, "B1610_metadata.json")
+
+
+def write_B1610_data(df_B1610: pd.DataFrame, location_BMRS_B1610: str) -> pd.DataFrame:
+    """
+    Writes the B1610 dataset, sorted by time, to an Arrow IPC file with one ZSTD compressed record batch per
+    settlement date, and a JSON sidecar with the latest settlement date and the number of rows of each settlement
+    date. As the settlement dates are stored in order, the record batches of a range of days can be found with the
+    sidecar alone (see read_B1610_data). The file is committed by the GitHub Actions workflow after every update,
+    and the compression keeps it smaller than the B1610.parquet file it replaces, which is deleted.
+
+    Args:
+        df_B1610 (pd.DataFrame): B1610 data with the types of B1610_SCHEMA.
+        location_BMRS_B1610 (str): location of the B1610 dataset.
+
+    Returns:
+        pd.DataFrame: the B1610 data as written, sorted by local_datetime.
+    """
+    import pyarrow
+    import pyarrow.ipc
+
+    df_B1610 = df_B1610.sort_values("local_datetime", kind="stable").reset_index(drop=True)
+    rows_per_day = df_B1610.groupby(get_settlement_date_labels(df_B1610["settlementDate"])).size()
+    metadata = {
+        "max_settlement_date": rows_per_day.index[-1] if len(rows_per_day) else None,
+        "rows": len(df_B1610),
+        "rows_per_day": {day: int(rows) for day, rows in rows_per_day.items()},
+    }
+
+    # The readers close their memory maps before returning (see read_B1610_data), so no map of the previous file is
+    # open here. The new version is still written to a temporary file that replaces it, so that a failed write
+    # doesn't leave a truncated file behind
+    path = get_B1610_path(location_BMRS_B1610)
+    table = pyarrow.Table.from_pandas(df_B1610, preserve_index=False)
+    options = pyarrow.ipc.IpcWriteOptions(compression=B1610_COMPRESSION)
+    with pyarrow.OSFile(f"{path}.tmp", "wb") as sink:
+        with pyarrow.ipc.new_file(sink, table.schema, options=options) as writer:
+            offset = 0
+            for rows in metadata["rows_per_day"].values():
+                writer.write_table(table.slice(offset, rows))
+                offset += rows
+    os.replace(f"{path}.tmp", path)
+
+    path_metadata = get_B1610_metadata_path(location_BMRS_B1610)
+    write_json_atomically(metadata, path_metadata, indent=2)
+
+    if os.path.isfile(os.path.join(location_BMRS_B1610, "B1610.parquet")):
+        os.remove(os.path.join(location_BMRS_B1610, "B1610.parquet"))
+
+    return df_B1610
+
+
+def read_B1610_metadata(location_BMRS_B1610: str) -> dict:
+    """
+    Reads the metadata sidecar of the stored B1610 dataset (see write_B1610_data), e.g. to find the latest
+    settlement date without reading the data. A B1610.parquet file from before the Arrow layout is converted
+    first, and the sidecar is rebuilt if it is missing or does not match the Arrow file.
+
+    Args:
+        location_BMRS_B1610 (str): location of the B1610 dataset.
+
+    Returns:
+        dict: the latest settlement date (YYYY-MM-DD), the number of rows and the number of rows by settlement
+        date, or None if there is no stored B1610 dataset.
+    """
+    import pyarrow
+    import pyarrow.ipc
+
+    path = get_B1610_path(location_BMRS_B1610)
+    path_parquet = os.path.join(location_BMRS_B1610, "B1610.parquet")
+    if not os.path.isfile(path):
+        if not os.path.isfile(path_parquet):
+            return None
+        write_B1610_data(apply_schema(pd.read_parquet(path_parquet), B1610_SCHEMA), location_BMRS_B1610)
+
+    path_metadata = get_B1610_metadata_path(location_BMRS_B1610)
+    if os.path.isfile(path_metadata):
+        with open(path_metadata) as f:
+            metadata = json.load(f)
+        # The number of rows of each record batch is in the file footer and message headers, so no data is read
+        with pyarrow.memory_map(path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            n_rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        if metadata["rows"] == n_rows:
+            return metadata
+
+    write_B1610_data(read_B1610_data(location_BMRS_B1610, metadata={}), location_BMRS_B1610)
+    with open(path_metadata) as f:
+        return json.load(f)
+
+
+def read_B1610_data(
+    location_BMRS_B1610: str, start_date: pd.Timestamp = None, end_date: pd.Timestamp = None, metadata: dict = None
+) -> pd.DataFrame:
+    """
+    Reads the stored B1610 dataset, or the settlement dates from start_date to end_date. The Arrow file is
+    memory-mapped and only the record batches of these settlement dates, found with the metadata sidecar, are
+    read and decompressed. This is not zero-copy: the batches are decompressed into memory and converted to pandas,
+    which copies them again, so reading a few days costs a few days' worth of memory rather than the whole file.
+
+    Args:
+        location_BMRS_B1610 (str): location of the B1610 dataset.
+        start_date (pd.Timestamp, optional): first settlement date to read. Defaults to None (from the first).
+        end_date (pd.Timestamp, optional): last settlement date to read. Defaults to None (to the last).
+        metadata (dict, optional): sidecar from read_B1610_metadata. Defaults to None (read the sidecar), an empty
+                                   dict reads the whole file.
+
+    Returns:
+        pd.DataFrame: B1610 data with the types of B1610_SCHEMA, empty if there is no stored B1610 dataset.
+    """
+    import pyarrow
+    import pyarrow.ipc
+
+    if metadata is None:
+        metadata = read_B1610_metadata(location_BMRS_B1610)
+        if metadata is None:
+            return apply_schema(pd.DataFrame(columns=list(B1610_SCHEMA)), B1610_SCHEMA)
+
+    # The rows are copied into pandas before the map is closed, so that the file can be replaced afterwards
+    with pyarrow.memory_map(get_B1610_path(location_BMRS_B1610)) as source:
+        reader = pyarrow.ipc.open_file(source)
+        if not metadata:
+            table = reader.read_all()
+        else:
+            days = pd.Series(metadata["rows_per_day"], dtype="int64")
+            selected = np.ones(len(days), dtype=bool)
+            if start_date is not None:
+                selected &= days.index >= pd.Timestamp(start_date).strftime("%Y-%m-%d")
+            if end_date is not None:
+                selected &= days.index <= pd.Timestamp(end_date).strftime("%Y-%m-%d")
+
+            if reader.num_record_batches == len(days):
+                batches = [reader.get_batch(i) for i in np.flatnonzero(selected)]
+                table = pyarrow.Table.from_batches(batches, schema=reader.schema)
+            else:
+                # Files written with a single record batch, before the batches of each settlement date
+                offsets = days.cumsum() - days
+                offset = int(offsets[selected].iloc[0]) if selected.any() else 0
+                table = reader.read_all().slice(offset, int(days[selected].sum()))
+        df_B1610 = table.to_pandas()
+
+    return apply_schema(df_B1610, B1610_SCHEMA)
+
+
+def format_B1610_data(df_B1610: pd.DataFrame) -> pd.DataFrame:
+    """
+    Selects the relevant columns of the B1610 data as returned by the API and casts them to the types of
+    B1610_SCHEMA. The start of each settlement period (local_datetime) is looked up in the settlement calendar
+    (see add_settlement_period_start) rather than parsed.
+
+    Args:
+        df_B1610 (pd.DataFrame): B1610 data as returned by the API.
+
+    Returns:
+        pd.DataFrame: formatted B1610 data.
+    """
+    df_B1610 = df_B1610.rename(columns={"bMUnitID": "bmUnitID"}).reindex(columns=list(B1610_SCHEMA))
+    if not df_B1610.empty:
+        df_B1610 = add_settlement_period_start(df_B1610)
+
+    return apply_schema(df_B1610.reset_index(drop=True), B1610_SCHEMA)
+
+
+def setup_update_B1610_data(
+    location_BMRS_B1610: str, num_days: int = 14, hist_days: int = 45, cache_location: str = None
+) -> pd.DataFrame:
+    """
+    Checks if the B1610 dataset exists or has been updated in the last n days (determined by "num_days").
+    If not, it creates a new version of the dataset, using the "num_days" variable as the time limit for which
+    to generate it.
+    If it exists and has been updated recently, it finds the latest available date stored in the
+    B1610 metadata sidecar and updates only the missing recent data. The stored dataset is only rewritten if
+    days were added or dropped.
+
+    Args:
+        location_BMRS_B1610 (str): location of the B1610 dataset (see write_B1610_data)
+        num_days(int): max number of days for which to store the B1610 data. If the latest day in the B1610 dataset
+                        is less recent than this timedelta, the function will simply request a new dataset.
+        hist_days(int): maximum number of history days to keep.
+        cache_location (str, optional): folder of the BMRS response cache, None to not use the cache.
+
+    Returns:
+        pd.DataFrame: dataframe with the updated B1610 (historical generation by BMU) data.
+    """
+
+    B1610_start_date = pd.to_datetime(
+        date.today() - timedelta(days=num_days), utc=True
+    )  # Default to 14 days ago to speed up API query
+    B1610_end_date = pd.to_datetime(
+        date.today() - timedelta(days=6), utc=True
+    )  # The most recent B1610 data is ca. 6 days old
+
+    metadata = read_B1610_metadata(location_BMRS_B1610)
+    if (
+        metadata is None
+        or not metadata["rows"]
+        or pd.to_datetime(metadata["max_settlement_date"], utc=True) < B1610_start_date
+    ):
+        df_B1610 = format_B1610_data(
+            fetch_BMRS_data("B1610", B1610_start_date, B1610_end_date, cache_location=cache_location)
+        )
+
+        return write_B1610_data(df_B1610, location_BMRS_B1610)
+
+    B1610_max_date = pd.to_datetime(metadata["max_settlement_date"], utc=True)
+    B1610_update_start_date = pd.to_datetime(B1610_max_date + timedelta(days=1), utc=True)
+    B1610_cutoff_date = pd.to_datetime(date.today() - timedelta(days=hist_days), utc=True)
+
+    # Only the days after the cut-off date are read from the stored dataset
+    df_B1610 = read_B1610_data(location_BMRS_B1610, start_date=B1610_cutoff_date + timedelta(days=1), metadata=metadata)
+    days_dropped = len(df_B1610) < metadata["rows"]
+
+    df_B1610_append = fetch_BMRS_data("B1610", B1610_update_start_date, B1610_end_date, cache_location=cache_location)
+    if df_B1610_append.empty and not days_dropped:
+        return df_B1610
+
+    df_B1610 = pd.concat((df_B1610, format_B1610_data(df_B1610_append)), axis=0)
+
+    return write_B1610_data(apply_schema(df_B1610.reset_index(drop=True), B1610_SCHEMA), location_BMRS_B1610)
+
+
+def backfill_B1610_data(
+    location_BMRS_B1610: str, start_date: pd.Timestamp, end_date: pd.Timestamp, cache_location: str = None
+) -> pd.DataFrame:
+    """
+    Requests the B1610 data for a date range and merges it into the stored B1610 dataset, e.g. to fill a gap after
+    the pipeline hasn't run for a while. Settlement periods that are already stored are replaced by the new data.
+    NB, setup_update_B1610_data only keeps the last "hist_days" days of data.
+
+    Args:
+        location_BMRS_B1610 (str): location of the B1610 dataset (see write_B1610_data).
+        start_date (pd.Timestamp): start of the date range.
+        end_date (pd.Timestamp): end of the date range.
+        cache_location (str, optional): folder of the BMRS response cache, None to not use the cache.
+
+    Returns:
+        pd.DataFrame: dataframe with the updated B1610 (historical generation by BMU) data.
+    """
+    df_B1610_backfill = fetch_BMRS_data("B1610", start_date, end_date, cache_location=cache_location)
+
+    frames = [read_B1610_data(location_BMRS_B1610), format_B1610_data(df_B1610_backfill)]
+
+    df_B1610 = (
+        pd.concat(frames, axis=0, ignore_index=True)
+        .drop_duplicates(subset=["settlementDate", "settlementPeriod", "bmUnitID"], keep="last")
+        .sort_values("local_datetime", kind="stable")
+    )
+
+    return write_B1610_data(apply_schema(df_B1610.reset_index(drop=True), B1610_SCHEMA), location_BMRS_B1610)
+
+
+PHYBMDATA_COLUMNS = [
+    "local_datetime",
+    "recordType",
+    "bmUnitID",
+    "settlementDate",
+    "settlementPeriod",
+    "timeFrom",
+    "pnLevelFrom",
+    "timeTo",
+    "pnLevelTo",
+    "melLevelFrom",
+    "melLevelTo",
+    "bidOfferAcceptanceNumber",
+    "acceptanceTime",
+    "bidOfferLevelFrom",
+    "bidOfferLevelTo",
+]
+
+# The Physical BM Data is tracked for changes by BMU and settlement period (see fingerprint_physical_data)
+PHYBMDATA_CELL_COLUMNS = ["bmUnitID", "settlementDate", "settlementPeriod"]
+
+# A record in the Physical BM Data is identified by these columns. Newer versions of a record replace older ones.
+PHYBMDATA_KEY_COLUMNS = [
+    "recordType",
+    "bmUnitID",
+    "settlementDate",
+    "settlementPeriod",
+    "timeFrom",
+    "bidOfferAcceptanceNumber",
+]
+
+
+def format_PHYBM_data(df_PHYBMDATA: pd.DataFrame) -> pd.DataFrame:
+    """
+    Selects the FPN, MEL and BOAL records and the relevant columns of the Physical BM Data and casts them
+    to the types of PHYBMDATA_SCHEMA. The start of each settlement period (local_datetime) is looked up in the
+    settlement calendar (see add_settlement_period_start) rather than parsed.
+
+    Args:
+        df_PHYBMDATA (pd.DataFrame): Physical BM Data as returned by the API or read from file.
+
+    Returns:
+        pd.DataFrame: formatted Physical BM Data.
+    """
+    df_PHYBMDATA = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"].isin(["PN", "MEL", "BOALF"]), PHYBMDATA_COLUMNS].copy()
+    if not df_PHYBMDATA.empty:
+        df_PHYBMDATA = add_settlement_period_start(df_PHYBMDATA)
+
+    df_PHYBMDATA = apply_schema(df_PHYBMDATA.reset_index(drop=True), PHYBMDATA_SCHEMA)
+
+    return df_PHYBMDATA
+
+
+def get_PHYBM_partition_path(location_BMRS_PHYBMDATA: str, settlement_date: str) -> str:
+    """
+    Returns the path of the PHYBMDATA partition holding the data for one settlement date.
+
+    Args:
+        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA partitions.
+        settlement_date (str): settlement date in the format YYYY-MM-DD.
+
+    Returns:
+        str: path of the partition file.
+    """
+    return os.path.join(location_BMRS_PHYBMDATA, f"PHYBMDATA_{settlement_date}.parquet")
+
+
+def list_PHYBM_partitions(location_BMRS_PHYBMDATA: str) -> dict:
+    """
+    Lists the PHYBMDATA partitions stored in the given folder.
+
+    Args:
+        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA partitions.
+
+    Returns:
+        dict: partition paths keyed by settlement date (YYYY-MM-DD), in date order.
+    """
+    return list_partitions(location_BMRS_PHYBMDATA, "PHYBMDATA")
+
+
+def read_PHYBM_partitions(
+    location_BMRS_PHYBMDATA: str,
+    columns: list = None,
+    start_date: pd.Timestamp = None,
+    end_date: pd.Timestamp = None,
+) -> pd.DataFrame:
+    """
+    Reads all PHYBMDATA partitions, or those of the settlement dates from start_date to end_date, into one
+    dataframe.
+
+    Args:
+        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA partitions.
+        columns (list, optional): columns to read. Defaults to all columns.
+        start_date (pd.Timestamp, optional): first settlement date to read. Defaults to None (from the first).
+        end_date (pd.Timestamp, optional): last settlement date to read. Defaults to None (to the last).
+
+    Returns:
+        pd.DataFrame: Physical BM Data of the partitions, in settlement date order.
+    """
+    partitions = list_PHYBM_partitions(location_BMRS_PHYBMDATA)
+    if start_date is not None:
+        first_date = pd.Timestamp(start_date).strftime("%Y-%m-%d")
+        partitions = {date: path for date, path in partitions.items() if date >= first_date}
+    if end_date is not None:
+        last_date = pd.Timestamp(end_date).strftime("%Y-%m-%d")
+        partitions = {date: path for date, path in partitions.items() if date <= last_date}
+    if not partitions:
+        return format_PHYBM_data(pd.DataFrame(columns=PHYBMDATA_COLUMNS))[columns or PHYBMDATA_COLUMNS]
+
+    df_PHYBMDATA = pd.concat(
+        [pd.read_parquet(path, columns=columns) for path in partitions.values()], ignore_index=True
+    )
+
+    return apply_schema(df_PHYBMDATA, PHYBMDATA_SCHEMA)
+
+
+def refresh_PHYBM_partitions(
+    df_PHYBMDATA: pd.DataFrame, location_BMRS_PHYBMDATA: str, updated_partitions: list
+) -> pd.DataFrame:
+    """
+    Brings a dataset previously read with read_PHYBM_partitions up to date with the stored partitions: the updated
+    partitions are read back in, the others are taken from the dataset, and dates without a partition are dropped.
+
+    Args:
+        df_PHYBMDATA (pd.DataFrame): Physical BM Data previously read from the partitions.
+        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA partitions.
+        updated_partitions (list): settlement dates (YYYY-MM-DD) of the partitions written since it was read.
+
+    Returns:
+        pd.DataFrame: the same as read_PHYBM_partitions.
+    """
+    partitions = list_PHYBM_partitions(location_BMRS_PHYBMDATA)
+    if not partitions:
+        return read_PHYBM_partitions(location_BMRS_PHYBMDATA)
+
+    df_by_date = dict(tuple(df_PHYBMDATA.groupby(get_settlement_date_labels(df_PHYBMDATA["settlementDate"]))))
+    frames = [
+        df_by_date[settlement_date]
+        if settlement_date in df_by_date and settlement_date not in updated_partitions
+        else pd.read_parquet(path)
+        for settlement_date, path in partitions.items()
+    ]
+
+    return apply_schema(pd.concat(frames, ignore_index=True), PHYBMDATA_SCHEMA)
+
+
+def upsert_PHYBM_partitions(df_PHYBMDATA: pd.DataFrame, location_BMRS_PHYBMDATA: str) -> list:
+    """
+    Adds new Physical BM Data to the partitions of the settlement dates it covers. Records that already exist
+    (identified by PHYBMDATA_KEY_COLUMNS) are replaced by the new version. Partitions that are not covered by the
+    new data, or that the new data does not change, are not rewritten.
+
+    Args:
+        df_PHYBMDATA (pd.DataFrame): formatted Physical BM Data (see format_PHYBM_data).
+        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA partitions.
+
+    Returns:
+        list: settlement dates (YYYY-MM-DD) of the partitions that were written.
+    """
+    updated_partitions = []
+    for settlement_date, df_new in df_PHYBMDATA.groupby(get_settlement_date_labels(df_PHYBMDATA["settlementDate"])):
+        path = get_PHYBM_partition_path(location_BMRS_PHYBMDATA, settlement_date)
+
+        if os.path.isfile(path):
+            df_existing = pd.read_parquet(path)
+            df_partition = pd.concat((df_existing, df_new), axis=0, ignore_index=True)
+            df_partition = df_partition.drop_duplicates(subset=PHYBMDATA_KEY_COLUMNS, keep="last")
+            df_partition = apply_schema(df_partition.reset_index(drop=True), PHYBMDATA_SCHEMA)
+            if df_partition.equals(df_existing):
+                continue
+        else:
+            df_partition = df_new.drop_duplicates(subset=PHYBMDATA_KEY_COLUMNS, keep="last")
+            df_partition = apply_schema(df_partition.reset_index(drop=True), PHYBMDATA_SCHEMA)
+
+        write_parquet_atomically(df_partition, path)
+        updated_partitions.append(settlement_date)
+
+    return updated_partitions
+
+
+def drop_PHYBM_partitions(location_BMRS_PHYBMDATA: str, before_date: pd.Timestamp = None) -> list:
+    """
+    Deletes the PHYBMDATA partitions of settlement dates before the given date, e.g. because they are now
+    covered by the B1610 data. If no date is given, all partitions are deleted.
+
+    Args:
+        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA partitions.
+        before_date (pd.Timestamp, optional): first settlement date to keep. Defaults to None.
+
+    Returns:
+        list: settlement dates (YYYY-MM-DD) of the partitions that were deleted.
+    """
+    dropped_partitions = []
+    for settlement_date, path in list_PHYBM_partitions(location_BMRS_PHYBMDATA).items():
+        if before_date is None or pd.Timestamp(settlement_date) < pd.Timestamp(before_date).replace(tzinfo=None):
+            os.remove(path)
+            dropped_partitions.append(settlement_date)
+
+    return dropped_partitions
+
+
+def setup_update_PHYBM_data(
+    BM_start_date: pd.Timestamp,
+    location_BMRS_PHYBMDATA: str,
+    cache_location: str = None,
+    df_PHYBMDATA: pd.DataFrame = None,
+) -> pd.DataFrame:
+    """
+    Checks if the PHYBMDATA dataset exists. If not, it creates a new version of the dataset, using the
+    last date on the df_B1610 dataset as the start date and the latest date as the end date.
+    If it exists, it finds the latest available date stored in the df_B1610 dataframe, deletes any data now
+    duplicated by the B1610 and fetches the lates PHYBMDATA.
+
+    Once the B1610 data is updated, some balancing mechanism data will be redundant and can be removed.
+    New data can be added.
+
+    The dataset is stored as one parquet file per settlement date, so that only the partitions that receive new
+    data are rewritten and partitions superseded by the B1610 data are simply deleted. A dataset in the previous
+    single file format (PHYBMDATA.parquet) is converted to partitions.
+
+    If the dataset returned by the previous call is given (e.g. kept in memory by pipeline_daemon.py), only the
+    partitions that were written are read back in.
+
+    Args:
+        BM_start_date (pd.Timestamp): Latest date in the B1610 dataframe plus one day.
+                                        NB, the B1610 data always gets updated for entire days.
+        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA partitions.
+        cache_location (str, optional): folder of the BMRS response cache, None to not use the cache.
+        df_PHYBMDATA (pd.DataFrame, optional): the dataset returned by the previous call. Defaults to None.
+
+    Returns:
+        pd.DataFrame: dataframe with the updated Physical BM Data.
+    """
+    import pytz
+
+    BM_end_date = pd.to_datetime(datetime.now(pytz.timezone("Europe/London")) + timedelta(minutes=90)).replace(
+        tzinfo=None
+    )
+
+    if os.path.isfile(os.path.join(location_BMRS_PHYBMDATA, "PHYBMDATA.parquet")):
+        upsert_PHYBM_partitions(
+            format_PHYBM_data(pd.read_parquet(os.path.join(location_BMRS_PHYBMDATA, "PHYBMDATA.parquet"))),
+            location_BMRS_PHYBMDATA,
+        )
+        os.remove(os.path.join(location_BMRS_PHYBMDATA, "PHYBMDATA.parquet"))
+        df_PHYBMDATA = None
+
+    # Data now covered by the B1610 data is no longer needed
+    drop_PHYBM_partitions(location_BMRS_PHYBMDATA, before_date=BM_start_date)
+    partitions = list_PHYBM_partitions(location_BMRS_PHYBMDATA)
+
+    if not partitions:
+        df_PHYBMDATA_latest = fetch_BMRS_data("PHYBMDATA", BM_start_date, BM_end_date, cache_location=cache_location)
+
+    else:
+        df_PHYBMDATA_start_date = (
+            pd.read_parquet(list(partitions.values())[-1], columns=["local_datetime"])["local_datetime"].max()
+            - timedelta(minutes=90)
+        ).replace(
+            tzinfo=None
+        )  # NB, the FPN, BOAL and MEL could change/is not posted all at once. Hence, we want to also look at historic data.
+
+        if df_PHYBMDATA_start_date < BM_start_date:
+            # If the Physical BM Data hasn't been updated in a while, request a new dataset.
+            drop_PHYBM_partitions(location_BMRS_PHYBMDATA)
+            df_PHYBMDATA = None
+            df_PHYBMDATA_latest = fetch_BMRS_data(
+                "PHYBMDATA", BM_start_date, BM_end_date, cache_location=cache_location
+            )
+        else:
+            # Otherwise, only request the most recent data
+            df_PHYBMDATA_latest = fetch_BMRS_data(
+                "PHYBMDATA", df_PHYBMDATA_start_date, BM_end_date, cache_location=cache_location
+            )
+
+    updated_partitions = upsert_PHYBM_partitions(format_PHYBM_data(df_PHYBMDATA_latest), location_BMRS_PHYBMDATA)
+
+    if df_PHYBMDATA is None:
+        return read_PHYBM_partitions(location_BMRS_PHYBMDATA)
+
+    return refresh_PHYBM_partitions(df_PHYBMDATA, location_BMRS_PHYBMDATA, updated_partitions)
@@ -0,0 +1,336 @@
+"""
+Queries the BMRS API through the ElexonDataPortal client. Date ranges are fetched in parallel chunks within a rate
+limit, and the responses can be cached on disk by settlement period, so that reruns and backfills only request the
+settlement periods that may have changed.
+
+The client is only created when the API is first queried (see get_client), so that the rest of the pipeline can be
+imported without the ElexonDataPortal package or the BMRS_API_KEY environment variable.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pandas as pd
+
+
+# The ElexonDataPortal client is only created when the BMRS API is first queried (see get_client), so that the
+# functions working on local data can be imported without the ElexonDataPortal package or an API key
+client = None
+client_lock = threading.Lock()
+
+# Settings for fetching BMRS data in parallel chunks (see fetch_BMRS_data)
+BMRS_FETCH_CHUNK_SIZE = timedelta(days=1)
+BMRS_FETCH_WORKERS = 4
+BMRS_FETCH_ATTEMPTS = 3
+BMRS_FETCH_BACKOFF_SECONDS = 5
+BMRS_FETCH_MAX_REQUESTS_PER_SECOND = 8
+
+# Settings for the on-disk cache of BMRS responses (see fetch_cached_settlement_periods). A cached settlement period
+# expires after the TTL of its report (None: never), unless it was fetched long enough after the end of the settlement
+# period for the data to be final.
+BMRS_CACHE_TTL = {"B1610": None, "PHYBMDATA": timedelta(minutes=25)}
+BMRS_CACHE_SETTLED_AFTER = timedelta(hours=3)
+# B1610 data is published by the settlement runs some days after each settlement date, so until a settlement period is
+# older than the settlement run lag of its report, an empty response (not published yet) or a partial response (fewer
+# rows than BMRS_CACHE_MIN_ROW_FRACTION of the largest response of the same request) is not cached
+BMRS_CACHE_SETTLEMENT_LAG = {"B1610": timedelta(days=10)}
+BMRS_CACHE_MIN_ROW_FRACTION = 0.5
+BMRS_CACHE_MAX_BYTES = 500 * 1024**2
+
+
+def get_client():
+    """
+    Returns the ElexonDataPortal client, creating it on first use with the API key in the BMRS_API_KEY environment
+    variable (scripting key on the elexonportal.co.uk website; requires setting up user account).
+
+    Returns:
+        api.Client: the ElexonDataPortal client.
+    """
+    global client
+
+    with client_lock:
+        if client is None:
+            from ElexonDataPortal import api
+
+            if not os.environ.get("BMRS_API_KEY"):
+                raise KeyError("The BMRS_API_KEY environment variable is required to query the BMRS API")
+            client = api.Client(os.environ["BMRS_API_KEY"])
+
+    return client
+
+
+def split_date_range(start_date: pd.Timestamp, end_date: pd.Timestamp, chunk_size: timedelta) -> list:
+    """
+    Splits a date range into consecutive chunks, with boundaries at multiples of chunk_size from midnight
+    (e.g. at every midnight for a chunk size of one day). Chunks shorter than a settlement period are merged
+    into their neighbour.
+
+    Args:
+        start_date (pd.Timestamp): start of the date range.
+        end_date (pd.Timestamp): end of the date range.
+        chunk_size (timedelta): length of each chunk.
+
+    Returns:
+        list: (start, end) tuples of the chunks, in date order.
+    """
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+
+    boundaries = pd.date_range(start_date.normalize(), end_date, freq=chunk_size)
+    boundaries = [
+        boundary
+        for boundary in boundaries
+        if start_date + timedelta(minutes=30) <= boundary <= end_date - timedelta(minutes=30)
+    ]
+    boundaries = [start_date] + boundaries + [end_date]
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def fetch_BMRS_data(
+    report: str,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    chunk_size: timedelta = BMRS_FETCH_CHUNK_SIZE,
+    max_workers: int = BMRS_FETCH_WORKERS,
+    n_attempts: int = BMRS_FETCH_ATTEMPTS,
+    backoff_seconds: float = BMRS_FETCH_BACKOFF_SECONDS,
+    max_requests_per_second: float = BMRS_FETCH_MAX_REQUESTS_PER_SECOND,
+    fetch_client=None,
+    cache_location: str = None,
+) -> pd.DataFrame:
+    """
+    Requests a BMRS report (e.g. "B1610" or "PHYBMDATA") for a date range. The ElexonDataPortal client walks
+    through the range one settlement period at a time, so the range is split into chunks (see split_date_range)
+    which are requested in parallel by a pool of threads. Failed chunks are retried with an exponential backoff,
+    the rate at which chunks are started is limited, and the results are put back together in date order,
+    so the output doesn't depend on the order in which the chunks finish.
+
+    If a cache location is given, each chunk is requested one settlement period at a time and the responses
+    are cached on disk (see fetch_cached_settlement_periods).
+
+    Args:
+        report (str): name of the report, used to call the client's get_<report> method.
+        start_date (pd.Timestamp): start of the date range.
+        end_date (pd.Timestamp): end of the date range.
+        chunk_size (timedelta, optional): length of each chunk. Defaults to BMRS_FETCH_CHUNK_SIZE.
+        max_workers (int, optional): number of chunks requested at the same time. Defaults to BMRS_FETCH_WORKERS.
+        n_attempts (int, optional): number of attempts for each chunk. Defaults to BMRS_FETCH_ATTEMPTS.
+        backoff_seconds (float, optional): wait before the first retry, doubled for every further retry.
+                                            Defaults to BMRS_FETCH_BACKOFF_SECONDS.
+        max_requests_per_second (float, optional): maximum number of requests (chunks, or settlement periods when
+                                                    caching) started per second, None for no limit.
+                                                    Defaults to BMRS_FETCH_MAX_REQUESTS_PER_SECOND.
+        fetch_client (optional): client with a get_<report>(start_date, end_date) method. Defaults to the
+                                    ElexonDataPortal client.
+        cache_location (str, optional): folder of the response cache, None to not use the cache. Defaults to None.
+
+    Returns:
+        pd.DataFrame: the report data for the whole date range.
+    """
+    fetch = getattr(fetch_client if fetch_client is not None else get_client(), f"get_{report}")
+    chunks = split_date_range(start_date, end_date, chunk_size)
+
+    rate_limit_lock = threading.Lock()
+    next_request_time = [time.monotonic()]
+
+    def wait_for_rate_limit():
+        if not max_requests_per_second:
+            return
+        with rate_limit_lock:
+            request_time = max(next_request_time[0], time.monotonic())
+            next_request_time[0] = request_time + 1 / max_requests_per_second
+        time.sleep(max(request_time - time.monotonic(), 0))
+
+    def fetch_with_retry(request_start: pd.Timestamp, request_end: pd.Timestamp) -> pd.DataFrame:
+        for attempt in range(n_attempts):
+            wait_for_rate_limit()
+            try:
+                return fetch(request_start, request_end)
+            except Exception:
+                if attempt == n_attempts - 1:
+                    raise
+                time.sleep(backoff_seconds * 2**attempt)
+
+    def fetch_chunk(chunk: tuple) -> pd.DataFrame:
+        if cache_location is None:
+            return fetch_with_retry(*chunk)
+        return fetch_cached_settlement_periods(report, *chunk, fetch_with_retry, cache_location)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dfs = list(executor.map(fetch_chunk, chunks))
+
+    if cache_location is not None:
+        evict_BMRS_cache(cache_location)
+
+    return pd.concat(dfs, axis=0, ignore_index=True)
+
+
+def get_BMRS_cache_path(cache_location: str, report: str, settlement_date: str, settlement_period: int) -> str:
+    """
+    Returns the path of the cached response for one settlement period of a report.
+
+    Args:
+        cache_location (str): folder of the response cache.
+        report (str): name of the report, e.g. "B1610".
+        settlement_date (str): settlement date in the format YYYY-MM-DD.
+        settlement_period (int): settlement period.
+
+    Returns:
+        str: path of the cache file.
+    """
+    return os.path.join(cache_location, report, f"{report}_{settlement_date}_{int(settlement_period):02d}.parquet")
+
+
+def is_complete_BMRS_response(
+    report: str, df: pd.DataFrame, settlement_period_end: pd.Timestamp, max_rows: int = 0
+) -> bool:
+    """
+    Checks if the response for a settlement period can be cached, i.e. it is neither empty nor partial, or the
+    settlement period is older than the settlement run lag of the report (see BMRS_CACHE_SETTLEMENT_LAG).
+
+    Args:
+        report (str): name of the report, e.g. "B1610".
+        df (pd.DataFrame): response for the settlement period.
+        settlement_period_end (pd.Timestamp): end of the settlement period (UTC).
+        max_rows (int, optional): number of rows of the largest response of the same request. Defaults to 0.
+
+    Returns:
+        bool: True if the response is complete.
+    """
+    lag = BMRS_CACHE_SETTLEMENT_LAG.get(report)
+    if lag is None or pd.Timestamp.now(tz="UTC") - settlement_period_end > lag:
+        return True
+
+    return len(df) > 0 and len(df) >= BMRS_CACHE_MIN_ROW_FRACTION * max_rows
+
+
+def read_BMRS_cache(path: str, report: str, settlement_period_end: pd.Timestamp) -> pd.DataFrame:
+    """
+    Reads a cached response if it exists and has not expired (see BMRS_CACHE_TTL and BMRS_CACHE_SETTLED_AFTER).
+    Cache files that can't be read (e.g. after a crash from before the writes were atomic) and empty responses
+    that are not complete (see is_complete_BMRS_response) are treated as missing.
+
+    Args:
+        path (str): path of the cache file.
+        report (str): name of the report, e.g. "B1610".
+        settlement_period_end (pd.Timestamp): end of the settlement period (UTC) the response is for.
+
+    Returns:
+        pd.DataFrame: the cached response, or None if there is no valid cached response.
+    """
+    if not os.path.isfile(path):
+        return None
+
+    ttl = BMRS_CACHE_TTL.get(report)
+    fetched_at = pd.Timestamp(os.path.getmtime(path), unit="s", tz="UTC")
+    expired = ttl is not None and pd.Timestamp.now(tz="UTC") - fetched_at > ttl
+    settled = fetched_at - settlement_period_end > BMRS_CACHE_SETTLED_AFTER
+    if expired and not settled:
+        return None
+
+    try:
+        df = pd.read_parquet(path)
+    except (OSError, ValueError):
+        return None
+    if df.empty and not is_complete_BMRS_response(report, df, settlement_period_end):
+        return None
+
+    return df
+
+
+def write_BMRS_cache(df: pd.DataFrame, path: str):
+    """
+    Writes a response to the cache. The file is written to a temporary file that replaces it, so that a run that
+    is stopped while writing doesn't leave a truncated cache file behind.
+
+    Args:
+        df (pd.DataFrame): response for one settlement period.
+        path (str): path of the cache file, see get_BMRS_cache_path.
+    """
+    df.to_parquet(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def fetch_cached_settlement_periods(
+    report: str, start_date: pd.Timestamp, end_date: pd.Timestamp, fetch, cache_location: str
+) -> pd.DataFrame:
+    """
+    Requests a report one settlement period at a time, for the same settlement periods as the ElexonDataPortal
+    client would request for the date range. Each response is stored in the cache, keyed by report, settlement
+    date and settlement period, and requests for settlement periods with a valid cached response are skipped.
+    Responses that are not complete yet (see is_complete_BMRS_response) are not cached, so that they are requested
+    again by the next run.
+
+    Args:
+        report (str): name of the report, e.g. "B1610".
+        start_date (pd.Timestamp): start of the date range.
+        end_date (pd.Timestamp): end of the date range.
+        fetch (Callable): function requesting the report for a (start, end) date range.
+        cache_location (str): folder of the response cache.
+
+    Returns:
+        pd.DataFrame: the report data for the date range.
+    """
+    from ElexonDataPortal.dev import utils as edp_utils
+
+    os.makedirs(os.path.join(cache_location, report), exist_ok=True)
+
+    df_dates_SPs = edp_utils.dt_rng_to_SPs(start_date, end_date)
+
+    dfs, fetched = [], []
+    for period_start, settlement_date, settlement_period in list(
+        df_dates_SPs.reset_index().itertuples(index=False, name=None)
+    )[:-1]:
+        path = get_BMRS_cache_path(cache_location, report, settlement_date, settlement_period)
+        period_end = period_start + timedelta(minutes=30)
+        df = read_BMRS_cache(path, report, period_end)
+
+        if df is None:
+            df = fetch(period_start, period_end)
+            fetched.append((len(dfs), path, period_end))
+        dfs.append(df)
+
+    if not dfs:
+        return pd.DataFrame()
+
+    max_rows = max(len(df) for df in dfs)
+    for i, path, period_end in fetched:
+        if is_complete_BMRS_response(report, dfs[i], period_end, max_rows):
+            write_BMRS_cache(dfs[i], path)
+
+    return pd.concat(dfs, axis=0, ignore_index=True)
+
+
+def evict_BMRS_cache(cache_location: str, max_bytes: int = BMRS_CACHE_MAX_BYTES) -> list:
+    """
+    Deletes the oldest cached responses until the cache is no larger than max_bytes.
+
+    Args:
+        cache_location (str): folder of the response cache.
+        max_bytes (int, optional): maximum size of the cache. Defaults to BMRS_CACHE_MAX_BYTES.
+
+    Returns:
+        list: paths of the deleted files.
+    """
+    cache_files = [
+        os.path.join(folder, file_name)
+        for folder, _, file_names in os.walk(cache_location)
+        for file_name in file_names
+        if file_name.endswith(".parquet")
+    ]
+    cache_files = sorted(cache_files, key=os.path.getmtime)
+
+    cache_size = sum(os.path.getsize(path) for path in cache_files)
+    evicted_files = []
+    for path in cache_files:
+        if cache_size <= max_bytes:
+            break
+        cache_size -= os.path.getsize(path)
+        os.remove(path)
+        evicted_files.append(path)
+
+    return evicted_files
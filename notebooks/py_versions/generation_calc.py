@@ -0,0 +1,1241 @@
+"""
+Calculates the generation of each BMU per settlement period from its Physical BM Data. The FPN and MEL levels and
+the accepted bid-offer levels are resolved minute by minute ("minutely" mode) or integrated segment by segment
+("analytic" mode), and the BMUs can be split over worker processes or into batches that fit a memory budget.
+
+The Physical BM Data is fingerprinted by BMU and settlement period, so that only the settlement periods whose
+records have changed since the last run are recalculated.
+"""
+
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from bmrs_data import PHYBMDATA_CELL_COLUMNS, PHYBMDATA_COLUMNS
+from generation_outputs import get_generation_location, read_generation_data
+from pipeline_schema import B1610_SCHEMA, GENERATION_SCHEMA, apply_schema
+from pipeline_storage import list_partitions, read_arrow_BMUs, write_arrow_file, write_parquet_atomically
+
+
+NANOSECONDS_PER_MINUTE = 60 * 10**9
+
+
+def get_fingerprint_path(location_BMRS_Final: str) -> str:
+    """
+    Returns the path of the fingerprints of the Physical BM Data the output dataset was calculated from.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        str: path of the fingerprint file.
+    """
+    return os.path.join(location_BMRS_Final, "PHYBMDATA_fingerprints.parquet")
+
+
+def fingerprint_physical_data(df_PHYBMDATA: pd.DataFrame) -> pd.DataFrame:
+    """
+    Summarises the Physical BM Data of every BMU and settlement period (a "cell") by a fingerprint of its records
+    and the time span they cover. The fingerprint is the sum of a hash of each record, so it doesn't depend on
+    the order of the records and changes if any record of the cell is added, removed or revised.
+
+    Args:
+        df_PHYBMDATA (pd.DataFrame): formatted Physical BM Data (see format_PHYBM_data).
+
+    Returns:
+        pd.DataFrame: fingerprint, first timeFrom and last timeTo by bmUnitID, settlementDate and settlementPeriod.
+    """
+    df_PHYBMDATA = df_PHYBMDATA.reset_index(drop=True)
+    df_records = df_PHYBMDATA[PHYBMDATA_CELL_COLUMNS + ["timeFrom", "timeTo"]].assign(
+        fingerprint=pd.util.hash_pandas_object(df_PHYBMDATA[PHYBMDATA_COLUMNS], index=False).to_numpy()
+    )
+
+    return (
+        df_records.groupby(PHYBMDATA_CELL_COLUMNS, observed=True)
+        .agg(fingerprint=("fingerprint", "sum"), timeFrom=("timeFrom", "min"), timeTo=("timeTo", "max"))
+        .reset_index()
+    )
+
+
+def read_physical_data_fingerprints(location_BMRS_Final: str, mode: str = "minutely") -> pd.DataFrame:
+    """
+    Reads the fingerprints of the Physical BM Data the output dataset was calculated from (see
+    write_physical_data_fingerprints). No fingerprints are returned if the output dataset doesn't exist or was
+    calculated in another mode, so that everything is recalculated.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        mode (str): "minutely" or "analytic", see calculate_settlement_period_generation.
+
+    Returns:
+        pd.DataFrame: fingerprints from fingerprint_physical_data, empty if there are none.
+    """
+    path = get_fingerprint_path(location_BMRS_Final)
+    if os.path.isfile(path) and list_partitions(get_generation_location(location_BMRS_Final), "Generation_Combined"):
+        df_fingerprints = pd.read_parquet(path)
+        if (df_fingerprints["mode"] == mode).all():
+            return df_fingerprints.drop(columns="mode")
+
+    return pd.DataFrame(columns=PHYBMDATA_CELL_COLUMNS + ["fingerprint", "timeFrom", "timeTo"])
+
+
+def write_physical_data_fingerprints(df_fingerprints: pd.DataFrame, location_BMRS_Final: str, mode: str = "minutely"):
+    """
+    Stores the fingerprints of the Physical BM Data alongside the output dataset calculated from it. NB, this
+    should be called after the output dataset has been written.
+
+    Args:
+        df_fingerprints (pd.DataFrame): fingerprints from fingerprint_physical_data.
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        mode (str): "minutely" or "analytic", the mode the output dataset was calculated in.
+    """
+    write_parquet_atomically(df_fingerprints.assign(mode=mode), get_fingerprint_path(location_BMRS_Final))
+
+
+def find_dirty_settlement_periods(
+    df_fingerprints: pd.DataFrame, df_previous_fingerprints: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Finds the cells (BMU and settlement period) whose Physical BM Data has changed since the output dataset was
+    calculated: new cells, cells with added, removed or revised records and cells that no longer exist.
+
+    Args:
+        df_fingerprints (pd.DataFrame): fingerprints of the current Physical BM Data.
+        df_previous_fingerprints (pd.DataFrame): fingerprints read with read_physical_data_fingerprints.
+
+    Returns:
+        pd.DataFrame: bmUnitID, settlementDate and settlementPeriod of the dirty cells, with the time span covered
+        by their current and previous records (timeFrom, timeTo).
+    """
+    columns = PHYBMDATA_CELL_COLUMNS + ["timeFrom", "timeTo"]
+    if df_previous_fingerprints.empty:
+        return df_fingerprints[columns].reset_index(drop=True)
+
+    # A cell is clean if it has the same fingerprint in both versions
+    df_both = pd.concat((df_fingerprints, df_previous_fingerprints), axis=0, ignore_index=True)
+    df_both["bmUnitID"] = df_both["bmUnitID"].astype(str)
+    n_versions = df_both.groupby(PHYBMDATA_CELL_COLUMNS + ["fingerprint"])["timeFrom"].transform("size")
+
+    return (
+        df_both.loc[n_versions < 2]
+        .groupby(PHYBMDATA_CELL_COLUMNS, as_index=False)
+        .agg(timeFrom=("timeFrom", "min"), timeTo=("timeTo", "max"))[columns]
+    )
+
+
+def overlaps_dirty_settlement_periods(
+    bmu_ids, time_from, time_to, df_dirty: pd.DataFrame, margin: timedelta = timedelta(0)
+) -> np.ndarray:
+    """
+    Checks which time intervals of BMUs (e.g. records or settlement periods) overlap or touch the time span of a
+    dirty cell of the same BMU.
+
+    Args:
+        bmu_ids (array-like): BMU ID of each interval.
+        time_from (array-like): start of each interval.
+        time_to (array-like): end of each interval.
+        df_dirty (pd.DataFrame): dirty cells from find_dirty_settlement_periods.
+        margin (timedelta, optional): time added before and after the time span of each dirty cell.
+
+    Returns:
+        np.ndarray: True for the intervals that overlap a dirty cell.
+    """
+    if df_dirty.empty or len(bmu_ids) == 0:
+        return np.zeros(len(bmu_ids), dtype=bool)
+
+    bmu_codes = pd.factorize(np.r_[np.asarray(df_dirty["bmUnitID"], dtype=object), np.asarray(bmu_ids, dtype=object)])[
+        0
+    ].astype(np.int64)
+    margin_seconds = int(margin.total_seconds())
+    span_bmu = bmu_codes[: len(df_dirty)]
+    span_from = pd.DatetimeIndex(df_dirty["timeFrom"]).asi8 // 10**9 - margin_seconds
+    span_to = pd.DatetimeIndex(df_dirty["timeTo"]).asi8 // 10**9 + margin_seconds
+
+    # Merge the overlapping spans of each BMU, so that the spans of a BMU are ordered by both start and end
+    order = np.lexsort((span_from, span_bmu))
+    span_bmu, span_from, span_to = span_bmu[order], span_from[order], span_to[order]
+    running_end = pd.Series(span_to).groupby(span_bmu).cummax().to_numpy()
+    new_span = np.r_[True, (span_bmu[1:] != span_bmu[:-1]) | (span_from[1:] > running_end[:-1])]
+    merged_bmu = span_bmu[new_span]
+    merged_to = np.maximum.reduceat(span_to, np.flatnonzero(new_span))
+
+    # The only span that can overlap an interval is the last span of its BMU starting before the interval ends
+    # (the times in seconds fit in 32 bits)
+    query_bmu = bmu_codes[len(df_dirty) :]
+    query_from = pd.DatetimeIndex(time_from).asi8 // 10**9
+    query_to = pd.DatetimeIndex(time_to).asi8 // 10**9
+    position = np.searchsorted((merged_bmu << 32) + span_from[new_span], (query_bmu << 32) + query_to, "right") - 1
+    overlaps = position >= 0
+    position = np.maximum(position, 0)
+
+    return overlaps & (merged_bmu[position] == query_bmu) & (merged_to[position] >= query_from)
+
+
+def select_dirty_settlement_periods(df_fpn_mel_boal_agg: pd.DataFrame, df_dirty: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Keeps the generation of the settlement periods that overlap a dirty cell of their BMU. The records selected
+    by filter_and_rename_physical_Data to recalculate the dirty cells also give partial results for the
+    neighbouring settlement periods, which are already in the previous version of the output dataset.
+
+    Args:
+        df_fpn_mel_boal_agg (pd.DataFrame): output of calculate_settlement_period_generation.
+        df_dirty (pd.DataFrame, optional): dirty cells from find_dirty_settlement_periods. Defaults to None,
+                                           to keep all settlement periods.
+
+    Returns:
+        pd.DataFrame: generation of the dirty settlement periods.
+    """
+    if df_dirty is None:
+        return df_fpn_mel_boal_agg
+
+    return df_fpn_mel_boal_agg.loc[
+        overlaps_dirty_settlement_periods(
+            df_fpn_mel_boal_agg["bmUnitID"],
+            df_fpn_mel_boal_agg["local_datetime"],
+            df_fpn_mel_boal_agg["local_datetime"] + timedelta(minutes=30),
+            df_dirty,
+        )
+    ]
+
+
+def filter_and_rename_physical_Data(
+    location_BMRS_Final: str,
+    df_B1610: pd.DataFrame,
+    df_PHYBMDATA: pd.DataFrame,
+    df_dirty: pd.DataFrame = None,
+    df_generation_previous: pd.DataFrame = None,
+) -> pd.DataFrame:
+    """
+    If it exists, reads in the combined generation dataset and filters this to the period between
+    the start of the BM data and the end of the Generation_Combined data (minus 90 minutes). NB:
+    90 minutes was chosen as the BM data might be updated slightly retrospectively after the pipeline
+    was last run as balancing actions can happen at any time throughout a settlement period.
+    Filters the Physical BM data so it only contains the most recent settlement periods and the three
+    record types that we're interested in: FPN, MEL and BOAL. Selects the relevant columns in each
+    dataset to reduce the size of each DF. Renames the columns in the filtered DFs to follow a
+    standard pattern.
+
+    If the dirty cells are given (see find_dirty_settlement_periods), they replace the 90 minute window: only the
+    settlement periods that overlap a dirty cell are removed from the combined generation dataset, and only the
+    Physical BM Data needed to recalculate them is kept.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        df_PHYBMDATA (pd.DataFrame): B1610 dataframe created by the setup_update_B1610_data function.
+        df_PHYBMDATA (pd.DataFrame): current version of the PHYBMDATA dataframe.
+        df_dirty (pd.DataFrame, optional): dirty cells from find_dirty_settlement_periods. Defaults to None.
+        df_generation_previous (pd.DataFrame, optional): the combined generation dataset in memory, in the order of
+                                                         its partitions, to use instead of reading it from
+                                                         location_BMRS_Final. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The filtered version of the df_generation dataframe and three dfs with
+        the FPN, MEL and BOAL data respectively.
+    """
+    # Only the data derived from the BM (not historic data) is needed
+    if df_generation_previous is None:
+        df_generation = read_generation_data(location_BMRS_Final, start_datetime=df_B1610["local_datetime"].max())
+    else:
+        df_generation = df_generation_previous.loc[
+            df_generation_previous["localDateTime"] > df_B1610["local_datetime"].max()
+        ]
+        df_generation = apply_schema(df_generation.reset_index(drop=True), GENERATION_SCHEMA)
+
+    if not df_generation.empty:
+        if df_dirty is None:
+            # Discard the last 3 settlement periods of the df_generation
+            df_generation_max_datetime = pd.to_datetime(df_generation["localDateTime"].max()) - timedelta(minutes=90)
+            df_generation = df_generation.loc[df_generation["localDateTime"] < df_generation_max_datetime]
+            df_PHYBMDATA = df_PHYBMDATA.loc[df_PHYBMDATA["local_datetime"] >= df_generation_max_datetime]
+
+        df_generation = df_generation[["localDateTime", "settlementDate", "settlementPeriod", "BMUnitID", "quantity"]]
+        df_generation = df_generation.rename(columns={"localDateTime": "local_datetime", "BMUnitID": "bmUnitID"})
+        df_generation = apply_schema(df_generation, B1610_SCHEMA)
+
+    else:
+        df_generation = pd.DataFrame()
+
+    if df_dirty is not None:
+        # The settlement periods of a dirty cell depend on the records that overlap them
+        if not df_generation.empty:
+            df_generation = df_generation.loc[
+                ~overlaps_dirty_settlement_periods(
+                    df_generation["bmUnitID"],
+                    df_generation["local_datetime"],
+                    df_generation["local_datetime"] + timedelta(minutes=30),
+                    df_dirty,
+                )
+            ]
+        df_PHYBMDATA = df_PHYBMDATA.loc[
+            overlaps_dirty_settlement_periods(
+                df_PHYBMDATA["bmUnitID"],
+                df_PHYBMDATA["timeFrom"],
+                df_PHYBMDATA["timeTo"],
+                df_dirty,
+                margin=timedelta(minutes=30),
+            )
+        ]
+
+    df_fpn, df_mel, df_boal = split_physical_data(df_PHYBMDATA)
+
+    return df_generation, df_fpn, df_mel, df_boal
+
+
+def split_physical_data(df_PHYBMDATA: pd.DataFrame) -> tuple:
+    """
+    Splits the Physical BM Data into the FPN, MEL and BOAL records, with the levels renamed to LevelFrom and
+    LevelTo and indexed by bmUnitID.
+
+    Args:
+        df_PHYBMDATA (pd.DataFrame): formatted Physical BM Data (see format_PHYBM_data).
+
+    Returns:
+        tuple: the FPN, MEL and BOAL dataframes.
+    """
+    common_columns = [
+        "local_datetime",
+        "recordType",
+        "bmUnitID",
+        "settlementDate",
+        "settlementPeriod",
+        "timeFrom",
+        "timeTo",
+    ]
+    fpn_columns = ["pnLevelFrom", "pnLevelTo"]
+    mel_columns = ["melLevelFrom", "melLevelTo"]
+    boal_columns = [
+        "bidOfferAcceptanceNumber",
+        "acceptanceTime",
+        "bidOfferLevelFrom",
+        "bidOfferLevelTo",
+    ]
+
+    df_fpn = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"] == "PN", common_columns + fpn_columns]
+    df_fpn = df_fpn.rename(columns={"pnLevelFrom": "LevelFrom", "pnLevelTo": "LevelTo"}).set_index("bmUnitID")
+
+    df_mel = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"] == "MEL", common_columns + mel_columns]
+    df_mel = df_mel.rename(columns={"melLevelFrom": "LevelFrom", "melLevelTo": "LevelTo"}).set_index("bmUnitID")
+
+    df_boal = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"] == "BOALF", common_columns + boal_columns]
+    df_boal["bidOfferAcceptanceNumber"] = df_boal["bidOfferAcceptanceNumber"].astype("int32")
+    df_boal = df_boal.rename(
+        columns={
+            "bidOfferLevelFrom": "LevelFrom",
+            "bidOfferLevelTo": "LevelTo",
+            "bidOfferAcceptanceNumber": "Accept ID",
+        }
+    ).set_index("bmUnitID")
+
+    return df_fpn, df_mel, df_boal
+
+
+def convert_physical_data_to_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert all LevelFrom & timeFrom / LevelTo & timeTo columns from their horizontal format
+    to a long format with values at different timepoints.
+
+    Args:
+        df (pd.DataFrame): BOAL, MEL or FPN dataframe to convert from wide to long.
+
+    Returns:
+        pd.DataFrame: BOAL, MEL or FPN dataframe with level/time to/from converted to long format.
+    """
+
+    df = pd.concat(
+        (
+            df.drop(columns=["LevelTo", "timeTo"]).rename(columns={"LevelFrom": "Level", "timeFrom": "Time"}),
+            df.drop(columns=["LevelFrom", "timeFrom"]).rename(columns={"LevelTo": "Level", "timeTo": "Time"}),
+        )
+    )
+
+    df["Level"] = df["Level"].astype(float)
+    return df
+
+
+def resolve_level(df_linear: pd.DataFrame, groupby: list, engine: str = "vectorised") -> pd.DataFrame:
+    """
+    For BOAL data, we can have multiple levels for a given timepoint, because levels are fixed
+    at one point and then overwitten at a later timepoint, before the moment in
+    question has arrived.
+
+    We need to resolve them, choosing the latest possible commitment for each timepoint. To achieve this,
+    all data (FPN, MEL, BOAL) is first upsampled to 1-minutely resolution. This is easily possible because the data is
+    recorded in MW (rater than MWh).
+
+    Args:
+        df (pd.DataFrame): BOAL, MEL or FPN dataframe to converted from wide to long.
+        groupby (list): columns/index levels identifying a single commitment, e.g. ["Accept ID", "bmUnitID"].
+        engine (str): "vectorised" (default) resolves all groups at once on sorted arrays, "resample"
+                        uses the original per-group resample loop. Both return the same dataframe.
+
+    Returns:
+        pd.DataFrame: BOAL, MEL or FPN dataframe data upsampled to 1-minutely resolution.
+    """
+    if engine == "vectorised":
+        return resolve_level_vectorised(df_linear, groupby)
+    elif engine == "resample":
+        return resolve_level_resample(df_linear, groupby)
+    else:
+        raise ValueError(f"Unknown engine '{engine}', expected 'vectorised' or 'resample'")
+
+
+def resolve_level_resample(df_linear: pd.DataFrame, groupby: list) -> pd.DataFrame:
+    """
+    Reference implementation of resolve_level: loops over every group, resamples it to
+    1-minutely resolution and forward fills it, then keeps the last group for every timepoint.
+
+    Args:
+        df_linear (pd.DataFrame): BOAL, MEL or FPN dataframe to converted from wide to long.
+        groupby (list): columns/index levels identifying a single commitment.
+
+    Returns:
+        pd.DataFrame: BOAL, MEL or FPN dataframe data upsampled to 1-minutely resolution.
+    """
+    # Grouping by a list of one column is deprecated when iterating, so a single column is passed on its own
+    keys = groupby[0] if len(groupby) == 1 else groupby
+
+    out = []
+    for _, data in df_linear.groupby(keys, observed=True):
+        high_freq = data.reset_index().rename(columns={"index": "Unit"}).set_index("Time").resample("T").first()
+        out.append(high_freq.ffill())
+
+    recombined = pd.concat(out)
+
+    # Select the latest commitment for every timepoint
+    resolved = recombined.reset_index().groupby(["Time", "bmUnitID"], observed=True).last().sort_index()
+
+    return resolved
+
+
+def resolve_level_vectorised(df_linear: pd.DataFrame, groupby: list) -> pd.DataFrame:
+    """
+    Vectorised equivalent of resolve_level_resample. Rather than resampling each group in turn, the records
+    of all groups are sorted once and the 1-minutely grid of every group is built in one go with np.repeat.
+    Each grid point is then matched to the latest record at or before it (the forward fill) with
+    np.searchsorted, and the last group in groupby order wins where several groups cover the same
+    (Time, bmUnitID), i.e. the latest commitment.
+
+    As with the resample loop, each column is filled independently (null values are skipped) and
+    integer columns are returned as floats.
+
+    Args:
+        df_linear (pd.DataFrame): BOAL, MEL or FPN dataframe to converted from wide to long.
+        groupby (list): columns/index levels identifying a single commitment.
+
+    Returns:
+        pd.DataFrame: BOAL, MEL or FPN data upsampled to 1-minutely resolution and indexed by Time and bmUnitID.
+    """
+    df = df_linear.reset_index()
+    df = df.loc[df[groupby].notna().all(axis=1)].reset_index(drop=True)
+    value_columns = [column for column in df.columns if column not in ["Time", "bmUnitID"]]
+
+    time_dtype = df["Time"].dtype
+    time_tz = getattr(time_dtype, "tz", None)
+
+    if df.empty:
+        index = pd.MultiIndex.from_arrays(
+            [pd.DatetimeIndex([], tz=time_tz), pd.Index([], dtype=object)], names=["Time", "bmUnitID"]
+        )
+        return df[value_columns].set_axis(index, axis=0)
+
+    # Sort by group, then time, keeping the original row order for ties (as the resample does)
+    group_codes = [pd.factorize(df[key], sort=True)[0] for key in groupby]
+    time_ns = pd.DatetimeIndex(df["Time"]).asi8
+    minutes = time_ns // NANOSECONDS_PER_MINUTE
+    order = np.lexsort([np.arange(len(df)), time_ns] + group_codes[::-1])
+
+    sorted_codes = np.stack([codes[order] for codes in group_codes])
+    new_group = np.r_[True, (np.diff(sorted_codes, axis=1) != 0).any(axis=0)]
+    group_id = np.cumsum(new_group) - 1
+    group_first = np.flatnonzero(new_group)
+    group_last = np.r_[group_first[1:] - 1, len(df) - 1]
+
+    sorted_minutes = minutes[order] - minutes.min()
+    minute_span = sorted_minutes.max() + 1
+    record_key = group_id * minute_span + sorted_minutes
+
+    # Build the 1-minutely grid from the first to the last timepoint of every group
+    group_start = sorted_minutes[group_first]
+    group_length = sorted_minutes[group_last] - group_start + 1
+    group_offset = np.cumsum(group_length) - group_length
+    grid_group = np.repeat(np.arange(len(group_first)), group_length)
+    grid_minute = np.repeat(group_start - group_offset, group_length) + np.arange(group_length.sum())
+    grid_key = grid_group * minute_span + grid_minute
+
+    # Order the grid by Time and bmUnitID, with later groups last
+    bmu_codes, bmu_uniques = pd.factorize(df["bmUnitID"], sort=True)
+    grid_bmu = bmu_codes[order][group_first][grid_group]
+    output_key = grid_minute * len(bmu_uniques) + grid_bmu
+    grid_order = np.lexsort((grid_group, output_key))
+    output_key_sorted = output_key[grid_order]
+    resolved_key = output_key_sorted[np.r_[True, output_key_sorted[1:] != output_key_sorted[:-1]]]
+
+    data = {}
+    for column in value_columns:
+        # First non-null value of each group in each minute, forward filled along the grid
+        notnull = df[column].notna().to_numpy()[order]
+        column_key = record_key[notnull]
+        column_rows = order[notnull]
+        first_in_minute = np.r_[True, column_key[1:] != column_key[:-1]]
+        column_key = column_key[first_in_minute]
+        column_rows = column_rows[first_in_minute]
+
+        position = np.searchsorted(column_key, grid_key, side="right") - 1
+        valid = position >= 0
+        valid[valid] = column_key[position[valid]] // minute_span == grid_group[valid]
+        grid_rows = np.where(valid, column_rows[position], -1)
+
+        # Last non-null value across groups for each Time and bmUnitID
+        grid_rows = grid_rows[grid_order]
+        notnull = grid_rows >= 0
+        candidate_key = output_key_sorted[notnull]
+        candidate_rows = grid_rows[notnull]
+        last_in_key = np.r_[candidate_key[1:] != candidate_key[:-1], True]
+        candidate_key = candidate_key[last_in_key]
+        candidate_rows = candidate_rows[last_in_key]
+
+        position = np.searchsorted(candidate_key, resolved_key)
+        found = position < len(candidate_key)
+        found[found] = candidate_key[position[found]] == resolved_key[found]
+        rows = np.where(found, candidate_rows[np.minimum(position, len(candidate_key) - 1)], -1)
+
+        values = pd.api.extensions.take(df[column].array, rows, allow_fill=True)
+        if pd.api.types.is_integer_dtype(df[column].dtype) or pd.api.types.is_bool_dtype(df[column].dtype):
+            values = np.asarray(values, dtype="float64")
+        data[column] = values
+
+    resolved_time = pd.DatetimeIndex((resolved_key // len(bmu_uniques) + minutes.min()) * NANOSECONDS_PER_MINUTE)
+    if time_tz is not None:
+        resolved_time = resolved_time.tz_localize("UTC").tz_convert(time_tz)
+    index = pd.MultiIndex.from_arrays(
+        [resolved_time, bmu_uniques.take(resolved_key % len(bmu_uniques))], names=["Time", "bmUnitID"]
+    )
+
+    resolved = pd.DataFrame(data)
+    resolved.index = index
+
+    return resolved
+
+
+def resolve_applied_bid_offer_level(df_linear: pd.DataFrame, engine: str = "vectorised") -> pd.DataFrame:
+    """
+    BOAL Data is grouped by Accept ID and bmUnitID because the accept ID alone might not be unique.
+
+    Args:
+        df_linear (pd.DataFrame): BOAL dataframe to converted from wide to long.
+        engine (str): resolve_level engine, "vectorised" or "resample".
+
+    Returns:
+        pd.DataFrame: BOAL data upsampled to the minutely level. Where multiple BOAL records exist for a time,
+        only the last one is kept.
+
+    """
+    return resolve_level(df_linear, ["Accept ID", "bmUnitID"], engine=engine)
+
+
+def resolve_FPN_MEL_level(df_linear: pd.DataFrame, engine: str = "vectorised") -> pd.DataFrame:
+    """
+    FPN and MEL Data doesn't have an accept ID and only needs grouping by the bmUnitID.
+
+    Args:
+        df_linear (pd.DataFrame): MEL or FPN dataframe to converted from wide to long.
+        engine (str): resolve_level engine, "vectorised" or "resample".
+
+    Returns:
+        pd.DataFrame: FPN/MEL data upsampled to the minutely level. Where multiple records exist for a time,
+        only the last one is kept.
+    """
+    return resolve_level(df_linear, ["bmUnitID"], engine=engine)
+
+
+def merge_fpn_boal_mel_levels(
+    unit_fpn_resolved: pd.DataFrame, unit_boal_resolved: pd.DataFrame, unit_mel_resolved: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    After resampling the data to minutely resolution (Time), join the FPN, BOAL and MEL data and calculate
+    the generation at each minute: if a BOAL value exists, use it. Otherwise, retain the FPN value. If the MEL
+    is lower than the BOAL or FPN value, cap the generation at the level of the MEL.
+
+    Args:
+        unit_fpn_resolved (pd.DataFrame): minutely FPN data from resolve_FPN_MEL_level.
+        unit_boal_resolved (pd.DataFrame): minutely BOAL data from resolve_applied_bid_offer_level.
+        unit_mel_resolved (pd.DataFrame): minutely MEL data from resolve_FPN_MEL_level.
+
+    Returns:
+        pd.DataFrame: minutely FPN, BOAL and MEL data with the resulting generation in the "quantity" column.
+    """
+    df_fpn_boal = pd.merge(
+        unit_fpn_resolved, unit_boal_resolved, how="outer", on=["Time", "bmUnitID"], suffixes=["_fpn", "_boal"]
+    )
+
+    df_fpn_mel_boal = pd.merge(df_fpn_boal, unit_mel_resolved, how="outer", on=["Time", "bmUnitID"]).rename(
+        columns={"Level": "Level_mel"}
+    )
+
+    df_fpn_mel_boal["quantity"] = df_fpn_mel_boal["Level_boal"].fillna(
+        df_fpn_mel_boal["Level_fpn"], inplace=False
+    )  # If a BOAL value exists, use it. Otherwise, retain the FPN value (which will always exist).
+    df_fpn_mel_boal["quantity"] = np.where(
+        df_fpn_mel_boal["quantity"] > df_fpn_mel_boal["Level_mel"],
+        df_fpn_mel_boal["Level_mel"],
+        df_fpn_mel_boal["quantity"],
+    )  # If the MEL is lower than the BOAL or FPN value, cap the generation at the level of the MEL.
+
+    return df_fpn_mel_boal
+
+
+def combine_levels_sorted(
+    unit_fpn_resolved: pd.DataFrame, unit_boal_resolved: pd.DataFrame, unit_mel_resolved: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Sorted equivalent of merge_fpn_boal_mel_levels. The resolved FPN, BOAL and MEL data have one row per minute
+    and BMU, so rather than outer merging the three dataframes, each minute of each BMU is given a single integer
+    key and the rows are matched with np.searchsorted on the sorted keys. The FPN and MEL levels are held
+    between their records by resolve_level, and the BOAL level only exists within its acceptances, so the
+    generation is the BOAL level where there is one and the FPN level otherwise, capped at the MEL. Only the
+    minutes with both an FPN and a MEL level are returned, as the other minutes have no settlement period in
+    aggregate_to_settlement_periods.
+
+    Args:
+        unit_fpn_resolved (pd.DataFrame): minutely FPN data from resolve_FPN_MEL_level.
+        unit_boal_resolved (pd.DataFrame): minutely BOAL data from resolve_applied_bid_offer_level.
+        unit_mel_resolved (pd.DataFrame): minutely MEL data from resolve_FPN_MEL_level.
+
+    Returns:
+        pd.DataFrame: minutely FPN, BOAL and MEL levels with the resulting generation in the "quantity" column,
+        and the columns used by aggregate_to_settlement_periods, indexed by Time and bmUnitID.
+    """
+    frames = (unit_fpn_resolved, unit_boal_resolved, unit_mel_resolved)
+    bmu_uniques = pd.Index(pd.unique(np.concatenate([np.asarray(df.index.levels[1], dtype=object) for df in frames])))
+
+    keys = []
+    for df in frames:
+        minutes = pd.DatetimeIndex(df.index.get_level_values("Time")).asi8 // NANOSECONDS_PER_MINUTE
+        bmu_codes = bmu_uniques.get_indexer(df.index.levels[1])[df.index.codes[1]]
+        keys.append(minutes * len(bmu_uniques) + bmu_codes)
+    fpn_key, boal_key, mel_key = keys
+
+    def find_rows(key: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # Row of each query key, -1 where it is not found
+        if len(key) == 0:
+            return np.full(len(query), -1)
+        order = np.argsort(key, kind="stable")
+        position = np.minimum(np.searchsorted(key[order], query), len(key) - 1)
+        return np.where(key[order][position] == query, order[position], -1)
+
+    # In the order of the merge: by Time, then bmUnitID
+    fpn_rows = np.argsort(fpn_key, kind="stable")
+    mel_rows = find_rows(mel_key, fpn_key[fpn_rows])
+    fpn_rows, mel_rows = fpn_rows[mel_rows >= 0], mel_rows[mel_rows >= 0]
+    boal_rows = find_rows(boal_key, fpn_key[fpn_rows])
+
+    level_fpn = unit_fpn_resolved["Level"].to_numpy(dtype="float64")[fpn_rows]
+    level_boal = np.append(unit_boal_resolved["Level"].to_numpy(dtype="float64"), np.nan)[boal_rows]
+    level_mel = unit_mel_resolved["Level"].to_numpy(dtype="float64")[mel_rows]
+    quantity = np.where(np.isnan(level_boal), level_fpn, level_boal)
+
+    df_fpn_mel_boal = pd.DataFrame(
+        {
+            "local_datetime_fpn": unit_fpn_resolved["local_datetime"].iloc[fpn_rows].reset_index(drop=True),
+            "settlementDate": unit_mel_resolved["settlementDate"].iloc[mel_rows].reset_index(drop=True),
+            "settlementPeriod": unit_mel_resolved["settlementPeriod"].iloc[mel_rows].reset_index(drop=True),
+            "Level_fpn": level_fpn,
+            "Level_boal": level_boal,
+            "Level_mel": level_mel,
+            "quantity": np.where(quantity > level_mel, level_mel, quantity),
+        }
+    )
+    df_fpn_mel_boal.index = unit_fpn_resolved.index[fpn_rows]
+
+    return df_fpn_mel_boal
+
+
+def combine_levels(
+    unit_fpn_resolved: pd.DataFrame,
+    unit_boal_resolved: pd.DataFrame,
+    unit_mel_resolved: pd.DataFrame,
+    engine: str = "sorted",
+) -> pd.DataFrame:
+    """
+    Combines the minutely FPN, BOAL and MEL data into the generation at each minute: if a BOAL value exists, use
+    it. Otherwise, retain the FPN value. If the MEL is lower than the BOAL or FPN value, cap the generation at
+    the level of the MEL.
+
+    Args:
+        unit_fpn_resolved (pd.DataFrame): minutely FPN data from resolve_FPN_MEL_level.
+        unit_boal_resolved (pd.DataFrame): minutely BOAL data from resolve_applied_bid_offer_level.
+        unit_mel_resolved (pd.DataFrame): minutely MEL data from resolve_FPN_MEL_level.
+        engine (str): "sorted" (default) matches the minutes on sorted keys (combine_levels_sorted), "merge"
+                      uses the original outer merges (merge_fpn_boal_mel_levels). Both give the same
+                      settlement period generation in aggregate_to_settlement_periods.
+
+    Returns:
+        pd.DataFrame: minutely data with the resulting generation in the "quantity" column.
+    """
+    if engine == "sorted":
+        return combine_levels_sorted(unit_fpn_resolved, unit_boal_resolved, unit_mel_resolved)
+    elif engine == "merge":
+        return merge_fpn_boal_mel_levels(unit_fpn_resolved, unit_boal_resolved, unit_mel_resolved)
+    else:
+        raise ValueError(f"Unknown engine '{engine}', expected 'sorted' or 'merge'")
+
+
+def aggregate_to_settlement_periods(df_fpn_mel_boal: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregate the minutely generation back up to the settlement period (SP) level and calculate the mean
+    generation during each SP.
+
+    Args:
+        df_fpn_mel_boal (pd.DataFrame): minutely data from merge_fpn_boal_mel_levels.
+
+    Returns:
+        pd.DataFrame: mean generation (quantity) by local_datetime, settlementDate, settlementPeriod and bmUnitID.
+    """
+    df_fpn_mel_boal_agg = (
+        df_fpn_mel_boal.groupby(
+            ["local_datetime_fpn", "settlementDate", "settlementPeriod", "bmUnitID"], observed=True
+        )["quantity"]
+        .mean()
+        .reset_index()
+    )
+    df_fpn_mel_boal_agg = df_fpn_mel_boal_agg.rename(columns={"local_datetime_fpn": "local_datetime"})
+    df_fpn_mel_boal_agg = df_fpn_mel_boal_agg[
+        ["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID", "quantity"]
+    ]
+
+    return df_fpn_mel_boal_agg
+
+
+def calculate_settlement_period_generation_minutely(
+    df_fpn: pd.DataFrame, df_mel: pd.DataFrame, df_boal: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    The half-hourly or sub-half-hourly data is resampled to minutely resolution so that actions that happen
+    at different times during each half-hour period can be joined together, and then averaged back up to
+    settlement periods.
+
+    Args:
+        df_fpn (pd.DataFrame): FPN dataframe from filter_and_rename_physical_Data.
+        df_mel (pd.DataFrame): MEL dataframe from filter_and_rename_physical_Data.
+        df_boal (pd.DataFrame): BOAL dataframe from filter_and_rename_physical_Data.
+
+    Returns:
+        pd.DataFrame: mean generation (quantity) by local_datetime, settlementDate, settlementPeriod and bmUnitID.
+    """
+    unit_boal_resolved = resolve_applied_bid_offer_level(convert_physical_data_to_long(df_boal))
+    unit_fpn_resolved = resolve_FPN_MEL_level(convert_physical_data_to_long(df_fpn))
+    unit_mel_resolved = resolve_FPN_MEL_level(convert_physical_data_to_long(df_mel))
+
+    df_fpn_mel_boal = combine_levels(unit_fpn_resolved, unit_boal_resolved, unit_mel_resolved)
+
+    return aggregate_to_settlement_periods(df_fpn_mel_boal)
+
+
+def evaluate_segment_levels(
+    group: np.ndarray,
+    time_from: np.ndarray,
+    time_to: np.ndarray,
+    level_from: np.ndarray,
+    level_to: np.ndarray,
+    query_group: np.ndarray,
+    query_start: np.ndarray,
+    query_end: np.ndarray,
+    linear: bool = False,
+    end_hold: int = 0,
+) -> tuple:
+    """
+    Evaluates groups of level segments (e.g. the FPN records of each BMU) at the start and end of a set of
+    query intervals, none of which may straddle a segment boundary. Where several segments of a group start at
+    the same time the first one is used. Within a segment the level is either held at LevelFrom ("step", as the
+    minutely path does) or interpolated linearly towards LevelTo. Between the segments of a group the last LevelTo
+    is held, as is the final LevelTo for end_hold seconds after the last segment. After that the group has no level.
+
+    Args:
+        group (np.ndarray): non-negative integer group code of each segment.
+        time_from (np.ndarray): segment start times as integer seconds.
+        time_to (np.ndarray): segment end times as integer seconds.
+        level_from (np.ndarray): level at the start of each segment.
+        level_to (np.ndarray): level at the end of each segment.
+        query_group (np.ndarray): group code of each query interval.
+        query_start (np.ndarray): query interval start times as integer seconds.
+        query_end (np.ndarray): query interval end times as integer seconds.
+        linear (bool): interpolate between LevelFrom and LevelTo instead of holding LevelFrom.
+        end_hold (int): number of seconds the final LevelTo of each group is held for.
+
+    Returns:
+        tuple: levels at the start and at the end of each query interval and the index of the segment used
+        (-1 where the query interval is not covered by its group).
+    """
+    span = max(time_from.max(), time_to.max() + end_hold, query_end.max()) + 1
+
+    order = np.lexsort((np.arange(len(group)), time_from, group))
+    segment_key = group[order] * span + time_from[order]
+    first = np.r_[True, segment_key[1:] != segment_key[:-1]]
+    order = order[first]
+    segment_key = segment_key[first]
+
+    group_end = np.full(max(group.max(), query_group.max()) + 1, -1)
+    np.maximum.at(group_end, group, time_to)
+
+    position = np.searchsorted(segment_key, query_group * span + query_start, side="right") - 1
+    segment = order[np.maximum(position, 0)]
+    covered = (position >= 0) & (group[segment] == query_group) & (query_start < group_end[query_group] + end_hold)
+
+    in_segment = query_start < time_to[segment]
+    if linear:
+        slope = (level_to[segment] - level_from[segment]) / np.maximum(time_to[segment] - time_from[segment], 1)
+    else:
+        slope = np.zeros(len(segment))
+    start_level = np.where(
+        in_segment, level_from[segment] + slope * (query_start - time_from[segment]), level_to[segment]
+    )
+    end_level = np.where(in_segment, level_from[segment] + slope * (query_end - time_from[segment]), level_to[segment])
+
+    return start_level, end_level, np.where(covered, segment, -1)
+
+
+def integrate_capped_level(
+    start_level: np.ndarray, end_level: np.ndarray, start_cap: np.ndarray, end_cap: np.ndarray, duration: np.ndarray
+) -> np.ndarray:
+    """
+    Integrates min(level, cap) over intervals in which both the level and the cap change linearly,
+    splitting each interval at the point where the level crosses the cap.
+
+    Args:
+        start_level (np.ndarray): level at the start of each interval.
+        end_level (np.ndarray): level at the end of each interval.
+        start_cap (np.ndarray): cap at the start of each interval.
+        end_cap (np.ndarray): cap at the end of each interval.
+        duration (np.ndarray): length of each interval.
+
+    Returns:
+        np.ndarray: integral of the capped level over each interval.
+    """
+    start_diff = start_level - start_cap
+    end_diff = end_level - end_cap
+    start_min = np.minimum(start_level, start_cap)
+    end_min = np.minimum(end_level, end_cap)
+
+    crosses = start_diff * end_diff < 0
+    fraction = np.where(crosses, start_diff / np.where(crosses, start_diff - end_diff, 1), 1)
+    cross_level = start_level + fraction * (end_level - start_level)
+
+    return np.where(
+        crosses,
+        duration * (fraction * (start_min + cross_level) + (1 - fraction) * (cross_level + end_min)) / 2,
+        duration * (start_min + end_min) / 2,
+    )
+
+
+def calculate_settlement_period_generation_analytic(
+    df_fpn: pd.DataFrame, df_mel: pd.DataFrame, df_boal: pd.DataFrame, segment_shape: str = "step"
+) -> pd.DataFrame:
+    """
+    Calculates the same MEL-capped, BOAL-overridden mean generation per settlement period as the minutely path,
+    but without upsampling: every timeFrom/timeTo of a BMU's FPN, MEL and BOAL records is used as a breakpoint,
+    and the generation is integrated exactly over the intervals between consecutive breakpoints. Within each
+    interval the latest covering acceptance (highest Accept ID) overrides the FPN, as in resolve_level.
+
+    Intervals are grouped to settlement periods using the local_datetime of the FPN record and the settlementDate
+    and settlementPeriod of the MEL record covering them, so (as in the minutely path) periods without FPN and MEL
+    data are dropped. Like the minutely path, which samples the minute starting at the last timeTo of each
+    series or acceptance, the final level is held for one minute after it ends. With "step" segments whose times
+    are whole minutes, the results therefore match the minutely path up to floating point error.
+
+    Args:
+        df_fpn (pd.DataFrame): FPN dataframe from filter_and_rename_physical_Data.
+        df_mel (pd.DataFrame): MEL dataframe from filter_and_rename_physical_Data.
+        df_boal (pd.DataFrame): BOAL dataframe from filter_and_rename_physical_Data.
+        segment_shape (str): "step" holds LevelFrom until timeTo, like the minutely path. "linear" interpolates
+                                between LevelFrom and LevelTo.
+
+    Returns:
+        pd.DataFrame: mean generation (quantity) by local_datetime, settlementDate, settlementPeriod and bmUnitID.
+    """
+    if segment_shape not in ["step", "linear"]:
+        raise ValueError(f"Unknown segment_shape '{segment_shape}', expected 'step' or 'linear'")
+    linear = segment_shape == "linear"
+
+    output_columns = ["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID", "quantity"]
+    if df_fpn.empty or df_mel.empty:
+        return pd.DataFrame(columns=output_columns)
+
+    df_fpn = df_fpn.reset_index()
+    df_mel = df_mel.reset_index()
+    df_boal = df_boal.reset_index()
+    frames = [df_fpn, df_mel, df_boal]
+
+    bmu_codes, bmu_uniques = pd.factorize(pd.concat([df["bmUnitID"] for df in frames]), sort=True)
+    fpn_bmu, mel_bmu, boal_bmu = np.split(bmu_codes, np.cumsum([len(df) for df in frames])[:-1])
+
+    origin = min(pd.DatetimeIndex(df["timeFrom"]).asi8.min() for df in frames if not df.empty)
+
+    def to_seconds(times: pd.Series) -> np.ndarray:
+        return (pd.DatetimeIndex(times).asi8 - origin) // 10**9
+
+    times = {
+        name: (to_seconds(df["timeFrom"]), to_seconds(df["timeTo"])) for name, df in zip(["fpn", "mel", "boal"], frames)
+    }
+
+    # Split each BMU's timeline at every record boundary (and one minute after it, see above)
+    end_hold = 60
+    span = max(np.max(np.r_[time_from, time_to], initial=0) for time_from, time_to in times.values()) + end_hold + 1
+    breakpoints = np.unique(
+        np.concatenate(
+            [
+                np.r_[bmu * span + time_from, bmu * span + time_to, bmu * span + time_to + end_hold]
+                for bmu, (time_from, time_to) in zip([fpn_bmu, mel_bmu, boal_bmu], times.values())
+            ]
+        )
+    )
+    same_bmu = breakpoints[1:] // span == breakpoints[:-1] // span
+    interval_key = breakpoints[:-1][same_bmu]
+    interval_bmu = interval_key // span
+    interval_start = interval_key % span
+    interval_end = breakpoints[1:][same_bmu] % span
+
+    def evaluate(df: pd.DataFrame, name: str, group: np.ndarray, query: np.ndarray, query_group: np.ndarray) -> tuple:
+        return evaluate_segment_levels(
+            group,
+            times[name][0],
+            times[name][1],
+            df["LevelFrom"].to_numpy(dtype="float64"),
+            df["LevelTo"].to_numpy(dtype="float64"),
+            query_group,
+            interval_start[query],
+            interval_end[query],
+            linear=linear,
+            end_hold=end_hold,
+        )
+
+    all_intervals = np.arange(len(interval_key))
+    fpn_start, fpn_end, fpn_record = evaluate(df_fpn, "fpn", fpn_bmu, all_intervals, interval_bmu)
+    mel_start, mel_end, mel_record = evaluate(df_mel, "mel", mel_bmu, all_intervals, interval_bmu)
+
+    # Find the latest acceptance covering each interval
+    quantity_start = fpn_start
+    quantity_end = fpn_end
+    if not df_boal.empty:
+        accept_codes = pd.factorize(df_boal["Accept ID"], sort=True)[0]
+        boal_acceptance = pd.factorize(accept_codes * len(bmu_uniques) + boal_bmu, sort=True)[0]
+        n_acceptances = boal_acceptance.max() + 1
+
+        acceptance_bmu = np.zeros(n_acceptances, dtype="int64")
+        acceptance_bmu[boal_acceptance] = boal_bmu
+        acceptance_start = np.full(n_acceptances, span)
+        np.minimum.at(acceptance_start, boal_acceptance, times["boal"][0])
+        acceptance_end = np.full(n_acceptances, -1)
+        np.maximum.at(acceptance_end, boal_acceptance, times["boal"][1])
+        acceptance_end = acceptance_end + end_hold
+
+        first_interval = np.searchsorted(interval_key, acceptance_bmu * span + acceptance_start)
+        n_intervals = np.maximum(
+            np.searchsorted(interval_key, acceptance_bmu * span + acceptance_end) - first_interval, 0
+        )
+        covered_interval = np.repeat(first_interval - (np.cumsum(n_intervals) - n_intervals), n_intervals) + np.arange(
+            n_intervals.sum()
+        )
+        latest_acceptance = np.full(len(interval_key), -1)
+        np.maximum.at(latest_acceptance, covered_interval, np.repeat(np.arange(n_acceptances), n_intervals))
+
+        has_boal = np.flatnonzero(latest_acceptance >= 0)
+        boal_start, boal_end, _ = evaluate(df_boal, "boal", boal_acceptance, has_boal, latest_acceptance[has_boal])
+
+        quantity_start = quantity_start.copy()
+        quantity_end = quantity_end.copy()
+        quantity_start[has_boal] = boal_start
+        quantity_end[has_boal] = boal_end
+
+    # Integrate the MEL-capped generation over intervals with both FPN and MEL data
+    keep = (fpn_record >= 0) & (mel_record >= 0)
+    duration = (interval_end - interval_start)[keep].astype("float64")
+    integral = integrate_capped_level(
+        quantity_start[keep],
+        quantity_end[keep],
+        np.where(np.isnan(mel_start), np.inf, mel_start)[keep],
+        np.where(np.isnan(mel_end), np.inf, mel_end)[keep],
+        duration,
+    )
+    duration = np.where(np.isnan(integral), 0, duration)
+
+    df_intervals = pd.DataFrame(
+        {
+            "local_datetime": df_fpn["local_datetime"].iloc[fpn_record[keep]].reset_index(drop=True),
+            "settlementDate": df_mel["settlementDate"].iloc[mel_record[keep]].reset_index(drop=True),
+            "settlementPeriod": df_mel["settlementPeriod"].iloc[mel_record[keep]].reset_index(drop=True),
+            "bmUnitID": bmu_uniques.take(interval_bmu[keep]),
+            "integral": np.nan_to_num(integral),
+            "duration": duration,
+        }
+    )
+    df_agg = df_intervals.groupby(
+        ["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID"], observed=True
+    ).sum()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        df_agg["quantity"] = df_agg["integral"] / df_agg["duration"]
+
+    return df_agg.reset_index()[output_columns]
+
+
+def calculate_settlement_period_generation(
+    df_fpn: pd.DataFrame,
+    df_mel: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    mode: str = "minutely",
+    segment_shape: str = "step",
+    n_workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Combines the FPN, BOAL and MEL data into the mean generation of each BMU during each settlement period:
+    where a BOAL exists it overrides the FPN, and the generation is capped at the MEL.
+
+    Args:
+        df_fpn (pd.DataFrame): FPN dataframe from filter_and_rename_physical_Data.
+        df_mel (pd.DataFrame): MEL dataframe from filter_and_rename_physical_Data.
+        df_boal (pd.DataFrame): BOAL dataframe from filter_and_rename_physical_Data.
+        mode (str): "minutely" resamples all data to 1-minutely resolution and averages it back up to
+                    settlement periods. "analytic" integrates the FPN/BOAL/MEL segments over each settlement
+                    period directly, which uses far less memory and time.
+        segment_shape (str): "step" or "linear" level segments, only used by the analytic mode.
+        n_workers (int): number of processes resolving the BMUs in parallel, see
+                         calculate_settlement_period_generation_parallel. Defaults to 1 (no parallel processes).
+
+    Returns:
+        pd.DataFrame: mean generation (quantity) by local_datetime, settlementDate, settlementPeriod and bmUnitID.
+    """
+    if n_workers > 1:
+        return calculate_settlement_period_generation_parallel(
+            df_fpn, df_mel, df_boal, mode=mode, segment_shape=segment_shape, n_workers=n_workers
+        )
+
+    if mode == "minutely":
+        return calculate_settlement_period_generation_minutely(df_fpn, df_mel, df_boal)
+    elif mode == "analytic":
+        return calculate_settlement_period_generation_analytic(df_fpn, df_mel, df_boal, segment_shape=segment_shape)
+    else:
+        raise ValueError(f"Unknown mode '{mode}', expected 'minutely' or 'analytic'")
+
+
+def combine_generation_data(
+    df_B1610: pd.DataFrame, df_generation: pd.DataFrame, df_fpn_mel_boal_agg: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Combines the historic B1610 data, the BM derived data of the previous version of the output dataset and the
+    newly calculated BM derived data. Rows with a negative value (not a generator) or a value of 0 are removed
+    (B1610 only has positive values).
+
+    Args:
+        df_B1610 (pd.DataFrame): B1610 dataframe created by the setup_update_B1610_data function.
+        df_generation (pd.DataFrame): filtered previous output from filter_and_rename_physical_Data.
+        df_fpn_mel_boal_agg (pd.DataFrame): output of calculate_settlement_period_generation.
+
+    Returns:
+        pd.DataFrame: generation by local_datetime, settlementDate, settlementPeriod and bmUnitID, with the
+        types of B1610_SCHEMA.
+    """
+    if df_generation is not None and not df_generation.empty and df_fpn_mel_boal_agg is not None:
+        # The recalculated settlement periods are put back in place, in the order of a full recalculation
+        df_fpn_mel_boal_agg = pd.concat((df_generation, df_fpn_mel_boal_agg), axis=0).sort_values(
+            ["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID"], kind="stable"
+        )
+        df_generation = None
+
+    df_generation = pd.concat((df_B1610, df_generation, df_fpn_mel_boal_agg), axis=0)
+    df_generation = df_generation[df_generation["quantity"] > 0]
+
+    return apply_schema(df_generation, B1610_SCHEMA)
+
+
+# Approximate peak memory (measured with tracemalloc) used per resolved BMU minute when calculating the
+# settlement period generation, by mode
+STREAMING_BYTES_PER_BMU_MINUTE = {"minutely": 300, "analytic": 20}
+STREAMING_MEMORY_BUDGET_MB = 512
+
+
+def estimate_resolved_minutes(df_linear: pd.DataFrame) -> pd.Series:
+    """
+    Estimates the number of minutely rows each BMU will be resolved to, from the length of its records.
+
+    Args:
+        df_linear (pd.DataFrame): FPN, MEL or BOAL dataframe from filter_and_rename_physical_Data.
+
+    Returns:
+        pd.Series: number of minutes by bmUnitID.
+    """
+    minutes = (df_linear["timeTo"] - df_linear["timeFrom"]) // timedelta(minutes=1) + 1
+
+    return minutes.groupby(level="bmUnitID", observed=True).sum()
+
+
+def split_BMU_batches(
+    df_fpn: pd.DataFrame,
+    df_mel: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    mode: str = "minutely",
+    memory_budget_mb: float = STREAMING_MEMORY_BUDGET_MB,
+) -> list:
+    """
+    Splits the BMUs into batches whose estimated peak memory use in calculate_settlement_period_generation
+    stays within the memory budget. A single BMU that exceeds the budget gets a batch of its own.
+
+    Args:
+        df_fpn (pd.DataFrame): FPN dataframe from filter_and_rename_physical_Data.
+        df_mel (pd.DataFrame): MEL dataframe from filter_and_rename_physical_Data.
+        df_boal (pd.DataFrame): BOAL dataframe from filter_and_rename_physical_Data.
+        mode (str): "minutely" or "analytic", see calculate_settlement_period_generation.
+        memory_budget_mb (float): peak memory budget in MB.
+
+    Returns:
+        list: lists of BMU IDs.
+    """
+    minutes = pd.concat([estimate_resolved_minutes(df) for df in (df_fpn, df_mel, df_boal)])
+    bmu_bytes = minutes.groupby(level=0, observed=True).sum() * STREAMING_BYTES_PER_BMU_MINUTE[mode]
+
+    batches = []
+    batch, batch_bytes = [], 0
+    for bmu, n_bytes in bmu_bytes.items():
+        if batch and batch_bytes + n_bytes > memory_budget_mb * 1024**2:
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(bmu)
+        batch_bytes += n_bytes
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def select_settlement_day(
+    df_fpn: pd.DataFrame, df_mel: pd.DataFrame, df_boal: pd.DataFrame, settlement_date: pd.Timestamp
+) -> tuple:
+    """
+    Selects the FPN, MEL and BOAL records needed to calculate the generation of one settlement date: the
+    records of the settlement date and the records of the neighbouring days that overlap its time span,
+    e.g. acceptances that run past midnight. This way, the settlement periods of the day are resolved in the
+    same way as when all days are processed at once.
+
+    Args:
+        df_fpn (pd.DataFrame): FPN dataframe from filter_and_rename_physical_Data.
+        df_mel (pd.DataFrame): MEL dataframe from filter_and_rename_physical_Data.
+        df_boal (pd.DataFrame): BOAL dataframe from filter_and_rename_physical_Data.
+        settlement_date (pd.Timestamp): settlement date to select.
+
+    Returns:
+        tuple: the FPN, MEL and BOAL records of the settlement date.
+    """
+    frames = (df_fpn, df_mel, df_boal)
+    day_records = [df.loc[df["settlementDate"] == settlement_date] for df in frames]
+    if all(df.empty for df in day_records):
+        return tuple(day_records)
+
+    time_from = min(df["timeFrom"].min() for df in day_records if not df.empty)
+    time_to = max(df["timeTo"].max() for df in day_records if not df.empty)
+
+    return tuple(df.loc[(df["timeTo"] >= time_from) & (df["timeFrom"] <= time_to)] for df in frames)
+
+
+def split_BMU_shards(df_fpn: pd.DataFrame, df_mel: pd.DataFrame, df_boal: pd.DataFrame, n_shards: int) -> list:
+    """
+    Splits the BMUs into shards with a similar amount of work, estimated by the number of minutes each BMU is
+    resolved to (see estimate_resolved_minutes). The BMUs are assigned from the largest to the smallest, each
+    to the shard with the least work so far.
+
+    Args:
+        df_fpn (pd.DataFrame): FPN dataframe from filter_and_rename_physical_Data.
+        df_mel (pd.DataFrame): MEL dataframe from filter_and_rename_physical_Data.
+        df_boal (pd.DataFrame): BOAL dataframe from filter_and_rename_physical_Data.
+        n_shards (int): maximum number of shards.
+
+    Returns:
+        list: lists of BMU IDs, without empty shards.
+    """
+    minutes = pd.concat([estimate_resolved_minutes(df) for df in (df_fpn, df_mel, df_boal)])
+    bmu_minutes = minutes.groupby(level=0, observed=True).sum().sort_values(ascending=False, kind="stable")
+
+    shards = [[] for _ in range(n_shards)]
+    shard_minutes = np.zeros(n_shards)
+    for bmu, n_minutes in bmu_minutes.items():
+        shard = int(np.argmin(shard_minutes))
+        shards[shard].append(bmu)
+        shard_minutes[shard] += n_minutes
+
+    return [shard for shard in shards if shard]
+
+
+def calculate_generation_shard(locations: tuple, bmus: list, mode: str, segment_shape: str) -> pd.DataFrame:
+    """
+    Worker of calculate_settlement_period_generation_parallel: reads the FPN, MEL and BOAL records of a shard of
+    BMUs and calculates their settlement period generation.
+
+    Args:
+        locations (tuple): paths of the Arrow files with the FPN, MEL and BOAL records.
+        bmus (list): BMU IDs of the shard.
+        mode (str): "minutely" or "analytic", see calculate_settlement_period_generation.
+        segment_shape (str): "step" or "linear", see calculate_settlement_period_generation.
+
+    Returns:
+        pd.DataFrame: output of calculate_settlement_period_generation for the BMUs of the shard.
+    """
+    df_fpn, df_mel, df_boal = (read_arrow_BMUs(location, bmus) for location in locations)
+
+    return calculate_settlement_period_generation(df_fpn, df_mel, df_boal, mode=mode, segment_shape=segment_shape)
+
+
+def calculate_settlement_period_generation_parallel(
+    df_fpn: pd.DataFrame,
+    df_mel: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    mode: str = "minutely",
+    segment_shape: str = "step",
+    n_workers: int = 4,
+) -> pd.DataFrame:
+    """
+    Runs calculate_settlement_period_generation in a pool of processes, each calculating the generation of a
+    shard of the BMUs (see split_BMU_shards), as BMUs are independent of each other. The records are written
+    once to Arrow IPC files in a temporary folder, which the workers memory-map, so only the BMU IDs of each
+    shard and the much smaller results are passed between the processes. The results are put back in the
+    order of calculate_settlement_period_generation, so the output doesn't depend on the number of workers.
+
+    The workers are forked where possible. Elsewhere (e.g. on Windows) they are spawned and import the __main__
+    script, so in a script this should only be called under an 'if __name__ == "__main__":' guard (notebooks
+    are fine).
+
+    Args:
+        df_fpn (pd.DataFrame): FPN dataframe from filter_and_rename_physical_Data.
+        df_mel (pd.DataFrame): MEL dataframe from filter_and_rename_physical_Data.
+        df_boal (pd.DataFrame): BOAL dataframe from filter_and_rename_physical_Data.
+        mode (str): "minutely" or "analytic", see calculate_settlement_period_generation.
+        segment_shape (str): "step" or "linear", see calculate_settlement_period_generation.
+        n_workers (int): number of processes.
+
+    Returns:
+        pd.DataFrame: mean generation (quantity) by local_datetime, settlementDate, settlementPeriod and bmUnitID.
+    """
+    shards = split_BMU_shards(df_fpn, df_mel, df_boal, n_workers)
+    if len(shards) <= 1:
+        return calculate_settlement_period_generation(df_fpn, df_mel, df_boal, mode=mode, segment_shape=segment_shape)
+
+    with tempfile.TemporaryDirectory() as location:
+        locations = tuple(os.path.join(location, f"{name}.arrow") for name in ("fpn", "mel", "boal"))
+        for df, path in zip((df_fpn, df_mel, df_boal), locations):
+            write_arrow_file(df, path)
+
+        start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        with ProcessPoolExecutor(
+            max_workers=len(shards), mp_context=multiprocessing.get_context(start_method)
+        ) as executor:
+            dfs = list(
+                executor.map(calculate_generation_shard, repeat(locations), shards, repeat(mode), repeat(segment_shape))
+            )
+
+    return (
+        pd.concat(dfs, axis=0)
+        .sort_values(["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID"], kind="stable")
+        .reset_index(drop=True)
+    )
@@ -0,0 +1,662 @@
+"""
+The output datasets of the live generation pipeline: the combined generation dataset, stored as one parquet
+partition per settlement date in "Generation_Combined", the rollups of it that dashboards query, and the
+changefeed that lets consumers follow it without reading it in full.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from pipeline_schema import GENERATION_SCHEMA, apply_schema, to_category
+from pipeline_storage import (
+    hash_partitions,
+    list_partitions,
+    write_csv_atomically,
+    write_json_atomically,
+    write_parquet_atomically,
+)
+from settlement_calendar import get_settlement_date_labels, get_settlement_period_start
+
+
+def get_generation_location(location_BMRS_Final: str) -> str:
+    """
+    Returns the folder holding the daily parquet partitions of the combined generation dataset.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        str: folder of the Generation_Combined partitions.
+    """
+    return os.path.join(location_BMRS_Final, "Generation_Combined")
+
+
+def write_generation_partition(df_partition: pd.DataFrame, location_generation: str, settlement_date: str) -> bool:
+    """
+    Writes the combined generation data of a single settlement date to its parquet partition, with the
+    types of GENERATION_SCHEMA. The partition is not rewritten if its data has not changed.
+
+    Args:
+        df_partition (pd.DataFrame): combined generation data of one settlement date.
+        location_generation (str): folder of the Generation_Combined partitions.
+        settlement_date (str): settlement date of the partition in YYYY-MM-DD format.
+
+    Returns:
+        bool: True if the partition was written.
+    """
+    df_partition = apply_schema(df_partition.reset_index(drop=True), GENERATION_SCHEMA)
+
+    path = os.path.join(location_generation, f"Generation_Combined_{settlement_date}.parquet")
+    if os.path.isfile(path) and pd.read_parquet(path).equals(df_partition):
+        return False
+
+    write_parquet_atomically(df_partition, path)
+    return True
+
+
+def remove_generation_partitions(location_generation: str, keep_dates: set) -> list:
+    """
+    Deletes the Generation_Combined partitions of settlement dates that are no longer in the dataset.
+
+    Args:
+        location_generation (str): folder of the Generation_Combined partitions.
+        keep_dates (set): settlement dates (YYYY-MM-DD) of the partitions to keep.
+
+    Returns:
+        list: settlement dates (YYYY-MM-DD) of the partitions that were deleted.
+    """
+    removed_partitions = []
+    for settlement_date, path in list_partitions(location_generation, "Generation_Combined").items():
+        if settlement_date not in keep_dates:
+            os.remove(path)
+            removed_partitions.append(settlement_date)
+
+    return removed_partitions
+
+
+def write_generation_data(df_generation: pd.DataFrame, location_BMRS_Final: str, write_csv: bool = False) -> list:
+    """
+    Writes the combined generation dataset as one parquet file per settlement date (see
+    write_generation_partition). Partitions of settlement dates no longer in the dataset are deleted.
+    Optionally, the dataset is also written to "Generation_Combined.csv".
+
+    Args:
+        df_generation (pd.DataFrame): the final combined generation dataset.
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        write_csv (bool, optional): also write the dataset in CSV format. Defaults to False.
+
+    Returns:
+        list: settlement dates (YYYY-MM-DD) of the partitions that were written.
+    """
+    location_generation = get_generation_location(location_BMRS_Final)
+    os.makedirs(location_generation, exist_ok=True)
+
+    df_generation = apply_schema(df_generation.reset_index(drop=True), GENERATION_SCHEMA)
+    partition_dates = get_settlement_date_labels(df_generation["settlementDate"])
+
+    updated_partitions = []
+    for settlement_date, df_partition in df_generation.groupby(partition_dates):
+        if write_generation_partition(df_partition, location_generation, settlement_date):
+            updated_partitions.append(settlement_date)
+
+    remove_generation_partitions(location_generation, set(partition_dates))
+
+    if write_csv:
+        write_csv_atomically(df_generation, os.path.join(location_BMRS_Final, "Generation_Combined.csv"))
+
+    return updated_partitions
+
+
+def read_generation_data(location_BMRS_Final: str, start_datetime: pd.Timestamp = None) -> pd.DataFrame:
+    """
+    Reads the combined generation dataset. Only the partitions that can contain data after start_datetime are
+    opened, and rows up to start_datetime are filtered out while reading the parquet files. If the dataset has
+    not been written in parquet format yet, "Generation_Combined.csv" is read instead.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        start_datetime (pd.Timestamp, optional): only return rows with a later localDateTime. Defaults to None.
+
+    Returns:
+        pd.DataFrame: the combined generation dataset, or an empty dataframe if none exists.
+    """
+    partitions = list_partitions(get_generation_location(location_BMRS_Final), "Generation_Combined")
+
+    if not partitions:
+        if not os.path.isfile(os.path.join(location_BMRS_Final, "Generation_Combined.csv")):
+            return pd.DataFrame()
+
+        df_generation = pd.read_csv(
+            os.path.join(location_BMRS_Final, "Generation_Combined.csv"), header=0, index_col=None
+        )
+        df_generation = apply_schema(df_generation, GENERATION_SCHEMA)
+        if start_datetime is not None:
+            df_generation = df_generation.loc[df_generation["localDateTime"] > start_datetime]
+        return df_generation
+
+    filters = None
+    if start_datetime is not None:
+        # A settlement date covers local times from the evening before to the end of the day
+        first_date = (pd.Timestamp(start_datetime) - timedelta(days=1)).strftime("%Y-%m-%d")
+        partitions = {date: path for date, path in partitions.items() if date >= first_date}
+        filters = [("localDateTime", ">", pd.Timestamp(start_datetime))]
+
+    df_generation = pd.concat(
+        [pd.read_parquet(path, filters=filters) for path in partitions.values()], ignore_index=True
+    )
+
+    return apply_schema(df_generation, GENERATION_SCHEMA)
+
+
+# Rollups of the combined generation dataset (see update_generation_rollups): the columns each one is grouped by,
+# besides the settlement period or date
+GENERATION_ROLLUPS = {
+    "fuel": ["fuel"],
+    "lowCarbonGeneration": ["lowCarbonGeneration"],
+    "renewableGeneration": ["renewableGeneration"],
+    "station": ["dictionaryID", "commonName", "longitude", "latitude"],
+}
+ROLLUP_PERIODS = {
+    "settlement_period": ["localDateTime", "settlementDate", "settlementPeriod"],
+    "daily": ["settlementDate"],
+}
+
+
+def get_rollup_location(location_BMRS_Final: str) -> str:
+    """
+    Returns the folder holding the rollups of the combined generation dataset.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        str: folder of the rollups.
+    """
+    return os.path.join(location_BMRS_Final, "Rollups")
+
+
+def calculate_generation_rollups(df_generation: pd.DataFrame) -> dict:
+    """
+    Sums the generation of the BMUs by fuel type, low carbon/renewable flag and station (Power Station Dictionary
+    ID), per settlement period and per settlement date.
+
+    Args:
+        df_generation (pd.DataFrame): combined generation data, e.g. some partitions of the output dataset.
+
+    Returns:
+        dict: rollups by name ("<rollup>_<period>", e.g. "fuel_daily"), each with the total quantity and number
+        of BMUs of every group.
+    """
+    df_generation = df_generation.assign(quantity=df_generation["quantity"].astype("float64"))
+
+    rollups = {}
+    for period, period_columns in ROLLUP_PERIODS.items():
+        for name, columns in GENERATION_ROLLUPS.items():
+            rollups[f"{name}_{period}"] = (
+                df_generation.groupby(period_columns + columns, observed=True)
+                .agg(quantity=("quantity", "sum"), BMUs=("BMUnitID", "nunique"))
+                .reset_index()
+            )
+
+    return rollups
+
+
+def update_generation_rollups(location_BMRS_Final: str, write_csv: bool = False) -> list:
+    """
+    Keeps the rollups of the combined generation dataset (see calculate_generation_rollups) up to date, as one
+    parquet file per rollup in the "Rollups" folder (e.g. "Generation_Rollup_fuel_settlement_period.parquet"),
+    so that dashboards don't need to scan the whole dataset.
+
+    The rollups are updated incrementally: a hash of every Generation_Combined partition is recorded in
+    "rollup_partitions.json", and only the settlement dates whose partition has changed (or been deleted) since
+    are recalculated.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        write_csv (bool, optional): also write the rollups in CSV format. Defaults to False.
+
+    Returns:
+        list: settlement dates (YYYY-MM-DD) that were recalculated.
+    """
+    location_rollups = get_rollup_location(location_BMRS_Final)
+    os.makedirs(location_rollups, exist_ok=True)
+    path_partitions = os.path.join(location_rollups, "rollup_partitions.json")
+    paths = {
+        f"{name}_{period}": os.path.join(location_rollups, f"Generation_Rollup_{name}_{period}.parquet")
+        for period in ROLLUP_PERIODS
+        for name in GENERATION_ROLLUPS
+    }
+
+    partitions = list_partitions(get_generation_location(location_BMRS_Final), "Generation_Combined")
+    versions = hash_partitions(partitions)
+
+    previous_versions = {}
+    if os.path.isfile(path_partitions) and all(os.path.isfile(path) for path in paths.values()):
+        with open(path_partitions) as f:
+            previous_versions = json.load(f)
+
+    changed_dates = sorted(
+        settlement_date
+        for settlement_date in set(versions) | set(previous_versions)
+        if versions.get(settlement_date) != previous_versions.get(settlement_date)
+    )
+    if not changed_dates:
+        return []
+
+    df_changed = pd.concat(
+        [
+            pd.read_parquet(partitions[settlement_date])
+            for settlement_date in changed_dates
+            if settlement_date in versions
+        ]
+        + [pd.DataFrame(columns=list(GENERATION_SCHEMA))],
+        ignore_index=True,
+    )
+    rollups = calculate_generation_rollups(apply_schema(df_changed, GENERATION_SCHEMA))
+
+    for name, df_rollup in rollups.items():
+        if previous_versions:
+            df_previous = pd.read_parquet(paths[name])
+            df_previous = df_previous.loc[~df_previous["settlementDate"].isin(pd.to_datetime(changed_dates, utc=True))]
+            df_rollup = pd.concat((df_previous, df_rollup), ignore_index=True)
+
+        keys = [column for column in df_rollup.columns if column not in ["quantity", "BMUs"]]
+        df_rollup = apply_schema(df_rollup, {column: GENERATION_SCHEMA[column] for column in keys})
+        df_rollup = df_rollup.sort_values(keys, kind="stable").reset_index(drop=True)
+        df_rollup["BMUs"] = df_rollup["BMUs"].astype("int32")
+
+        write_parquet_atomically(df_rollup, paths[name])
+        if write_csv:
+            write_csv_atomically(df_rollup, paths[name].replace(".parquet", ".csv"))
+
+    write_json_atomically(versions, path_partitions, indent=2)
+
+    return changed_dates
+
+
+# Columns identifying a row of the combined generation dataset in the changefeed (see update_changefeed)
+CHANGEFEED_KEY_COLUMNS = ["settlementDate", "settlementPeriod", "BMUnitID"]
+# Columns of the daily partitions of the changefeed state, whose settlement date is in the file name
+CHANGEFEED_STATE_COLUMNS = ["settlementPeriod", "BMUnitID", "rowHash"]
+CHANGEFEED_OPERATIONS = ["insert", "update", "delete"]
+# Deleted rows only have their keys and localDateTime, hence the nullable integer type
+CHANGEFEED_SCHEMA = {**GENERATION_SCHEMA, "dictionaryID": "Int32"}
+# Number of change files after which the dataset is compacted into a new snapshot, a day of half-hourly runs
+CHANGEFEED_COMPACTION_INTERVAL = 48
+
+
+def get_changefeed_location(location_BMRS_Final: str) -> str:
+    """
+    Returns the folder holding the changefeed of the combined generation dataset.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        str: folder of the changefeed.
+    """
+    return os.path.join(location_BMRS_Final, "Changefeed")
+
+
+def read_changefeed_manifest(location_BMRS_Final: str) -> dict:
+    """
+    Reads the manifest of the changefeed (see update_changefeed).
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        dict: the manifest, or None if the changefeed has not been published yet.
+    """
+    path = os.path.join(get_changefeed_location(location_BMRS_Final), "changefeed.json")
+    if not os.path.isfile(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_changefeed_state_location(location_BMRS_Final: str) -> str:
+    """
+    Returns the folder holding the state of the changefeed: the keys and row hashes of the combined generation
+    dataset as last published, as one "Changefeed_State_<YYYY-MM-DD>.parquet" partition per settlement date.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        str: folder of the changefeed state.
+    """
+    return os.path.join(get_changefeed_location(location_BMRS_Final), "State")
+
+
+def read_changefeed_state(location_BMRS_Final: str, settlement_dates: list) -> pd.DataFrame:
+    """
+    Reads the changefeed state of some settlement dates (see get_changefeed_state_location). The settlement date
+    and localDateTime of each row, needed to publish its deletion, are restored from the partition name and the
+    settlement calendar.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        settlement_dates (list): settlement dates (YYYY-MM-DD) to read, those without a partition are skipped.
+
+    Returns:
+        pd.DataFrame: localDateTime, CHANGEFEED_KEY_COLUMNS and rowHash of the rows, with the types of
+        GENERATION_SCHEMA.
+    """
+    partitions = list_partitions(get_changefeed_state_location(location_BMRS_Final), "Changefeed_State")
+    df_state = pd.concat(
+        [
+            pd.read_parquet(partitions[settlement_date]).assign(settlementDate=pd.Timestamp(settlement_date, tz="UTC"))
+            for settlement_date in settlement_dates
+            if settlement_date in partitions
+        ]
+        + [pd.DataFrame(columns=CHANGEFEED_KEY_COLUMNS + ["rowHash"])],
+        ignore_index=True,
+    )
+    df_state = apply_schema(df_state, {column: GENERATION_SCHEMA[column] for column in CHANGEFEED_KEY_COLUMNS})
+    df_state["rowHash"] = df_state["rowHash"].astype("uint64")
+    df_state.insert(
+        0, "localDateTime", get_settlement_period_start(df_state["settlementDate"], df_state["settlementPeriod"])
+    )
+
+    return df_state
+
+
+def write_changefeed_state(df_generation: pd.DataFrame, location_BMRS_Final: str, settlement_dates: list):
+    """
+    Writes the changefeed state of some settlement dates (see get_changefeed_state_location), so that each run
+    only rewrites the partitions of the settlement dates that have changed. The partitions of the settlement dates
+    without rows are deleted.
+
+    Args:
+        df_generation (pd.DataFrame): combined generation data of the settlement dates, with their row hashes
+                                      (rowHash).
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        settlement_dates (list): settlement dates (YYYY-MM-DD) to write.
+    """
+    location_state = get_changefeed_state_location(location_BMRS_Final)
+    os.makedirs(location_state, exist_ok=True)
+
+    df_generation = df_generation.sort_values(CHANGEFEED_KEY_COLUMNS, kind="stable")
+    labels = get_settlement_date_labels(df_generation["settlementDate"])
+    for settlement_date in settlement_dates:
+        path = os.path.join(location_state, f"Changefeed_State_{settlement_date}.parquet")
+        df_partition = df_generation.loc[labels == settlement_date, CHANGEFEED_STATE_COLUMNS]
+        if df_partition.empty:
+            if os.path.isfile(path):
+                os.remove(path)
+            continue
+
+        df_partition = df_partition.assign(BMUnitID=to_category(df_partition["BMUnitID"].astype(str)))
+        write_parquet_atomically(df_partition, path)
+
+
+def hash_generation_rows(df_generation: pd.DataFrame) -> np.ndarray:
+    """
+    Hashes every row of the combined generation dataset, to find the rows that have changed since an earlier run.
+
+    Args:
+        df_generation (pd.DataFrame): combined generation data with the types of GENERATION_SCHEMA.
+
+    Returns:
+        np.ndarray: uint64 hash of each row.
+    """
+    return pd.util.hash_pandas_object(df_generation[list(GENERATION_SCHEMA)], index=False).to_numpy()
+
+
+def find_generation_changes(df_state: pd.DataFrame, df_generation: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compares the rows of the combined generation dataset with their previous version, by the settlement date,
+    settlement period and BMU of each row.
+
+    Args:
+        df_state (pd.DataFrame): keys and row hashes of the previous version, from read_changefeed_state.
+        df_generation (pd.DataFrame): combined generation data of the same settlement dates, with the types of
+                                      GENERATION_SCHEMA and their row hashes (rowHash).
+
+    Returns:
+        pd.DataFrame: the inserted and updated rows, and the keys and localDateTime of the deleted rows, with the
+        operation of each row, ordered by settlement date, settlement period and BMU.
+    """
+    df_keys = df_generation[CHANGEFEED_KEY_COLUMNS + ["rowHash"]].assign(
+        BMUnitID=df_generation["BMUnitID"].astype(str), position=np.arange(len(df_generation))
+    )
+    df_previous_keys = df_state[CHANGEFEED_KEY_COLUMNS + ["rowHash"]].assign(
+        BMUnitID=df_state["BMUnitID"].astype(str), previous_position=np.arange(len(df_state))
+    )
+    df_merged = df_keys.merge(
+        df_previous_keys, on=CHANGEFEED_KEY_COLUMNS, how="outer", suffixes=("", "_previous"), indicator=True
+    )
+
+    inserted = df_merged["_merge"] == "left_only"
+    updated = (df_merged["_merge"] == "both") & (df_merged["rowHash"] != df_merged["rowHash_previous"])
+    deleted = df_merged["_merge"] == "right_only"
+
+    df_changes = pd.concat(
+        (
+            df_generation.iloc[df_merged.loc[inserted, "position"].astype("int64")].assign(operation="insert"),
+            df_generation.iloc[df_merged.loc[updated, "position"].astype("int64")].assign(operation="update"),
+            df_state.iloc[df_merged.loc[deleted, "previous_position"].astype("int64")].assign(operation="delete"),
+            pd.DataFrame(columns=list(GENERATION_SCHEMA) + ["operation"]),
+        ),
+        ignore_index=True,
+    )[list(GENERATION_SCHEMA) + ["operation"]]
+    df_changes = apply_schema(df_changes, CHANGEFEED_SCHEMA)
+    df_changes["operation"] = df_changes["operation"].astype(pd.CategoricalDtype(CHANGEFEED_OPERATIONS))
+
+    return df_changes.sort_values(CHANGEFEED_KEY_COLUMNS, kind="stable").reset_index(drop=True)
+
+
+def update_changefeed(
+    location_BMRS_Final: str, now: pd.Timestamp = None, compaction_interval: int = CHANGEFEED_COMPACTION_INTERVAL
+) -> int:
+    """
+    Publishes the changes of the combined generation dataset since the previous run, so that consumers can apply
+    them to their copy instead of downloading the whole dataset again. The "Changefeed" folder contains:
+    * "Generation_Changes_<sequence>.parquet": the rows that were inserted, updated or deleted by a run, by
+      settlement date, settlement period and BMU, with the operation and the sequence number of the run. A run
+      that doesn't change the dataset doesn't get a sequence number.
+    * "Generation_Snapshot_<sequence>.parquet": the whole dataset after the run with that sequence number. Every
+      compaction_interval change files, the dataset is compacted into a new snapshot, and the change files up to
+      the previous snapshot are deleted.
+    * "changefeed.json": the latest sequence number, the snapshot, the change files with the number of rows of
+      each operation, and the lowest sequence number a consumer can still catch up from with the change files.
+
+    As for the rollups (see update_generation_rollups), only the settlement dates whose Generation_Combined
+    partition has changed since the previous run are compared, against the keys and hash of every row of their
+    previous version (see get_changefeed_state_location). Only the state of these settlement dates is rewritten.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        now (pd.Timestamp, optional): time of the run. Defaults to the current time.
+        compaction_interval (int, optional): number of change files between snapshots. Defaults to
+                                             CHANGEFEED_COMPACTION_INTERVAL.
+
+    Returns:
+        int: sequence number of the run, or None if the dataset has not changed.
+    """
+    location_changefeed = get_changefeed_location(location_BMRS_Final)
+    os.makedirs(location_changefeed, exist_ok=True)
+    now = datetime.now(timezone.utc) if now is None else now
+
+    path_single_state = os.path.join(location_changefeed, "changefeed_state.parquet")
+    if os.path.isfile(path_single_state):
+        # State written as a single file, before the daily partitions
+        df_state = pd.read_parquet(path_single_state)
+        state_dates = sorted(set(get_settlement_date_labels(df_state["settlementDate"])))
+        write_changefeed_state(df_state, location_BMRS_Final, state_dates)
+        os.remove(path_single_state)
+
+    partitions = list_partitions(get_generation_location(location_BMRS_Final), "Generation_Combined")
+    versions = hash_partitions(partitions)
+
+    manifest = read_changefeed_manifest(location_BMRS_Final)
+    if manifest is None or not os.path.isdir(get_changefeed_state_location(location_BMRS_Final)):
+        # The first run publishes the dataset as a snapshot rather than as inserts
+        manifest = {"sequence": 0, "min_sequence": 0, "snapshot_sequence": None, "snapshot": None, "changes": []}
+        changed_dates = []
+    else:
+        changed_dates = sorted(
+            settlement_date
+            for settlement_date in set(versions) | set(manifest["partitions"])
+            if versions.get(settlement_date) != manifest["partitions"].get(settlement_date)
+        )
+
+    sequence = None
+    if changed_dates:
+        df_state = read_changefeed_state(location_BMRS_Final, changed_dates)
+        df_generation = pd.concat(
+            [
+                pd.read_parquet(partitions[settlement_date])
+                for settlement_date in changed_dates
+                if settlement_date in versions
+            ]
+            + [pd.DataFrame(columns=list(GENERATION_SCHEMA))],
+            ignore_index=True,
+        )
+        df_generation = apply_schema(df_generation, GENERATION_SCHEMA)
+        df_generation["rowHash"] = hash_generation_rows(df_generation)
+
+        df_changes = find_generation_changes(df_state, df_generation)
+
+        if len(df_changes):
+            sequence = manifest["sequence"] + 1
+            file_name = f"Generation_Changes_{sequence:08d}.parquet"
+            df_changes.insert(0, "sequence", np.int64(sequence))
+            write_parquet_atomically(df_changes, os.path.join(location_changefeed, file_name))
+
+            manifest["sequence"] = sequence
+            manifest["changes"].append(
+                {
+                    "sequence": sequence,
+                    "file": file_name,
+                    "published": pd.Timestamp(now).isoformat(),
+                    **{
+                        operation: int((df_changes["operation"] == operation).sum())
+                        for operation in CHANGEFEED_OPERATIONS
+                    },
+                }
+            )
+
+        write_changefeed_state(df_generation, location_BMRS_Final, changed_dates)
+
+    previous_snapshot = manifest["snapshot_sequence"]
+    if previous_snapshot is None or manifest["sequence"] - previous_snapshot >= compaction_interval:
+        df_snapshot = read_generation_data(location_BMRS_Final)
+        df_snapshot = apply_schema(
+            pd.concat((df_snapshot, pd.DataFrame(columns=list(GENERATION_SCHEMA))), ignore_index=True),
+            GENERATION_SCHEMA,
+        )
+        file_name = f"Generation_Snapshot_{manifest['sequence']:08d}.parquet"
+        write_parquet_atomically(df_snapshot, os.path.join(location_changefeed, file_name))
+
+        if previous_snapshot is None:
+            # Later compactions find the state up to date
+            df_snapshot = df_snapshot.assign(rowHash=hash_generation_rows(df_snapshot))
+            write_changefeed_state(df_snapshot, location_BMRS_Final, list(versions))
+
+        # The change files since the previous snapshot are kept, for the consumers that are less than one
+        # compaction interval behind
+        min_sequence = manifest["sequence"] if previous_snapshot is None else previous_snapshot
+        manifest["changes"] = [change for change in manifest["changes"] if change["sequence"] > min_sequence]
+        manifest.update(min_sequence=min_sequence, snapshot_sequence=manifest["sequence"], snapshot=file_name)
+
+        keep_files = {file_name} | {change["file"] for change in manifest["changes"]}
+        for old_file in os.listdir(location_changefeed):
+            if old_file.startswith(("Generation_Changes_", "Generation_Snapshot_")) and old_file not in keep_files:
+                os.remove(os.path.join(location_changefeed, old_file))
+
+    manifest["partitions"] = versions
+    write_json_atomically(manifest, os.path.join(location_changefeed, "changefeed.json"), indent=2)
+
+    return sequence
+
+
+def read_changefeed_snapshot(location_BMRS_Final: str) -> tuple:
+    """
+    Reads the latest snapshot of the changefeed (see update_changefeed).
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        tuple: the snapshot and its sequence number.
+    """
+    manifest = read_changefeed_manifest(location_BMRS_Final)
+    if manifest is None:
+        raise FileNotFoundError(f"No changefeed in {get_changefeed_location(location_BMRS_Final)}")
+
+    path = os.path.join(get_changefeed_location(location_BMRS_Final), manifest["snapshot"])
+    return apply_schema(pd.read_parquet(path), GENERATION_SCHEMA), manifest["snapshot_sequence"]
+
+
+def read_changes(location_BMRS_Final: str, since_sequence: int) -> pd.DataFrame:
+    """
+    Reads the changes published by the changefeed after a sequence number (see update_changefeed).
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        since_sequence (int): sequence number of the consumer's copy of the dataset.
+
+    Returns:
+        pd.DataFrame: the changes of the runs with a later sequence number, in sequence order.
+    """
+    manifest = read_changefeed_manifest(location_BMRS_Final)
+    if manifest is None:
+        raise FileNotFoundError(f"No changefeed in {get_changefeed_location(location_BMRS_Final)}")
+    if since_sequence < manifest["min_sequence"]:
+        raise ValueError(
+            f"The changes after sequence {since_sequence} have been compacted, read the snapshot of sequence "
+            f"{manifest['snapshot_sequence']} instead"
+        )
+
+    df_changes = pd.concat(
+        [
+            pd.read_parquet(os.path.join(get_changefeed_location(location_BMRS_Final), change["file"]))
+            for change in manifest["changes"]
+            if change["sequence"] > since_sequence
+        ]
+        + [pd.DataFrame(columns=["sequence"] + list(GENERATION_SCHEMA) + ["operation"])],
+        ignore_index=True,
+    )
+    df_changes = apply_schema(df_changes, CHANGEFEED_SCHEMA)
+    df_changes["sequence"] = df_changes["sequence"].astype("int64")
+    df_changes["operation"] = df_changes["operation"].astype(pd.CategoricalDtype(CHANGEFEED_OPERATIONS))
+
+    return df_changes
+
+
+def apply_changes(df_generation: pd.DataFrame, df_changes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Applies the changes from read_changes to a copy of the combined generation dataset, e.g. a snapshot. Only the
+    latest change of every settlement date, settlement period and BMU is applied.
+
+    Args:
+        df_generation (pd.DataFrame): combined generation dataset.
+        df_changes (pd.DataFrame): changes from read_changes.
+
+    Returns:
+        pd.DataFrame: the updated dataset, ordered by settlement date, settlement period and BMU.
+    """
+    df_changes = df_changes.sort_values("sequence", kind="stable")
+    changed_keys = df_changes[CHANGEFEED_KEY_COLUMNS].astype({"BMUnitID": str}).drop_duplicates(keep="last")
+    df_changes = df_changes.loc[changed_keys.index]
+
+    unchanged = ~pd.MultiIndex.from_frame(df_generation[CHANGEFEED_KEY_COLUMNS].astype({"BMUnitID": str})).isin(
+        pd.MultiIndex.from_frame(changed_keys)
+    )
+    df_generation = pd.concat(
+        (
+            df_generation.loc[unchanged, list(GENERATION_SCHEMA)],
+            df_changes.loc[df_changes["operation"] != "delete", list(GENERATION_SCHEMA)],
+        ),
+        ignore_index=True,
+    )
+
+    df_generation = apply_schema(df_generation, GENERATION_SCHEMA)
+    return df_generation.sort_values(CHANGEFEED_KEY_COLUMNS, kind="stable").reset_index(drop=True)
@@ -0,0 +1,380 @@
+"""
+Query service over the latest combined generation dataset. A GenerationStore keeps the dataset in memory, ordered
+by time and indexed by BMU, station (Power Station Dictionary ID) and fuel type, and follows the changefeed of the
+pipeline (see generation_outputs.update_changefeed): when a run publishes new changes, only those are read and applied
+to the data in memory. A small HTTP server from the standard library answers point and range queries from the
+indexes in JSON, without reading the output files:
+
+    python pipeline_cli.py serve [--port 8050]
+
+    GET /status                                   sequence number, number of rows and time span of the data
+    GET /bmu/<BMUnitID>?start=<time>&end=<time>   generation of a BMU
+    GET /station/<dictionaryID>?start=...         generation of the BMUs of a station, and their total
+    GET /fuel/<fuel>?start=...                    total generation of a fuel type, e.g. /fuel/Wind
+    GET /latest?by=fuel                           totals of the latest settlement period by fuel, station or BMU
+
+The range includes start and excludes end, by localDateTime (the start of the settlement period in UTC), in ISO
+8601 format, e.g. "2024-06-01T12:00Z". Without start and end, the latest settlement period of the dataset is
+returned. The quantities are those of the dataset.
+"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+import pandas as pd
+
+import generation_outputs
+import pipeline_schema
+import pipeline_storage
+
+RELOAD_INTERVAL_SECONDS = 10
+
+# Columns of the dataset that the service can be queried by, with the name used in the URL
+INDEX_COLUMNS = {"bmu": "BMUnitID", "station": "dictionaryID", "fuel": "fuel"}
+PERIOD_COLUMNS = ["localDateTime", "settlementDate", "settlementPeriod"]
+BMU_COLUMNS = ["BMUnitID", "dictionaryID", "commonName", "fuel", "longitude", "latitude"]
+
+
+class GenerationIndex:
+    """
+    The combined generation dataset ordered by localDateTime, with the positions of the rows of every BMU, station
+    and fuel type. As the rows are in time order, the rows of a group in a time range are found by a binary search
+    of its positions. An index is not changed once built, so that queries can read it while the next one is built.
+
+    Args:
+        df_generation (pd.DataFrame): combined generation dataset with the types of GENERATION_SCHEMA.
+        sequence (int): sequence number of the changefeed the dataset is at, None if it was read from the
+                        Generation_Combined partitions.
+    """
+
+    def __init__(self, df_generation: pd.DataFrame, sequence: int = None):
+        df_generation = df_generation.sort_values(
+            ["localDateTime", "BMUnitID"], kind="stable", ignore_index=True
+        ).assign(quantity=lambda df: df["quantity"].astype("float64"))
+        self.df_generation = df_generation
+        self.sequence = sequence
+        self.times = df_generation["localDateTime"].to_numpy("datetime64[ns]").view("int64")
+        self.groups = {
+            column: {
+                self.normalise_key(column, key): positions
+                for key, positions in df_generation.groupby(column, observed=True, sort=False).indices.items()
+            }
+            for column in INDEX_COLUMNS.values()
+        }
+
+    @staticmethod
+    def normalise_key(column: str, key) -> object:
+        """
+        Returns the key of a group as looked up from a URL: fuel types are case-insensitive, station IDs integers
+        and BMU IDs strings.
+
+        Args:
+            column (str): indexed column, see INDEX_COLUMNS.
+            key: value of the column, or the value from the URL.
+
+        Returns:
+            object: key of the group.
+        """
+        if column == "dictionaryID":
+            return int(key)
+        if column == "fuel":
+            return str(key).lower()
+        return str(key)
+
+    def get_time_range(self, start: pd.Timestamp = None, end: pd.Timestamp = None) -> tuple:
+        """
+        Returns a time range as int64 nanoseconds, by default the latest settlement period of the dataset.
+
+        Args:
+            start (pd.Timestamp, optional): start of the range (included). Defaults to None.
+            end (pd.Timestamp, optional): end of the range (excluded). Defaults to None.
+
+        Returns:
+            tuple: start and end of the range.
+        """
+        if start is None and end is None:
+            latest = self.times[-1] if len(self.times) else 0
+            return latest, latest + 1
+
+        start = np.iinfo("int64").min if start is None else pd.Timestamp(start).value
+        end = np.iinfo("int64").max if end is None else pd.Timestamp(end).value
+        return start, end
+
+    def select(self, column: str, key, start: pd.Timestamp = None, end: pd.Timestamp = None) -> pd.DataFrame:
+        """
+        Returns the rows of a BMU, station or fuel type in a time range.
+
+        Args:
+            column (str): indexed column, see INDEX_COLUMNS.
+            key: BMU ID, station ID or fuel type.
+            start (pd.Timestamp, optional): start of the range (included). Defaults to the latest settlement period.
+            end (pd.Timestamp, optional): end of the range (excluded). Defaults to the latest settlement period.
+
+        Returns:
+            pd.DataFrame: the rows in time order, None if there is no such BMU, station or fuel type.
+        """
+        positions = self.groups[column].get(self.normalise_key(column, key))
+        if positions is None:
+            return None
+
+        start, end = self.get_time_range(start, end)
+        first, last = np.searchsorted(self.times[positions], [start, end])
+        return self.df_generation.iloc[positions[first:last]]
+
+    def select_time_range(self, start: pd.Timestamp = None, end: pd.Timestamp = None) -> pd.DataFrame:
+        """
+        Returns all rows in a time range.
+
+        Args:
+            start (pd.Timestamp, optional): start of the range (included). Defaults to the latest settlement period.
+            end (pd.Timestamp, optional): end of the range (excluded). Defaults to the latest settlement period.
+
+        Returns:
+            pd.DataFrame: the rows in time order.
+        """
+        first, last = np.searchsorted(self.times, self.get_time_range(start, end))
+        return self.df_generation.iloc[first:last]
+
+
+def sum_by_settlement_period(df_generation: pd.DataFrame, by: list = None) -> pd.DataFrame:
+    """
+    Sums the generation of some rows of the dataset by settlement period and optionally other columns.
+
+    Args:
+        df_generation (pd.DataFrame): rows of the dataset.
+        by (list, optional): other columns to group by. Defaults to None.
+
+    Returns:
+        pd.DataFrame: total quantity and number of BMUs by settlement period (and the other columns).
+    """
+    return (
+        df_generation.groupby(PERIOD_COLUMNS + (by or []), observed=True, sort=True)
+        .agg(quantity=("quantity", "sum"), BMUs=("BMUnitID", "nunique"))
+        .reset_index()
+    )
+
+
+class GenerationStore:
+    """
+    Keeps the latest GenerationIndex of the combined generation dataset, and reloads it when the pipeline
+    publishes. If there is a changefeed, only the change files published since the sequence number of the index
+    are read and applied, or the snapshot if the index is further behind than the change files go back.
+    Otherwise, the Generation_Combined partitions are read again when any of them has changed.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+    """
+
+    def __init__(self, location_BMRS_Final: str):
+        self.location_BMRS_Final = location_BMRS_Final
+        self.index = GenerationIndex(
+            pipeline_schema.apply_schema(
+                pd.DataFrame(columns=list(pipeline_schema.GENERATION_SCHEMA)), pipeline_schema.GENERATION_SCHEMA
+            )
+        )
+        self.partitions_version = None
+        self.reloaded = None
+        self._lock = threading.Lock()
+
+    def get_partitions_version(self) -> tuple:
+        """
+        Returns the modification times and sizes of the Generation_Combined partitions, to find out whether they
+        have changed without reading them.
+
+        Returns:
+            tuple: settlement date, modification time and size of every partition.
+        """
+        partitions = pipeline_storage.list_partitions(
+            generation_outputs.get_generation_location(self.location_BMRS_Final), "Generation_Combined"
+        )
+        return tuple(
+            (settlement_date, os.stat(path).st_mtime_ns, os.stat(path).st_size)
+            for settlement_date, path in partitions.items()
+        )
+
+    def reload(self) -> bool:
+        """
+        Brings the index up to date with the published dataset.
+
+        Returns:
+            bool: True if the index was rebuilt.
+        """
+        with self._lock:
+            manifest = generation_outputs.read_changefeed_manifest(self.location_BMRS_Final)
+            sequence = self.index.sequence
+
+            if manifest is None:
+                partitions_version = self.get_partitions_version()
+                if partitions_version == self.partitions_version:
+                    return False
+                df_generation = generation_outputs.read_generation_data(self.location_BMRS_Final)
+                if df_generation.empty:
+                    return False
+                self.partitions_version = partitions_version
+                self.index = GenerationIndex(df_generation)
+            elif sequence == manifest["sequence"]:
+                return False
+            elif sequence is not None and manifest["min_sequence"] <= sequence < manifest["sequence"]:
+                df_changes = generation_outputs.read_changes(self.location_BMRS_Final, sequence)
+                df_generation = generation_outputs.apply_changes(self.index.df_generation, df_changes)
+                self.index = GenerationIndex(df_generation, manifest["sequence"])
+            else:
+                df_generation, snapshot_sequence = generation_outputs.read_changefeed_snapshot(self.location_BMRS_Final)
+                df_changes = generation_outputs.read_changes(self.location_BMRS_Final, snapshot_sequence)
+                df_generation = generation_outputs.apply_changes(df_generation, df_changes)
+                self.index = GenerationIndex(df_generation, manifest["sequence"])
+
+            self.reloaded = pd.Timestamp.now(tz="UTC")
+            return True
+
+    def follow(self, stop: threading.Event, reload_interval: float = RELOAD_INTERVAL_SECONDS):
+        """
+        Reloads the index every reload_interval seconds until stopped, e.g. in a background thread. A reload that
+        fails, e.g. while the pipeline is writing, is retried at the next interval.
+
+        Args:
+            stop (threading.Event): event that stops the reloads.
+            reload_interval (float, optional): seconds between reloads. Defaults to RELOAD_INTERVAL_SECONDS.
+        """
+        while not stop.wait(reload_interval):
+            try:
+                self.reload()
+            except Exception as error:
+                print(f"{pd.Timestamp.now(tz='UTC'):%Y-%m-%d %H:%M:%S} reload failed: {error!r}", flush=True)
+
+
+def to_records(df: pd.DataFrame) -> list:
+    """
+    Converts rows of the dataset to JSON serialisable records, with the times in ISO 8601 format and missing
+    values as null.
+
+    Args:
+        df (pd.DataFrame): rows of the dataset.
+
+    Returns:
+        list: one dict per row.
+    """
+    return json.loads(df.to_json(orient="records", date_format="iso", date_unit="s", double_precision=6))
+
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers the queries of the service (see the module docstring) from the GenerationStore of the server.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        try:
+            start = pd.Timestamp(query["start"]) if "start" in query else None
+            end = pd.Timestamp(query["end"]) if "end" in query else None
+            for timestamp in (start, end):
+                if timestamp is not None and timestamp.tzinfo is None:
+                    raise ValueError("start and end must include a time zone, e.g. 2024-06-01T12:00Z")
+
+            status, body = self.answer(self.server.store.index, parts, query, start, end)
+        except ValueError as error:
+            status, body = 400, {"error": str(error)}
+
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Queries are not logged, as writing a line per query to stderr would take longer than answering it
+        pass
+
+    def answer(self, index: GenerationIndex, parts: list, query: dict, start, end) -> tuple:
+        """
+        Answers a query.
+
+        Args:
+            index (GenerationIndex): the index to query.
+            parts (list): the parts of the URL path, e.g. ["bmu", "T_WBURB-43"].
+            query (dict): the query parameters.
+            start (pd.Timestamp): start of the time range, or None.
+            end (pd.Timestamp): end of the time range, or None.
+
+        Returns:
+            tuple: HTTP status and JSON serialisable body.
+        """
+        if parts == ["status"]:
+            times = index.df_generation["localDateTime"]
+            return 200, {
+                "sequence": index.sequence,
+                "rows": len(index.df_generation),
+                "first_settlement_period": times.min().isoformat() if len(times) else None,
+                "latest_settlement_period": times.max().isoformat() if len(times) else None,
+                "reloaded": self.server.store.reloaded.isoformat() if self.server.store.reloaded else None,
+            }
+
+        if parts == ["latest"]:
+            by = INDEX_COLUMNS.get(query.get("by", "fuel"))
+            if by is None:
+                raise ValueError(f"by must be one of {', '.join(INDEX_COLUMNS)}")
+            df_latest = index.select_time_range(start, end)
+            return 200, {"data": to_records(sum_by_settlement_period(df_latest, [by]))}
+
+        if len(parts) == 2 and parts[0] in INDEX_COLUMNS:
+            column = INDEX_COLUMNS[parts[0]]
+            if column == "dictionaryID" and not parts[1].lstrip("-").isdigit():
+                raise ValueError("station IDs are integers")
+            df_selected = index.select(column, parts[1], start, end)
+            if df_selected is None:
+                return 404, {"error": f"unknown {parts[0]} {parts[1]}"}
+
+            if column == "BMUnitID":
+                bmu = to_records(df_selected[BMU_COLUMNS].head(1)) or [{"BMUnitID": parts[1]}]
+                return 200, {**bmu[0], "data": to_records(df_selected[PERIOD_COLUMNS + ["quantity"]])}
+            if column == "dictionaryID":
+                return 200, {
+                    "dictionaryID": int(parts[1]),
+                    "total": to_records(sum_by_settlement_period(df_selected)),
+                    "data": to_records(df_selected[PERIOD_COLUMNS + ["BMUnitID", "quantity"]]),
+                }
+            return 200, {"fuel": parts[1], "total": to_records(sum_by_settlement_period(df_selected))}
+
+        return 404, {"error": f"unknown query {self.path}"}
+
+
+def serve(
+    location_BMRS_Final: str,
+    host: str = "127.0.0.1",
+    port: int = 8050,
+    reload_interval: float = RELOAD_INTERVAL_SECONDS,
+):
+    """
+    Loads the combined generation dataset and answers queries over HTTP until interrupted, reloading the dataset
+    in a background thread every reload_interval seconds.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        host (str, optional): address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): port to listen on. Defaults to 8050.
+        reload_interval (float, optional): seconds between reloads. Defaults to RELOAD_INTERVAL_SECONDS.
+    """
+    store = GenerationStore(location_BMRS_Final)
+    store.reload()
+
+    server = ThreadingHTTPServer((host, port), GenerationRequestHandler)
+    server.store = store
+    stop = threading.Event()
+    threading.Thread(target=store.follow, args=(stop, reload_interval), daemon=True).start()
+
+    print(f"serving {len(store.index.df_generation)} rows on http://{host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
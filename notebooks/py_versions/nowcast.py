@@ -0,0 +1,221 @@
+"""
+The nowcast: the latest generation of each BMU at a sub-half-hourly resolution for the current and next
+settlement periods, calculated from the Physical BM Data in the same way as the minutely settlement period
+generation.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from generation_calc import (
+    combine_levels,
+    convert_physical_data_to_long,
+    find_dirty_settlement_periods,
+    fingerprint_physical_data,
+    overlaps_dirty_settlement_periods,
+    resolve_FPN_MEL_level,
+    resolve_applied_bid_offer_level,
+    split_physical_data,
+)
+from pipeline_schema import B1610_SCHEMA, apply_schema
+from pipeline_storage import write_csv_atomically, write_json_atomically, write_parquet_atomically
+from psd import add_BMU_metadata
+
+
+# Resolutions of the nowcast (see update_nowcast), which must divide a settlement period, and the number of settlement
+# periods it covers from the current one
+NOWCAST_RESOLUTIONS = ["1min", "5min", "15min"]
+NOWCAST_PERIODS = 4
+
+
+def get_nowcast_location(location_BMRS_Final: str) -> str:
+    """
+    Returns the folder holding the nowcast of each resolution, with its fingerprints and metadata.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        str: folder of the nowcast.
+    """
+    return os.path.join(location_BMRS_Final, "Nowcast")
+
+
+def get_nowcast_window(now: pd.Timestamp, n_periods: int = NOWCAST_PERIODS) -> tuple:
+    """
+    Returns the time span of the nowcast: the current settlement period and the following ones.
+
+    Args:
+        now (pd.Timestamp): timezone aware time.
+        n_periods (int): number of settlement periods.
+
+    Returns:
+        tuple: start and end of the nowcast in UTC.
+    """
+    start = pd.Timestamp(now).tz_convert("UTC").floor("30min")
+
+    return start, start + n_periods * timedelta(minutes=30)
+
+
+def calculate_nowcast(
+    df_fpn: pd.DataFrame,
+    df_mel: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    resolution: str = "5min",
+) -> pd.DataFrame:
+    """
+    Calculates the generation of each BMU at a sub-half-hourly resolution, in the same way as the minutely path
+    (see calculate_settlement_period_generation_minutely) but averaging the minutes of each interval rather than
+    of each settlement period.
+
+    Args:
+        df_fpn (pd.DataFrame): FPN dataframe from split_physical_data.
+        df_mel (pd.DataFrame): MEL dataframe from split_physical_data.
+        df_boal (pd.DataFrame): BOAL dataframe from split_physical_data.
+        start (pd.Timestamp): start of the first interval.
+        end (pd.Timestamp): end of the last interval.
+        resolution (str): length of the intervals, one of NOWCAST_RESOLUTIONS.
+
+    Returns:
+        pd.DataFrame: mean generation (quantity) by interval start (local_datetime), settlementDate,
+        settlementPeriod and bmUnitID.
+    """
+    output_columns = ["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID", "quantity"]
+    if df_fpn.empty or df_mel.empty:
+        return apply_schema(pd.DataFrame(columns=output_columns), B1610_SCHEMA)
+
+    unit_boal_resolved = resolve_applied_bid_offer_level(convert_physical_data_to_long(df_boal))
+    unit_fpn_resolved = resolve_FPN_MEL_level(convert_physical_data_to_long(df_fpn))
+    unit_mel_resolved = resolve_FPN_MEL_level(convert_physical_data_to_long(df_mel))
+
+    df_fpn_mel_boal = combine_levels(unit_fpn_resolved, unit_boal_resolved, unit_mel_resolved).reset_index()
+    df_fpn_mel_boal = df_fpn_mel_boal.loc[(df_fpn_mel_boal["Time"] >= start) & (df_fpn_mel_boal["Time"] < end)]
+    df_fpn_mel_boal = df_fpn_mel_boal.assign(local_datetime=df_fpn_mel_boal["Time"].dt.floor(resolution))
+
+    return (
+        df_fpn_mel_boal.groupby(["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID"], observed=True)[
+            "quantity"
+        ]
+        .mean()
+        .reset_index()[output_columns]
+    )
+
+
+def update_nowcast(
+    df_PHYBMDATA: pd.DataFrame,
+    df_bmu_metadata: pd.DataFrame,
+    location_BMRS_Final: str,
+    resolution: str = "5min",
+    n_periods: int = NOWCAST_PERIODS,
+    now: pd.Timestamp = None,
+    write_csv: bool = False,
+) -> pd.DataFrame:
+    """
+    Publishes the latest generation of each BMU at a sub-half-hourly resolution for the current and next
+    settlement periods (the "nowcast") to "Nowcast/Generation_Nowcast_<resolution>.parquet", with the columns of
+    the combined generation dataset. The settlement period dataset is not touched.
+
+    The nowcast is updated incrementally: as for the output dataset, the records of each BMU and settlement period
+    are fingerprinted (see find_dirty_settlement_periods), and only the intervals of the settlement periods whose
+    records have changed, or that have entered the nowcast since it was last published, are recalculated. A JSON
+    sidecar records the time span of the nowcast and when it was published.
+
+    Args:
+        df_PHYBMDATA (pd.DataFrame): Physical BM Data from setup_update_PHYBM_data.
+        df_bmu_metadata (pd.DataFrame): BMU lookup table from read_BMU_metadata.
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        resolution (str): length of the intervals, one of NOWCAST_RESOLUTIONS.
+        n_periods (int): number of settlement periods from the current one.
+        now (pd.Timestamp, optional): time of the nowcast. Defaults to the current time.
+        write_csv (bool, optional): also write the nowcast in CSV format. Defaults to False.
+
+    Returns:
+        pd.DataFrame: the nowcast, with the types of GENERATION_SCHEMA.
+    """
+    if resolution not in NOWCAST_RESOLUTIONS:
+        raise ValueError(f"Unknown resolution '{resolution}', expected one of {NOWCAST_RESOLUTIONS}")
+
+    now = datetime.now(timezone.utc) if now is None else now
+    start, end = get_nowcast_window(now, n_periods)
+
+    location_nowcast = get_nowcast_location(location_BMRS_Final)
+    os.makedirs(location_nowcast, exist_ok=True)
+    path = os.path.join(location_nowcast, f"Generation_Nowcast_{resolution}.parquet")
+    path_fingerprints = os.path.join(location_nowcast, f"Generation_Nowcast_{resolution}_fingerprints.parquet")
+    path_metadata = os.path.join(location_nowcast, f"Generation_Nowcast_{resolution}.json")
+
+    # Records of the nowcast's settlement periods and of the one before, whose levels can be held into it
+    df_PHYBMDATA = df_PHYBMDATA.loc[
+        (df_PHYBMDATA["local_datetime"] >= start - timedelta(minutes=30)) & (df_PHYBMDATA["local_datetime"] < end)
+    ]
+    df_fingerprints = fingerprint_physical_data(df_PHYBMDATA)
+
+    df_previous = None
+    if os.path.isfile(path) and os.path.isfile(path_fingerprints) and os.path.isfile(path_metadata):
+        with open(path_metadata) as f:
+            previous_end = pd.Timestamp(json.load(f)["end"])
+        df_previous = pd.read_parquet(path)
+        df_previous = df_previous.loc[(df_previous["localDateTime"] >= start) & (df_previous["localDateTime"] < end)]
+        df_dirty = find_dirty_settlement_periods(df_fingerprints, pd.read_parquet(path_fingerprints))
+
+        # The settlement periods that have entered the nowcast are recalculated as well
+        df_PHYBMDATA = df_PHYBMDATA.loc[
+            overlaps_dirty_settlement_periods(
+                df_PHYBMDATA["bmUnitID"],
+                df_PHYBMDATA["timeFrom"],
+                df_PHYBMDATA["timeTo"],
+                df_dirty,
+                margin=timedelta(minutes=30),
+            )
+            | (df_PHYBMDATA["timeTo"] >= previous_end - timedelta(minutes=30))
+        ]
+
+    df_nowcast = calculate_nowcast(*split_physical_data(df_PHYBMDATA), start, end, resolution=resolution)
+
+    if df_previous is not None:
+        period_start = df_nowcast["local_datetime"].dt.floor("30min")
+        df_nowcast = df_nowcast.loc[
+            overlaps_dirty_settlement_periods(
+                df_nowcast["bmUnitID"], period_start, period_start + timedelta(minutes=30), df_dirty
+            )
+            | (period_start >= previous_end)
+        ]
+        period_start = df_previous["localDateTime"].dt.floor("30min")
+        df_previous = df_previous.loc[
+            ~overlaps_dirty_settlement_periods(
+                df_previous["BMUnitID"], period_start, period_start + timedelta(minutes=30), df_dirty
+            )
+        ]
+        df_previous = df_previous[["localDateTime", "settlementDate", "settlementPeriod", "BMUnitID", "quantity"]]
+        df_nowcast = pd.concat(
+            (df_previous.rename(columns={"localDateTime": "local_datetime", "BMUnitID": "bmUnitID"}), df_nowcast),
+            axis=0,
+        )
+
+    # As in the output dataset, BMUs that are not generating are left out
+    df_nowcast = apply_schema(df_nowcast.loc[df_nowcast["quantity"] > 0], B1610_SCHEMA)
+    df_nowcast = df_nowcast.sort_values(["local_datetime", "bmUnitID"], kind="stable")
+    df_nowcast = add_BMU_metadata(df_nowcast, df_bmu_metadata)
+
+    write_parquet_atomically(df_nowcast, path)
+    write_parquet_atomically(df_fingerprints, path_fingerprints)
+    write_json_atomically(
+        {
+            "resolution": resolution,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "updated": pd.Timestamp(now).tz_convert("UTC").isoformat(),
+            "rows": len(df_nowcast),
+        },
+        path_metadata,
+        indent=2,
+    )
+    if write_csv:
+        write_csv_atomically(df_nowcast, os.path.join(location_nowcast, f"Generation_Nowcast_{resolution}.csv"))
+
+    return df_nowcast
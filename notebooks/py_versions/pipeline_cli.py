@@ -0,0 +1,257 @@
+"""
+Command line interface of the live generation pipeline. From "notebooks/py_versions", run
+
+    python pipeline_cli.py run
+    python pipeline_cli.py backfill --start 2024-05-01 --end 2024-05-14
+    python pipeline_cli.py psd-refresh [--force]
+    python pipeline_cli.py daemon [--mode analytic] [--n-workers 4] [--no-csv] [--nowcast 1min]
+    python pipeline_cli.py backtest --start 2024-04-01 --end 2024-06-30 [--fetch] [--mode minutely]
+    python pipeline_cli.py serve [--host 127.0.0.1] [--port 8050]
+
+"run" updates the live generation dataset (Data_Pipeline.py), "backfill" requests the B1610 data for a past date
+range and merges it into the stored B1610 dataset, and "psd-refresh" updates the merged Power Station Dictionary
+(PSD_dataprep.py) if any of its sources changed, or in any case with "--force". "daemon" updates the live generation
+dataset every half hour, keeping its state in memory between runs (pipeline_daemon.py). "backtest" replays the BM
+derived estimate for past settlement dates and compares it with the B1610 data, both kept in the backtest folder.
+"serve" answers queries over the latest output over HTTP, from memory (generation_service.py). The pipeline modules
+are only imported by the command that needs them, and the BMRS API client is only created when the API is queried,
+so that e.g. "--help" returns instantly.
+"""
+
+import argparse
+import os
+import runpy
+
+SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_script(script_name: str):
+    """
+    Runs one of the pipeline scripts, as if it was run with "python <script_name>".
+
+    Args:
+        script_name (str): file name of the script in SCRIPT_FOLDER, e.g. "Data_Pipeline.py".
+    """
+    runpy.run_path(os.path.join(SCRIPT_FOLDER, script_name), run_name="__main__")
+
+
+def backfill(start_date: str, end_date: str, osdp_folder: str):
+    """
+    Requests the B1610 data for a date range and merges it into the stored B1610 dataset
+    (see bmrs_data.backfill_B1610_data).
+
+    Args:
+        start_date (str): first settlement date, e.g. "2024-05-01".
+        end_date (str): end of the date range, e.g. "2024-05-14".
+        osdp_folder (str): the top level directory of the data.
+    """
+    import pandas as pd
+
+    import bmrs_data
+    import pipeline_fns as plfns
+
+    (
+        location,
+        location_BMRS,
+        location_BMRS_PHYBMDATA,
+        location_BMRS_B1610,
+        location_BMRS_Final,
+    ) = plfns.create_folder_structure(osdp_folder=osdp_folder)
+    df_B1610 = bmrs_data.backfill_B1610_data(
+        location_BMRS_B1610,
+        pd.to_datetime(start_date, utc=True),
+        pd.to_datetime(end_date, utc=True),
+        cache_location=os.path.join(location_BMRS, "cache"),
+    )
+    print(
+        f"B1610 data from {df_B1610['settlementDate'].min():%Y-%m-%d} to {df_B1610['settlementDate'].max():%Y-%m-%d}"
+        f" ({len(df_B1610)} rows)"
+    )
+
+
+def backtest(
+    start_date: str,
+    end_date: str,
+    osdp_folder: str,
+    mode: str = "analytic",
+    n_workers: int = 1,
+    batch_days: int = 7,
+    fetch: bool = False,
+):
+    """
+    Replays the BM derived estimate for a date range from the Physical BM Data stored in the backtest folder and
+    compares it with the B1610 data stored in the backtest folder (see backtest.run_backtest). The aligned data
+    and the error metrics by BMU and by fuel are written to the backtest folder as "backtest_<start>_<end>.parquet",
+    "backtest_<start>_<end>_bmUnitID.csv" and "backtest_<start>_<end>_fuel.csv", and printed.
+
+    Args:
+        start_date (str): first settlement date, e.g. "2024-04-01".
+        end_date (str): last settlement date, e.g. "2024-06-30".
+        osdp_folder (str): the top level directory of the data.
+        mode (str, optional): "minutely" or "analytic". Defaults to "analytic".
+        n_workers (int, optional): number of processes resolving the BMUs. Defaults to 1.
+        batch_days (int, optional): number of settlement dates replayed at a time. Defaults to 7.
+        fetch (bool, optional): first request the Physical BM Data and B1610 data of the dates that are not stored
+                                yet (see backtest.backfill_PHYBM_data and backfill_missing_B1610_data).
+                                Defaults to False.
+    """
+    import pandas as pd
+
+    import pipeline_fns as plfns
+    import psd
+    from backtest import (
+        backfill_missing_B1610_data,
+        backfill_PHYBM_data,
+        calculate_backtest_metrics,
+        get_backtest_location,
+        run_backtest,
+    )
+
+    (
+        location,
+        location_BMRS,
+        location_BMRS_PHYBMDATA,
+        location_BMRS_B1610,
+        location_BMRS_Final,
+    ) = plfns.create_folder_structure(osdp_folder=osdp_folder)
+    location_backtest = get_backtest_location(location_BMRS)
+    location_backtest_PHYBMDATA = os.path.join(location_backtest, "PHYBMDATA")
+    location_backtest_B1610 = os.path.join(location_backtest, "B1610")
+    # The dates are parsed as in backfill
+    start_date, end_date = pd.to_datetime(start_date, utc=True), pd.to_datetime(end_date, utc=True)
+    if fetch:
+        cache_location = os.path.join(location_BMRS, "cache")
+        backfill_PHYBM_data(location_backtest_PHYBMDATA, start_date, end_date, cache_location=cache_location)
+        backfill_missing_B1610_data(location_backtest_B1610, start_date, end_date, cache_location=cache_location)
+
+    df_backtest = run_backtest(
+        location_backtest_PHYBMDATA,
+        location_backtest_B1610,
+        psd.read_BMU_metadata(location),
+        start_date,
+        end_date,
+        mode=mode,
+        n_workers=n_workers,
+        batch_days=batch_days,
+    )
+
+    os.makedirs(location_backtest, exist_ok=True)
+    name = f"backtest_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}"
+    df_backtest.to_parquet(os.path.join(location_backtest, f"{name}.parquet"), index=False)
+    for by in ["bmUnitID", "fuel"]:
+        df_metrics = calculate_backtest_metrics(df_backtest, by=by)
+        df_metrics.to_csv(os.path.join(location_backtest, f"{name}_{by}.csv"))
+
+        with pd.option_context("display.width", 200, "display.max_columns", 20, "display.max_rows", 500):
+            print(f"Error metrics by {by}:")
+            print(df_metrics.round(3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the live generation pipeline.")
+    parser.add_argument(
+        "--osdp", default=os.environ.get("OSDP"), help="top level directory of the data (default: OSDP variable)"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("run", help="update the live generation dataset (Data_Pipeline.py)")
+    parser_backfill = subparsers.add_parser("backfill", help="request and store the B1610 data for a date range")
+    parser_backfill.add_argument("--start", required=True, help="first settlement date, e.g. 2024-05-01")
+    parser_backfill.add_argument("--end", required=True, help="end of the date range, e.g. 2024-05-14")
+    parser_psd_refresh = subparsers.add_parser(
+        "psd-refresh", help="update the merged Power Station Dictionary (PSD_dataprep.py)"
+    )
+    parser_psd_refresh.add_argument(
+        "--force", action="store_true", help="download all sources again, even if they have not changed"
+    )
+    parser_daemon = subparsers.add_parser(
+        "daemon", help="update the live generation dataset every half hour, keeping the data in memory"
+    )
+    parser_daemon.add_argument("--mode", choices=["minutely", "analytic"], default="minutely")
+    parser_daemon.add_argument("--n-workers", type=int, default=1, help="number of processes resolving the BMUs")
+    parser_daemon.add_argument("--no-csv", action="store_true", help="don't write Generation_Combined.csv")
+    parser_daemon.add_argument(
+        "--publication-delay",
+        type=float,
+        default=5,
+        help="minutes after each half-hour boundary at which to run (default: 5)",
+    )
+    parser_daemon.add_argument(
+        "--nowcast", choices=["1min", "5min", "15min", "none"], default="5min", help="resolution of the nowcast"
+    )
+    parser_daemon.add_argument(
+        "--no-wind-correction", action="store_true", help="don't correct the FPN of the wind BMUs"
+    )
+    parser_daemon.add_argument("--max-runs", type=int, help="stop after this number of runs")
+    parser_backtest = subparsers.add_parser(
+        "backtest", help="compare the BM derived estimate with the B1610 data for a date range"
+    )
+    parser_backtest.add_argument("--start", required=True, help="first settlement date, e.g. 2024-04-01")
+    parser_backtest.add_argument("--end", required=True, help="last settlement date, e.g. 2024-06-30")
+    parser_backtest.add_argument("--mode", choices=["minutely", "analytic"], default="analytic")
+    parser_backtest.add_argument("--n-workers", type=int, default=1, help="number of processes resolving the BMUs")
+    parser_backtest.add_argument("--batch-days", type=int, default=7, help="settlement dates replayed at a time")
+    parser_backtest.add_argument(
+        "--fetch",
+        action="store_true",
+        help="request the Physical BM Data and B1610 data of the dates that are not stored yet",
+    )
+    parser_serve = subparsers.add_parser(
+        "serve", help="answer queries over the live generation dataset over HTTP, keeping it in memory"
+    )
+    parser_serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser_serve.add_argument("--port", type=int, default=8050, help="port to listen on (default: 8050)")
+    parser_serve.add_argument(
+        "--reload-interval", type=float, default=10, help="seconds between checks for new output (default: 10)"
+    )
+    args = parser.parse_args()
+
+    if args.osdp is None:
+        parser.error("the data directory must be given with --osdp or the OSDP environment variable")
+    # The pipeline scripts read the data directory from the OSDP environment variable
+    os.environ["OSDP"] = args.osdp
+
+    if args.command == "run":
+        run_script("Data_Pipeline.py")
+    elif args.command == "backfill":
+        backfill(args.start, args.end, args.osdp)
+    elif args.command == "psd-refresh":
+        if args.force:
+            os.environ["PSD_FORCE_REFRESH"] = "1"
+        run_script("PSD_dataprep.py")
+    elif args.command == "daemon":
+        from datetime import timedelta
+
+        import pipeline_daemon
+
+        daemon = pipeline_daemon.PipelineDaemon(
+            args.osdp,
+            mode=args.mode,
+            n_workers=args.n_workers,
+            write_csv=not args.no_csv,
+            publication_delay=timedelta(minutes=args.publication_delay),
+            nowcast_resolution=None if args.nowcast == "none" else args.nowcast,
+            correct_wind_FPN=not args.no_wind_correction,
+        )
+        daemon.run_forever(max_runs=args.max_runs)
+    elif args.command == "backtest":
+        backtest(
+            args.start,
+            args.end,
+            args.osdp,
+            mode=args.mode,
+            n_workers=args.n_workers,
+            batch_days=args.batch_days,
+            fetch=args.fetch,
+        )
+    elif args.command == "serve":
+        import generation_service
+        import pipeline_fns as plfns
+
+        location_BMRS_Final = plfns.create_folder_structure(osdp_folder=args.osdp)[4]
+        generation_service.serve(
+            location_BMRS_Final, host=args.host, port=args.port, reload_interval=args.reload_interval
+        )
+
+
+if __name__ == "__main__":
+    main()
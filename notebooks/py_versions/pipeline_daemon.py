@@ -0,0 +1,344 @@
+"""
+Resident mode of the live generation pipeline. Instead of running Data_Pipeline.py from scratch every half hour,
+a PipelineDaemon keeps the B1610 data, the Physical BM Data, their fingerprints and the last output in memory
+between runs, and wakes up on the BMRS publication cadence: the Physical BM Data of a settlement period is final
+at gate closure, one hour before the period starts, and is published shortly after, so a run is made a few
+minutes (PUBLICATION_DELAY) after every half-hour boundary. Each run only fetches and resolves the changes since
+the previous one, as Data_Pipeline.py does from the stored datasets, and writes the same output.
+
+A checkpoint of the last completed run is written alongside the output ("pipeline_checkpoint.json"), so that a
+restarted daemon does not repeat the run of the current half hour, and resumes from the stored datasets (which
+are all updated incrementally) rather than rebuilding them:
+
+    python pipeline_cli.py daemon
+"""
+
+import json
+import os
+import signal
+import threading
+import traceback
+from datetime import date, timedelta
+
+import pandas as pd
+
+import bmrs_data
+import pipeline_fns as plfns
+import pipeline_instrumentation
+import psd
+
+PUBLICATION_DELAY = timedelta(minutes=5)
+SETTLEMENT_PERIOD_LENGTH = timedelta(minutes=30)
+
+# The most recent B1610 data is ca. 6 days old, see setup_update_B1610_data
+B1610_LAG_DAYS = 6
+
+
+def get_run_slot(now: pd.Timestamp, publication_delay: timedelta = PUBLICATION_DELAY) -> pd.Timestamp:
+    """
+    Returns the scheduled run time of the half hour a time falls in, i.e. the latest half-hour boundary plus the
+    publication delay at or before the time.
+
+    Args:
+        now (pd.Timestamp): timezone aware time.
+        publication_delay (timedelta): time after a half-hour boundary at which its data is expected to be published.
+
+    Returns:
+        pd.Timestamp: scheduled run time in UTC.
+    """
+    slot = pd.Timestamp(now).tz_convert("UTC").floor(SETTLEMENT_PERIOD_LENGTH) + publication_delay
+    while slot > now:
+        slot -= SETTLEMENT_PERIOD_LENGTH
+
+    return slot
+
+
+def get_next_run_time(now: pd.Timestamp, publication_delay: timedelta = PUBLICATION_DELAY) -> pd.Timestamp:
+    """
+    Returns the first scheduled run time after a time (see get_run_slot).
+
+    Args:
+        now (pd.Timestamp): timezone aware time.
+        publication_delay (timedelta): time after a half-hour boundary at which its data is expected to be published.
+
+    Returns:
+        pd.Timestamp: next scheduled run time in UTC.
+    """
+    return get_run_slot(now, publication_delay) + SETTLEMENT_PERIOD_LENGTH
+
+
+def get_checkpoint_path(location_BMRS_Final: str) -> str:
+    """
+    Returns the path of the checkpoint of the daemon.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        str: path of "pipeline_checkpoint.json".
+    """
+    return os.path.join(location_BMRS_Final, "pipeline_checkpoint.json")
+
+
+def read_checkpoint(location_BMRS_Final: str) -> dict:
+    """
+    Reads the checkpoint of the daemon.
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        dict: checkpoint written by write_checkpoint, or an empty dict if there is none (or it can't be read).
+    """
+    try:
+        with open(get_checkpoint_path(location_BMRS_Final)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_checkpoint(checkpoint: dict, location_BMRS_Final: str):
+    """
+    Writes the checkpoint of the daemon. The file is replaced atomically, so that a daemon that is stopped while
+    writing doesn't leave a partial checkpoint behind.
+
+    Args:
+        checkpoint (dict): JSON serialisable checkpoint.
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+    """
+    path = get_checkpoint_path(location_BMRS_Final)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f, indent=2, default=str)
+    os.replace(f"{path}.tmp", path)
+
+
+class PipelineDaemon:
+    """
+    Runs the live generation pipeline every half hour, keeping its state in memory between runs (see the module
+    docstring). A run gives the same output as Data_Pipeline.py with the same settings.
+
+    Args:
+        osdp_folder (str): the top level directory of the data.
+        mode (str): "minutely" or "analytic", see calculate_settlement_period_generation.
+        n_workers (int): number of processes resolving the BMUs, see calculate_settlement_period_generation.
+        write_csv (bool): also write the output to "Generation_Combined.csv".
+        publication_delay (timedelta): time after each half-hour boundary at which to run.
+        num_days (int): see setup_update_B1610_data.
+        hist_days (int): see setup_update_B1610_data.
+        nowcast_resolution (str): resolution of the nowcast (see update_nowcast), None to not publish it.
+        correct_wind_FPN (bool): correct the FPN of the wind BMUs (see update_wind_FPN_correction).
+    """
+
+    def __init__(
+        self,
+        osdp_folder: str,
+        mode: str = "minutely",
+        n_workers: int = 1,
+        write_csv: bool = True,
+        publication_delay: timedelta = PUBLICATION_DELAY,
+        num_days: int = 14,
+        hist_days: int = 45,
+        nowcast_resolution: str = "5min",
+        correct_wind_FPN: bool = True,
+    ):
+        (
+            self.location,
+            self.location_BMRS,
+            self.location_BMRS_PHYBMDATA,
+            self.location_BMRS_B1610,
+            self.location_BMRS_Final,
+        ) = plfns.create_folder_structure(osdp_folder=osdp_folder)
+        self.location_BMRS_cache = os.path.join(self.location_BMRS, "cache")
+
+        self.mode = mode
+        self.n_workers = n_workers
+        self.write_csv = write_csv
+        self.publication_delay = publication_delay
+        self.num_days = num_days
+        self.hist_days = hist_days
+        self.nowcast_resolution = nowcast_resolution
+        self.correct_wind_FPN = correct_wind_FPN
+
+        self.checkpoint = read_checkpoint(self.location_BMRS_Final)
+        self._stop = threading.Event()
+        self.reset()
+
+    def reset(self):
+        """
+        Drops the state kept in memory, so that the next run starts from the stored datasets.
+        """
+        self.df_B1610 = None
+        self.B1610_updated_on = None
+        self.df_PHYBMDATA = None
+        self.df_fingerprints = None
+        self.df_generation = None
+        self.df_bmu_metadata = None
+        self.bmu_metadata_version = None
+
+    def update_B1610_data(self):
+        """
+        Updates the B1610 data (see setup_update_B1610_data). As the B1610 data only gets new days once a day,
+        this is skipped once the data of the latest day that can be published has been received.
+        """
+        today = date.today()
+        if (
+            self.df_B1610 is not None
+            and self.B1610_updated_on == today
+            and self.df_B1610["settlementDate"].max()
+            >= pd.to_datetime(today - timedelta(days=B1610_LAG_DAYS), utc=True)
+        ):
+            return
+
+        self.df_B1610 = bmrs_data.setup_update_B1610_data(
+            location_BMRS_B1610=self.location_BMRS_B1610,
+            num_days=self.num_days,
+            hist_days=self.hist_days,
+            cache_location=self.location_BMRS_cache,
+        )
+        self.B1610_updated_on = today
+
+    def update_BMU_metadata(self):
+        """
+        Reads the BMU lookup table (see read_BMU_metadata) on the first run, and again whenever the lookup table or
+        the merged Power Station Dictionary it is compiled from has changed, e.g. after "pipeline_cli.py psd-refresh".
+        """
+        paths = [psd.get_BMU_metadata_path(self.location), os.path.join(self.location, "merged_psd.csv")]
+        version = tuple(os.path.getmtime(path) if os.path.isfile(path) else None for path in paths)
+        if self.df_bmu_metadata is None or version != self.bmu_metadata_version:
+            self.df_bmu_metadata = psd.read_BMU_metadata(self.location)
+            # read_BMU_metadata may have just written the lookup table
+            self.bmu_metadata_version = tuple(
+                os.path.getmtime(path) if os.path.isfile(path) else None for path in paths
+            )
+
+    def run_once(self) -> pipeline_instrumentation.RunReport:
+        """
+        Makes one run of the pipeline: the steps of Data_Pipeline.py (see run_generation_stages), on the state kept in
+        memory. If the run fails, the state is dropped and the next run starts from the stored datasets.
+
+        Returns:
+            pipeline_instrumentation.RunReport: report of the run, also written to location_BMRS_Final.
+        """
+        run_report = pipeline_instrumentation.RunReport("pipeline_daemon")
+        started = pd.Timestamp.now(tz="UTC")
+        try:
+            with run_report.stage("update_B1610_data"):
+                self.update_B1610_data()
+
+            BM_start_date = pd.to_datetime(self.df_B1610["settlementDate"].max() + timedelta(days=1)).replace(
+                tzinfo=None
+            )
+            with run_report.stage("setup_update_PHYBM_data"):
+                self.df_PHYBMDATA = bmrs_data.setup_update_PHYBM_data(
+                    BM_start_date=BM_start_date,
+                    location_BMRS_PHYBMDATA=self.location_BMRS_PHYBMDATA,
+                    cache_location=self.location_BMRS_cache,
+                    df_PHYBMDATA=self.df_PHYBMDATA,
+                )
+
+            with run_report.stage("update_BMU_metadata"):
+                self.update_BMU_metadata()
+
+            # The Physical BM Data is kept in memory without the wind FPN correction, which may change between runs
+            outputs = plfns.run_generation_stages(
+                self.location_BMRS_Final,
+                self.df_B1610,
+                self.df_PHYBMDATA,
+                self.df_bmu_metadata,
+                mode=self.mode,
+                n_workers=self.n_workers,
+                write_csv=self.write_csv,
+                correct_wind_FPN=self.correct_wind_FPN,
+                nowcast_resolution=self.nowcast_resolution,
+                df_fingerprints_previous=self.df_fingerprints,
+                df_generation_previous=self.df_generation,
+                run_report=run_report,
+            )
+
+            # Only the BM derived data is needed by the next run, in the order it is read back from the partitions
+            df_generation = outputs["df_generation"]
+            df_generation = df_generation.loc[df_generation["localDateTime"] > self.df_B1610["local_datetime"].max()]
+            self.df_generation = df_generation.sort_values("settlementDate", kind="stable").reset_index(drop=True)
+            self.df_fingerprints = outputs["df_fingerprints"]
+        except Exception:
+            self.reset()
+            run_report.write(self.location_BMRS_Final, status="failed")
+            self.save_checkpoint(started, "failed")
+            raise
+
+        run_report.write(self.location_BMRS_Final)
+        self.save_checkpoint(started, "ok")
+
+        return run_report
+
+    def save_checkpoint(self, started: pd.Timestamp, status: str):
+        """
+        Records a run in the checkpoint.
+
+        Args:
+            started (pd.Timestamp): start time of the run.
+            status (str): "ok" or "failed".
+        """
+        self.checkpoint = {
+            "last_run": started.isoformat(),
+            "last_run_slot": get_run_slot(started, self.publication_delay).isoformat(),
+            "status": status,
+            "runs": self.checkpoint.get("runs", 0) + 1,
+            "failures": self.checkpoint.get("failures", 0) + (status != "ok"),
+            "mode": self.mode,
+            "next_run": get_next_run_time(started, self.publication_delay).isoformat(),
+        }
+        write_checkpoint(self.checkpoint, self.location_BMRS_Final)
+
+    def is_slot_done(self, now: pd.Timestamp) -> bool:
+        """
+        Checks if the run of the half hour a time falls in has already been completed, e.g. before a restart.
+
+        Args:
+            now (pd.Timestamp): timezone aware time.
+
+        Returns:
+            bool: True if the checkpoint records a successful run in the same half hour, with the same mode.
+        """
+        return (
+            self.checkpoint.get("status") == "ok"
+            and self.checkpoint.get("mode") == self.mode
+            and self.checkpoint.get("last_run_slot") == get_run_slot(now, self.publication_delay).isoformat()
+        )
+
+    def stop(self, *args):
+        """
+        Stops run_forever after the current run, e.g. as a signal handler.
+        """
+        self._stop.set()
+
+    def run_forever(self, max_runs: int = None):
+        """
+        Runs the pipeline straight away (unless the checkpoint shows the current half hour has already been run)
+        and then at every scheduled run time, until stopped with SIGINT/SIGTERM or after max_runs runs. A failed
+        run is reported and retried at the next scheduled run time.
+
+        Args:
+            max_runs (int, optional): number of runs after which to stop. Defaults to None (no limit).
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        runs = 0
+        now = pd.Timestamp.now(tz="UTC")
+        run_time = get_next_run_time(now, self.publication_delay) if self.is_slot_done(now) else now
+        while not self._stop.is_set() and (max_runs is None or runs < max_runs):
+            self._stop.wait(max((run_time - pd.Timestamp.now(tz="UTC")).total_seconds(), 0))
+            if self._stop.is_set():
+                break
+
+            try:
+                run_report = self.run_once()
+                duration = sum(stage["duration_s"] for stage in run_report.stages)
+                print(f"{pd.Timestamp.now(tz='UTC'):%Y-%m-%d %H:%M:%S} run completed in {duration:.1f}s", flush=True)
+            except Exception:
+                print(f"{pd.Timestamp.now(tz='UTC'):%Y-%m-%d %H:%M:%S} run failed", flush=True)
+                traceback.print_exc()
+            runs += 1
+            run_time = get_next_run_time(pd.Timestamp.now(tz="UTC"), self.publication_delay)
@@ -1,17 +1,39 @@
-from ElexonDataPortal import api
-from datetime import date, datetime, timedelta
-import pytz
-import pandas as pd
-import pyarrow
-import os
-
+"""
+Stages of the live generation pipeline, run by Data_Pipeline and the daemon: the folder structure of the data
+directory, and the stages that follow the update of the B1610 and Physical BM Data (see run_generation_stages),
+which combine the modules of the pipeline into its outputs.
+"""
 
-BMRS_API_KEY = os.environ["BMRS_API_KEY"]
+import os
+from contextlib import nullcontext
 
+import pandas as pd
 
-client = api.Client(
-    BMRS_API_KEY
-)  # Copy API key in here (scripting key on the elexonportal.co.uk website; requires setting up user account)
+from generation_calc import (
+    STREAMING_MEMORY_BUDGET_MB,
+    calculate_settlement_period_generation,
+    combine_generation_data,
+    filter_and_rename_physical_Data,
+    find_dirty_settlement_periods,
+    fingerprint_physical_data,
+    read_physical_data_fingerprints,
+    select_dirty_settlement_periods,
+    select_settlement_day,
+    split_BMU_batches,
+    write_physical_data_fingerprints,
+)
+from generation_outputs import (
+    get_generation_location,
+    remove_generation_partitions,
+    update_changefeed,
+    update_generation_rollups,
+    write_generation_data,
+    write_generation_partition,
+)
+from nowcast import update_nowcast
+from psd import add_BMU_metadata
+from settlement_calendar import get_settlement_date_labels
+from wind_correction import apply_wind_FPN_correction, update_wind_FPN_correction
 
 
 def create_folder_structure(osdp_folder):
@@ -45,327 +67,240 @@ def create_folder_structure(osdp_folder):
     return location, location_BMRS, location_BMRS_PHYBMDATA, location_BMRS_B1610, location_BMRS_Final
 
 
-def setup_update_B1610_data(location_BMRS_B1610: str, num_days: int = 14, hist_days: int = 45) -> pd.DataFrame:
-    """
-    Checks if the B1610 dataset exists or has been updated in the last n days (determined by "num_days").
-    If not, it creates a new version of the dataset, using the "num_days" variable as the time limit for which
-    to generate it.
-    If it exists and has been updated recently, it finds the latest available date stored in the
-    df_B1610 dataframe and updates only the missing recent data.
-
-    Args:
-        location_BMRS_B1610 (str): location of the B1610 parquet file
-        num_days(int): max number of days for which to store the B1610 data. If the latest day in the B1610 dataset
-                        is less recent than this timedelta, the function will simply request a new dataset.
-        hist_days(int): maximum number of history days to keep.
-
-    Returns:
-        pd.DataFrame: dataframe with the updated B1610 (historical generation by BMU) data.
+def stream_generation_data(
+    df_B1610: pd.DataFrame,
+    df_generation: pd.DataFrame,
+    df_fpn: pd.DataFrame,
+    df_mel: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bmu_metadata: pd.DataFrame,
+    location_BMRS_Final: str,
+    mode: str = "minutely",
+    memory_budget_mb: float = STREAMING_MEMORY_BUDGET_MB,
+    write_csv: bool = False,
+    df_dirty: pd.DataFrame = None,
+) -> list:
     """
+    Bounded-memory alternative to running calculate_settlement_period_generation, combine_generation_data,
+    add_BMU_metadata and write_generation_data on the whole dataset. One settlement date is processed at a
+    time, and the BMUs of each day are split into batches that fit the memory budget (see split_BMU_batches).
+    Each day is written to its parquet partition (and appended to "Generation_Combined.csv") as soon as it
+    has been processed. BMUs are independent of each other and each day is resolved together with the records
+    of the neighbouring days that overlap it (see select_settlement_day), so the output matches the batch path.
 
-    B1610_start_date = pd.to_datetime(
-        date.today() - timedelta(days=num_days), utc=True
-    )  # Default to 14 days ago to speed up API query
-    B1610_end_date = pd.to_datetime(
-        date.today() - timedelta(days=6), utc=True
-    )  # The most recent B1610 data is ca. 6 days old
-
-    if not os.path.isfile(os.path.join(location_BMRS_B1610, "B1610.parquet")):
-        df_B1610 = client.get_B1610(B1610_start_date, B1610_end_date)
-        df_B1610 = df_B1610.rename(columns={"bMUnitID": "bmUnitID"})
-
-    else:
-        df_B1610 = pd.read_parquet(os.path.join(location_BMRS_B1610, "B1610.parquet"))
-        B1610_max_date = pd.to_datetime(df_B1610["settlementDate"], utc=True).max()
-        B1610_update_start_date = pd.to_datetime(B1610_max_date + timedelta(days=1), utc=True)
-
-        if B1610_max_date < B1610_start_date:
-            df_B1610 = client.get_B1610(B1610_start_date, B1610_end_date)
-            df_B1610 = df_B1610.rename(columns={"bMUnitID": "bmUnitID"})
-        else:
-            B1610_cutoff_date = pd.to_datetime(date.today() - timedelta(days=hist_days), utc=True)
-            df_B1610["settlementDate"] = pd.to_datetime(df_B1610["settlementDate"], utc=True)
-            df_B1610 = df_B1610.loc[df_B1610["settlementDate"] > B1610_cutoff_date]
-
-            if B1610_update_start_date > B1610_max_date:
-                df_B1610_append = client.get_B1610(B1610_update_start_date, B1610_end_date)
-                df_B1610_append = df_B1610_append.rename(columns={"bMUnitID": "bmUnitID"})
-                df_B1610 = pd.concat((df_B1610, df_B1610_append), axis=0)
-
-    df_B1610 = df_B1610[["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID", "quantity"]]
-
-    df_B1610[["local_datetime", "settlementDate"]] = df_B1610[["local_datetime", "settlementDate"]].apply(
-        pd.to_datetime, utc=True
-    )
-    df_B1610["settlementPeriod"] = df_B1610["settlementPeriod"].astype("int64")
-    df_B1610["quantity"] = df_B1610["quantity"].astype("float64")
-
-    df_B1610.to_parquet(os.path.join(location_BMRS_B1610, "B1610.parquet"))
-
-    return df_B1610
-
-
-def setup_update_PHYBM_data(BM_start_date: pd.Timestamp, location_BMRS_PHYBMDATA: str) -> pd.DataFrame:
-    """
-    Checks if the PHYBMDATA dataset exists. If not, it creates a new version of the dataset, using the
-    last date on the df_B1610 dataset as the start date and the latest date as the end date.
-    If it exists, it finds the latest available date stored in the df_B1610 dataframe, deletes any data now
-    duplicated by the B1610 and fetches the lates PHYBMDATA.
-
-    Once the B1610 data is updated, some balancing mechanism data will be redundant and can be removed.
-    New data can be added.
-
-    Args:
-        BM_start_date (pd.Timestamp): Latest date in the B1610 dataframe plus one day.
-                                        NB, the B1610 data always gets updated for entire days.
-        location_BMRS_PHYBMDATA (str): location of the PHYBMDATA parquet file.
-
-    Returns:
-        pd.DataFrame: dataframe with the updated Physical BM Data.
-    """
-    BM_end_date = pd.to_datetime(datetime.now(pytz.timezone("Europe/London")) + timedelta(minutes=90)).replace(
-        tzinfo=None
-    )
-
-    if not os.path.isfile(os.path.join(location_BMRS_PHYBMDATA, "PHYBMDATA.parquet")):
-        df_PHYBMDATA = client.get_PHYBMDATA(BM_start_date, BM_end_date)
-        df_PHYBMDATA = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"].isin(["PN", "MEL", "BOALF"])]
-
-    else:
-        df_PHYBMDATA = pd.read_parquet(os.path.join(location_BMRS_PHYBMDATA, "PHYBMDATA.parquet"))
-        df_PHYBMDATA["settlementDate"] = pd.to_datetime(df_PHYBMDATA["settlementDate"]).dt.tz_localize(None)
-
-        df_PHYBMDATA_start_date = (
-            pd.to_datetime(df_PHYBMDATA["local_datetime"].max()) - timedelta(minutes=90)
-        ).replace(
-            tzinfo=None
-        )  # NB, the FPN, BOAL and MEL could change/is not posted all at once. Hence, we want to also look at historic data.
-
-        if df_PHYBMDATA_start_date < BM_start_date:
-            # If the Physical BM Data hasn't been updated in a while, request a new dataset.
-            df_PHYBMDATA = client.get_PHYBMDATA(BM_start_date, BM_end_date)
-            df_PHYBMDATA = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"].isin(["PN", "MEL", "BOALF"])]
-        else:
-            # Otherwise, only request the most recent data
-            df_PHYBMDATA = df_PHYBMDATA.loc[df_PHYBMDATA["settlementDate"] >= BM_start_date]
-            df_PHYBMDATA_latest = client.get_PHYBMDATA(df_PHYBMDATA_start_date, BM_end_date)
-            df_PHYBMDATA_latest = df_PHYBMDATA_latest.loc[
-                df_PHYBMDATA_latest["recordType"].isin(["PN", "MEL", "BOALF"])
-            ]
-            df_PHYBMDATA = pd.concat((df_PHYBMDATA, df_PHYBMDATA_latest), axis=0)
-
-        df_PHYBMDATA = df_PHYBMDATA.drop_duplicates(keep="last")
-
-    df_PHYBMDATA = df_PHYBMDATA[
-        [
-            "local_datetime",
-            "recordType",
-            "bmUnitID",
-            "settlementDate",
-            "settlementPeriod",
-            "timeFrom",
-            "pnLevelFrom",
-            "timeTo",
-            "pnLevelTo",
-            "melLevelFrom",
-            "melLevelTo",
-            "bidOfferAcceptanceNumber",
-            "acceptanceTime",
-            "bidOfferLevelFrom",
-            "bidOfferLevelTo",
-        ]
-    ]
-
-    df_PHYBMDATA[["local_datetime", "settlementDate", "acceptanceTime", "timeFrom", "timeTo"]] = df_PHYBMDATA[
-        ["local_datetime", "settlementDate", "acceptanceTime", "timeFrom", "timeTo"]
-    ].apply(pd.to_datetime, utc=True)
-    df_PHYBMDATA["settlementPeriod"] = df_PHYBMDATA["settlementPeriod"].astype("int64")
-    df_PHYBMDATA[
-        [
-            "pnLevelFrom",
-            "pnLevelTo",
-            "melLevelFrom",
-            "melLevelTo",
-            "bidOfferAcceptanceNumber",
-            "bidOfferLevelFrom",
-            "bidOfferLevelTo",
-        ]
-    ] = df_PHYBMDATA[
-        [
-            "pnLevelFrom",
-            "pnLevelTo",
-            "melLevelFrom",
-            "melLevelTo",
-            "bidOfferAcceptanceNumber",
-            "bidOfferLevelFrom",
-            "bidOfferLevelTo",
-        ]
-    ].astype(
-        "float64"
-    )
-
-    df_PHYBMDATA.to_parquet(os.path.join(location_BMRS_PHYBMDATA, "PHYBMDATA.parquet"))
-
-    return df_PHYBMDATA
-
-
-def filter_and_rename_physical_Data(
-    location_BMRS_Final: str, df_B1610: pd.DataFrame, df_PHYBMDATA: pd.DataFrame
-) -> pd.DataFrame:
-    """
-    If it exists, reads in the "Generation_Combined.csv" and filters this to the period between
-    the start of the BM data and the end of the Generation_Combined data (minus 90 minutes). NB:
-    90 minutes was chosen as the BM data might be updated slightly retrospectively after the pipeline
-    was last run as balancing actions can happen at any time throughout a settlement period.
-    Filters the Physical BM data so it only contains the most recent settlement periods and the three
-    record types that we're interested in: FPN, MEL and BOAL. Selects the relevant columns in each
-    dataset to reduce the size of each DF. Renames the columns in the filtered DFs to follow a
-    standard pattern.
+    The memory budget only bounds the settlement period calculation of each batch. The input dataframes are
+    still held in memory in full, as are the output and the B1610 and previous generation data of a day.
 
     Args:
+        df_B1610 (pd.DataFrame): B1610 dataframe created by the setup_update_B1610_data function.
+        df_generation (pd.DataFrame): filtered previous output from filter_and_rename_physical_Data.
+        df_fpn (pd.DataFrame): FPN dataframe from filter_and_rename_physical_Data.
+        df_mel (pd.DataFrame): MEL dataframe from filter_and_rename_physical_Data.
+        df_boal (pd.DataFrame): BOAL dataframe from filter_and_rename_physical_Data.
+        df_bmu_metadata (pd.DataFrame): BMU lookup table from read_BMU_metadata.
         location_BMRS_Final (str): directory with the final combined live generation dataset.
-        df_PHYBMDATA (pd.DataFrame): B1610 dataframe created by the setup_update_B1610_data function.
-        df_PHYBMDATA (pd.DataFrame): current version of the PHYBMDATA dataframe.
+        mode (str): "minutely" or "analytic", see calculate_settlement_period_generation.
+        memory_budget_mb (float): peak memory budget in MB for the settlement period calculation of a batch,
+                                  which does not include the input dataframes.
+        write_csv (bool, optional): also write the dataset in CSV format. Defaults to False.
+        df_dirty (pd.DataFrame, optional): dirty cells from find_dirty_settlement_periods, if only these were
+                                           selected by filter_and_rename_physical_Data. Defaults to None.
 
     Returns:
-        pd.DataFrame: The filtered version of the df_generation dataframe and three dfs with
-        the FPN, MEL and BOAL data respectively.
+        list: settlement dates (YYYY-MM-DD) of the partitions that were written.
     """
-    if os.path.isfile(os.path.join(location_BMRS_Final, "Generation_Combined.csv")):
-        df_generation = pd.read_csv(
-            os.path.join(location_BMRS_Final, "Generation_Combined.csv"), header=0, index_col=None
-        )
-
-        df_generation[["localDateTime", "settlementDate"]] = df_generation[["localDateTime", "settlementDate"]].apply(
-            pd.to_datetime
+    location_generation = get_generation_location(location_BMRS_Final)
+    os.makedirs(location_generation, exist_ok=True)
+
+    frames = [df for df in (df_B1610, df_generation, df_fpn, df_mel, df_boal) if not df.empty]
+    settlement_dates = sorted(set().union(*[df["settlementDate"].unique() for df in frames]))
+
+    location_csv = os.path.join(location_BMRS_Final, "Generation_Combined.csv")
+    csv_header = True
+
+    partition_dates, updated_partitions = set(), []
+    for settlement_date, partition_date in zip(settlement_dates, get_settlement_date_labels(settlement_dates)):
+        day_fpn, day_mel, day_boal = select_settlement_day(df_fpn, df_mel, df_boal, settlement_date)
+
+        day_agg = []
+        for bmus in split_BMU_batches(day_fpn, day_mel, day_boal, mode=mode, memory_budget_mb=memory_budget_mb):
+            df_agg = calculate_settlement_period_generation(
+                day_fpn.loc[day_fpn.index.isin(bmus)],
+                day_mel.loc[day_mel.index.isin(bmus)],
+                day_boal.loc[day_boal.index.isin(bmus)],
+                mode=mode,
+            )
+            df_agg = select_dirty_settlement_periods(df_agg, df_dirty)
+            day_agg.append(df_agg.loc[df_agg["settlementDate"] == settlement_date])
+
+        df_day = combine_generation_data(
+            df_B1610.loc[df_B1610["settlementDate"] == settlement_date],
+            df_generation.loc[df_generation["settlementDate"] == settlement_date] if not df_generation.empty else None,
+            pd.concat(day_agg).sort_values(["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID"])
+            if day_agg
+            else None,
         )
-        df_generation["settlementPeriod"] = df_generation["settlementPeriod"].astype(int)
-
-        # Discard the last 3 settlement periods of the df_generation and filter it so it only includes data derived from the BM (not historic data)
-        df_generation_max_datetime = pd.to_datetime(df_generation["localDateTime"].max()) - timedelta(minutes=90)
-        df_generation = df_generation.loc[df_generation["localDateTime"] < df_generation_max_datetime]
-        df_generation = df_generation.loc[df_generation["localDateTime"] > df_B1610["local_datetime"].max()]
-        df_generation = df_generation[["localDateTime", "settlementDate", "settlementPeriod", "BMUnitID", "quantity"]]
-        df_generation = df_generation.rename(columns={"localDateTime": "local_datetime", "BMUnitID": "bmUnitID"})
-
-        df_PHYBMDATA = df_PHYBMDATA.loc[df_PHYBMDATA["local_datetime"] >= df_generation_max_datetime]
-
-    else:
-        df_generation = pd.DataFrame()
-
-    common_columns = [
-        "local_datetime",
-        "recordType",
-        "bmUnitID",
-        "settlementDate",
-        "settlementPeriod",
-        "timeFrom",
-        "timeTo",
-    ]
-    fpn_columns = ["pnLevelFrom", "pnLevelTo"]
-    mel_columns = ["melLevelFrom", "melLevelTo"]
-    boal_columns = [
-        "bidOfferAcceptanceNumber",
-        "acceptanceTime",
-        "bidOfferLevelFrom",
-        "bidOfferLevelTo",
-    ]
-
-    df_fpn = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"] == "PN", common_columns + fpn_columns]
-    df_fpn = df_fpn.rename(columns={"pnLevelFrom": "LevelFrom", "pnLevelTo": "LevelTo"}).set_index("bmUnitID")
-
-    df_mel = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"] == "MEL", common_columns + mel_columns]
-    df_mel = df_mel.rename(columns={"melLevelFrom": "LevelFrom", "melLevelTo": "LevelTo"}).set_index("bmUnitID")
-
-    df_boal = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"] == "BOALF", common_columns + boal_columns]
-    df_boal["bidOfferAcceptanceNumber"] = df_boal["bidOfferAcceptanceNumber"].astype(int)
-    df_boal = df_boal.rename(
-        columns={
-            "bidOfferLevelFrom": "LevelFrom",
-            "bidOfferLevelTo": "LevelTo",
-            "bidOfferAcceptanceNumber": "Accept ID",
-        }
-    ).set_index("bmUnitID")
-
-    return df_generation, df_fpn, df_mel, df_boal
-
-
-def convert_physical_data_to_long(df: pd.DataFrame) -> pd.DataFrame:
+        if df_day.empty:
+            continue
+        df_day = add_BMU_metadata(df_day, df_bmu_metadata)
+
+        partition_dates.add(partition_date)
+        if write_generation_partition(df_day, location_generation, partition_date):
+            updated_partitions.append(partition_date)
+
+        if write_csv:
+            df_day.to_csv(f"{location_csv}.tmp", index=False, header=csv_header, mode="w" if csv_header else "a")
+            csv_header = False
+
+    remove_generation_partitions(location_generation, partition_dates)
+
+    if write_csv and not csv_header:
+        os.replace(f"{location_csv}.tmp", location_csv)
+
+    return updated_partitions
+
+
+def run_generation_stages(
+    location_BMRS_Final: str,
+    df_B1610: pd.DataFrame,
+    df_PHYBMDATA: pd.DataFrame,
+    df_bmu_metadata: pd.DataFrame,
+    mode: str = "minutely",
+    n_workers: int = 1,
+    write_csv: bool = True,
+    write_derived_csv: bool = False,
+    correct_wind_FPN: bool = True,
+    nowcast_resolution: str = "5min",
+    stream_by_settlement_day: bool = False,
+    memory_budget_mb: float = STREAMING_MEMORY_BUDGET_MB,
+    df_fingerprints_previous: pd.DataFrame = None,
+    df_generation_previous: pd.DataFrame = None,
+    run_report=None,
+) -> dict:
     """
-    Convert all LevelFrom & timeFrom / LevelTo & timeTo columns from their horizontal format
-    to a long format with values at different timepoints.
+    Runs the stages of the pipeline that follow the update of the B1610 and Physical BM Data, as used by both
+    Data_Pipeline and the daemon: the wind FPN correction, the change tracking, the settlement period generation of
+    the dirty settlement periods, the combined output dataset and its fingerprints, the rollups, the changefeed and
+    the nowcast.
 
     Args:
-        df (pd.DataFrame): BOAL, MEL or FPN dataframe to convert from wide to long.
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        df_B1610 (pd.DataFrame): B1610 data from setup_update_B1610_data.
+        df_PHYBMDATA (pd.DataFrame): Physical BM Data from setup_update_PHYBM_data, without the wind FPN correction.
+        df_bmu_metadata (pd.DataFrame): output of read_BMU_metadata.
+        mode (str, optional): "minutely" or "analytic", see calculate_settlement_period_generation.
+                              Defaults to "minutely".
+        n_workers (int, optional): number of processes resolving the BMUs, see
+                                   calculate_settlement_period_generation. Defaults to 1.
+        write_csv (bool, optional): also write the combined dataset to "Generation_Combined.csv". Defaults to True.
+        write_derived_csv (bool, optional): also write the rollups and the nowcast to CSV. Defaults to False.
+        correct_wind_FPN (bool, optional): correct the FPN of the wind BMUs (see update_wind_FPN_correction).
+                                           Defaults to True.
+        nowcast_resolution (str, optional): resolution of the nowcast (see update_nowcast), None to not publish it.
+                                            Defaults to "5min".
+        stream_by_settlement_day (bool, optional): process one settlement date at a time within memory_budget_mb
+                                                   (see stream_generation_data). Defaults to False.
+        memory_budget_mb (float, optional): see stream_generation_data. Defaults to STREAMING_MEMORY_BUDGET_MB.
+        df_fingerprints_previous (pd.DataFrame, optional): fingerprints of the last run, None to read the stored
+                                                           fingerprints. Defaults to None.
+        df_generation_previous (pd.DataFrame, optional): see filter_and_rename_physical_Data. Defaults to None.
+        run_report (pipeline_instrumentation.RunReport, optional): report to record each stage in. Defaults to None.
 
     Returns:
-        pd.DataFrame: BOAL, MEL or FPN dataframe with level/time to/from converted to long format.
+        dict: the wind corrected Physical BM Data ("df_PHYBMDATA"), its fingerprints ("df_fingerprints"), the FPN,
+        MEL and BOAL records of the dirty settlement periods ("df_fpn", "df_mel", "df_boal") and the combined
+        dataset as written ("df_generation", None with stream_by_settlement_day).
     """
 
-    df = pd.concat(
-        (
-            df.drop(columns=["LevelTo", "timeTo"]).rename(columns={"LevelFrom": "Level", "timeFrom": "Time"}),
-            df.drop(columns=["LevelFrom", "timeFrom"]).rename(columns={"LevelTo": "Level", "timeTo": "Time"}),
+    def stage(name: str, rows_in: int = None):
+        # without a report, the stages still get a record to set "rows_out" in
+        return run_report.stage(name, rows_in=rows_in) if run_report is not None else nullcontext({})
+
+    if correct_wind_FPN:
+        with stage("update_wind_FPN_correction", rows_in=len(df_PHYBMDATA)) as record:
+            df_wind_correction = update_wind_FPN_correction(
+                df_PHYBMDATA, df_B1610, df_bmu_metadata, location_BMRS_Final
+            )
+            df_PHYBMDATA = apply_wind_FPN_correction(df_PHYBMDATA, df_wind_correction)
+            record["rows_out"] = len(df_PHYBMDATA)
+
+    with stage("find_dirty_settlement_periods", rows_in=len(df_PHYBMDATA)) as record:
+        df_fingerprints = fingerprint_physical_data(df_PHYBMDATA)
+        if df_fingerprints_previous is None:
+            df_fingerprints_previous = read_physical_data_fingerprints(location_BMRS_Final, mode=mode)
+        df_dirty = find_dirty_settlement_periods(df_fingerprints, df_fingerprints_previous)
+        record["rows_out"] = len(df_dirty)
+
+    with stage("filter_and_rename_physical_Data", rows_in=len(df_B1610) + len(df_PHYBMDATA)) as record:
+        df_generation, df_fpn, df_mel, df_boal = filter_and_rename_physical_Data(
+            location_BMRS_Final,
+            df_B1610,
+            df_PHYBMDATA,
+            df_dirty=df_dirty,
+            df_generation_previous=df_generation_previous,
         )
-    )
-
-    df["Level"] = df["Level"].astype(float)
-    return df
-
-
-def resolve_level(df_linear: pd.DataFrame, groupby: list) -> pd.DataFrame:
-    """
-    For BOAL data, we can have multiple levels for a given timepoint, because levels are fixed
-    at one point and then overwitten at a later timepoint, before the moment in
-    question has arrived.
-
-    We need to resolve them, choosing the latest possible commitment for each timepoint. To achieve this,
-    all data (FPN, MEL, BOAL) is first upsampled to 1-minutely resolution. This is easily possible because the data is
-    recorded in MW (rater than MWh).
-
-    Args:
-        df (pd.DataFrame): BOAL, MEL or FPN dataframe to converted from wide to long.
-
-    Returns:
-        pd.DataFrame: BOAL, MEL or FPN dataframe data upsampled to 1-minutely resolution.
-    """
-    out = []
-    for group_index, data in df_linear.groupby(groupby):
-        high_freq = data.reset_index().rename(columns={"index": "Unit"}).set_index("Time").resample("T").first()
-        out.append(high_freq.interpolate("ffill"))
-
-    recombined = pd.concat(out)
-
-    # Select the latest commitment for every timepoint
-    resolved = recombined.reset_index().groupby(["Time", "bmUnitID"]).last()
-
-    return resolved
-
-
-def resolve_applied_bid_offer_level(df_linear: pd.DataFrame) -> pd.DataFrame:
-    """
-    BOAL Data is grouped by Accept ID and bmUnitID because the accept ID alone might not be unique.
-
-    Args:
-        df_linear (pd.DataFrame): BOAL dataframe to converted from wide to long.
-
-    Returns:
-        pd.DataFrame: BOAL data upsampled to the minutely level. Where multiple BOAL records exist for a time,
-        only the last one is kept.
-
-    """
-    return resolve_level(df_linear, ["Accept ID", "bmUnitID"])
-
-
-def resolve_FPN_MEL_level(df_linear: pd.DataFrame) -> pd.DataFrame:
-    """
-    FPN and MEL Data doesn't have an accept ID and only needs grouping by the bmUnitID.
-
-    Args:
-        df_linear (pd.DataFrame): MEL or FPN dataframe to converted from wide to long.
-
-    Returns:
-        pd.DataFrame: FPN/MEL data upsampled to the minutely level. Where multiple records exist for a time,
-        only the last one is kept.
-    """
-    return resolve_level(df_linear, ["bmUnitID"])
+        record["rows_out"] = len(df_generation) + len(df_fpn) + len(df_mel) + len(df_boal)
+
+    if stream_by_settlement_day:
+        # the streamed settlement dates are written as they are resolved, so there are no output rows to count
+        with stage("stream_generation_data", rows_in=len(df_fpn) + len(df_mel) + len(df_boal)):
+            stream_generation_data(
+                df_B1610,
+                df_generation,
+                df_fpn,
+                df_mel,
+                df_boal,
+                df_bmu_metadata,
+                location_BMRS_Final,
+                mode=mode,
+                memory_budget_mb=memory_budget_mb,
+                write_csv=write_csv,
+                df_dirty=df_dirty,
+            )
+        df_generation = None
+    else:
+        with stage(
+            "calculate_settlement_period_generation", rows_in=len(df_fpn) + len(df_mel) + len(df_boal)
+        ) as record:
+            df_fpn_mel_boal_agg = calculate_settlement_period_generation(
+                df_fpn, df_mel, df_boal, mode=mode, n_workers=n_workers
+            )
+            df_fpn_mel_boal_agg = select_dirty_settlement_periods(df_fpn_mel_boal_agg, df_dirty)
+            record["rows_out"] = len(df_fpn_mel_boal_agg)
+
+        with stage("add_BMU_metadata", rows_in=len(df_generation) + len(df_fpn_mel_boal_agg)) as record:
+            df_generation = combine_generation_data(df_B1610, df_generation, df_fpn_mel_boal_agg)
+            df_generation = add_BMU_metadata(df_generation, df_bmu_metadata)
+            record["rows_out"] = len(df_generation)
+
+    with stage("write_generation_data", rows_in=None if df_generation is None else len(df_generation)) as record:
+        if df_generation is not None:
+            write_generation_data(df_generation, location_BMRS_Final, write_csv=write_csv)
+            record["rows_out"] = len(df_generation)
+        write_physical_data_fingerprints(df_fingerprints, location_BMRS_Final, mode=mode)
+
+    with stage("update_generation_rollups"):
+        update_generation_rollups(location_BMRS_Final, write_csv=write_derived_csv)
+
+    with stage("update_changefeed"):
+        update_changefeed(location_BMRS_Final)
+
+    if nowcast_resolution is not None:
+        with stage("update_nowcast", rows_in=len(df_PHYBMDATA)) as record:
+            df_nowcast = update_nowcast(
+                df_PHYBMDATA,
+                df_bmu_metadata,
+                location_BMRS_Final,
+                resolution=nowcast_resolution,
+                write_csv=write_derived_csv,
+            )
+            record["rows_out"] = len(df_nowcast)
+
+    return {
+        "df_PHYBMDATA": df_PHYBMDATA,
+        "df_fingerprints": df_fingerprints,
+        "df_fpn": df_fpn,
+        "df_mel": df_mel,
+        "df_boal": df_boal,
+        "df_generation": df_generation,
+    }
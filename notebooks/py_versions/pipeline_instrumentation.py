@@ -0,0 +1,311 @@
+"""
+Lightweight instrumentation of a pipeline run. Every call to an instrumented function (see RunReport.instrument)
+or block of code (see RunReport.stage) made at the top level of the run is recorded as a stage with its
+duration, rows in/out and peak memory (RSS). On Linux, the peak RSS of the process is reset at the start of each
+stage, so that each stage records its own peak; elsewhere the stages record the peak of the process so far
+("process_peak_rss_mb"). Calls made within a stage, including those made by worker threads, are summarised by
+function in the stage. The report is written as JSON alongside the output.
+
+For deep dives, the run can also be profiled with cProfile and/or tracemalloc, e.g. by setting the
+PIPELINE_PROFILE environment variable to "cprofile", "tracemalloc" or "cprofile,tracemalloc".
+"""
+
+import atexit
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+import psutil
+
+PROFILE_MODES = ["cprofile", "tracemalloc"]
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak resident set size (RSS) of the process to its current RSS, which is only possible on Linux.
+
+    Returns:
+        bool: whether the peak RSS was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss() -> float:
+    """
+    Returns the highest resident set size (RSS) of the process so far, or since it was last reset (see
+    reset_peak_rss).
+
+    Returns:
+        float: peak RSS in MB.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            peak_rss = next(line for line in f if line.startswith("VmHWM:"))
+        # e.g. "VmHWM:     13684 kB"
+        return round(int(peak_rss.split()[1]) / 1024, 2)
+    except (OSError, StopIteration):
+        pass
+
+    try:
+        import resource
+
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return round(peak_rss / 1024**2 if sys.platform == "darwin" else peak_rss / 1024, 2)
+    except ImportError:
+        # Windows
+        return round(psutil.Process().memory_info().peak_wset / 1024**2, 2)
+
+
+def count_rows(values) -> int:
+    """
+    Returns the total number of rows of the dataframes among the arguments or return value of a function.
+
+    Args:
+        values: a dataframe, or a list, tuple or dict of values.
+
+    Returns:
+        int: number of rows, or None if there is no dataframe.
+    """
+    if isinstance(values, dict):
+        values = list(values.values())
+    elif not isinstance(values, (list, tuple)):
+        values = [values]
+
+    frames = [value for value in values if isinstance(value, (pd.DataFrame, pd.Series))]
+
+    return sum(len(frame) for frame in frames) if frames else None
+
+
+class RunReport:
+    """
+    Records the stages of a pipeline run, see the module docstring.
+
+    Args:
+        name (str): name of the run, e.g. "Data_Pipeline".
+        profile (str, optional): comma separated deep dive modes, "cprofile" and/or "tracemalloc".
+                                 Defaults to the PIPELINE_PROFILE environment variable.
+    """
+
+    def __init__(self, name: str, profile: str = None):
+        profile = os.environ.get("PIPELINE_PROFILE", "") if profile is None else profile
+        self.profile_modes = [mode.strip() for mode in profile.split(",") if mode.strip()]
+        unknown_modes = set(self.profile_modes) - set(PROFILE_MODES)
+        if unknown_modes:
+            raise ValueError(f"Unknown profile mode(s) {sorted(unknown_modes)}, expected {PROFILE_MODES}")
+
+        self.name = name
+        self.started = datetime.now(timezone.utc)
+        self.start_time = time.perf_counter()
+        self.stages = []
+        self.status = "running"
+        self.location = None
+
+        self._active_stage = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # The peak RSS is reset by each stage, so the peak of the run is kept here
+        self._can_reset_peak_rss = reset_peak_rss()
+        self._peak_rss_mb = get_peak_rss()
+
+        self._profiler = None
+        if "cprofile" in self.profile_modes:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        if "tracemalloc" in self.profile_modes and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def instrument(self, modules, exclude: list = None):
+        """
+        Replaces the public functions defined in some modules with instrumented versions, until the returned function
+        is called. Calls between the functions of the modules are instrumented as well, as they look the functions up
+        in the module that calls them, where the functions imported from the other modules are replaced too.
+        Functions instrumented by an earlier call, e.g. for another report, are instrumented again rather than
+        wrapped twice.
+
+        Args:
+            modules (module or list): modules to instrument, e.g. [pipeline_fns, generation_calc].
+            exclude (list, optional): names of functions to leave as they are, e.g. those recording their own stages
+                                      (see pipeline_fns.run_generation_stages). Defaults to None.
+
+        Returns:
+            callable: function putting the functions of the modules back as they were before this call.
+        """
+        modules = modules if isinstance(modules, (list, tuple)) else [modules]
+
+        instrumented_functions = {}
+        for module in modules:
+            for name, function in vars(module).items():
+                if (
+                    inspect.isfunction(function)
+                    and function.__module__ == module.__name__
+                    and not name.startswith("_")
+                    and name not in (exclude or [])
+                ):
+                    function = getattr(function, "_uninstrumented", function)
+                    instrumented_functions[function] = self.wrap(function)
+
+        replaced_functions = []
+        for module in modules:
+            for name, function in list(vars(module).items()):
+                if not inspect.isfunction(function):
+                    continue
+                instrumented = instrumented_functions.get(getattr(function, "_uninstrumented", function))
+                if instrumented is not None:
+                    replaced_functions.append((module, name, function, instrumented))
+                    setattr(module, name, instrumented)
+
+        def restore():
+            for module, name, function, instrumented in replaced_functions:
+                # Leaves the functions that have been replaced again since
+                if getattr(module, name) is instrumented:
+                    setattr(module, name, function)
+
+        return restore
+
+    def wrap(self, function):
+        """
+        Returns an instrumented version of a function.
+
+        Args:
+            function (callable): function to instrument.
+
+        Returns:
+            callable: function recording its calls in the report.
+        """
+
+        @functools.wraps(function)
+        def instrumented(*args, **kwargs):
+            with self.stage(function.__name__, rows_in=count_rows(list(args) + list(kwargs.values()))) as record:
+                result = function(*args, **kwargs)
+                record["rows_out"] = count_rows(result)
+            return result
+
+        instrumented._uninstrumented = function
+        return instrumented
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = None):
+        """
+        Context manager recording a block of code as a stage of the run, or as a call within the current stage.
+
+        Args:
+            name (str): name of the stage.
+            rows_in (int, optional): number of input rows. Defaults to None.
+
+        Yields:
+            dict: record of the stage, e.g. to set "rows_out".
+        """
+        depth = getattr(self._local, "depth", 0)
+        is_stage = depth == 0 and self._active_stage is None
+        record = {"name": name, "rows_in": rows_in, "rows_out": None}
+
+        if is_stage:
+            record.update(started=datetime.now(timezone.utc).isoformat(), rss_start_mb=self._get_rss(), calls={})
+            self._active_stage = record
+            if self._can_reset_peak_rss:
+                self._peak_rss_mb = max(self._peak_rss_mb, get_peak_rss())
+                reset_peak_rss()
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+
+        self._local.depth = depth + 1
+        start_time = time.perf_counter()
+        try:
+            yield record
+            record["status"] = "ok"
+        except BaseException as error:
+            record["status"] = f"failed: {type(error).__name__}"
+            raise
+        finally:
+            duration = time.perf_counter() - start_time
+            self._local.depth = depth
+
+            if is_stage:
+                peak_rss = get_peak_rss()
+                self._peak_rss_mb = max(self._peak_rss_mb, peak_rss)
+                peak_rss_field = "peak_rss_mb" if self._can_reset_peak_rss else "process_peak_rss_mb"
+                record.update(
+                    {"duration_s": round(duration, 4), "rss_end_mb": self._get_rss(), peak_rss_field: peak_rss}
+                )
+                if tracemalloc.is_tracing():
+                    record["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024**2, 2)
+                self._active_stage = None
+                self.stages.append(record)
+            elif self._active_stage is not None:
+                with self._lock:
+                    calls = self._active_stage["calls"].setdefault(name, {"count": 0, "duration_s": 0.0})
+                    calls["count"] += 1
+                    calls["duration_s"] = round(calls["duration_s"] + duration, 4)
+
+    def write(self, location: str, status: str = "ok") -> str:
+        """
+        Writes the report to "run_report.json" (and the cProfile statistics to "run_profile.prof") in a folder.
+
+        Args:
+            location (str): folder to write the report to, e.g. location_BMRS_Final.
+            status (str): status of the run. Defaults to "ok".
+
+        Returns:
+            str: path of the report.
+        """
+        self.status = status
+        self.location = location
+
+        report = {
+            "name": self.name,
+            "started": self.started.isoformat(),
+            "duration_s": round(time.perf_counter() - self.start_time, 4),
+            "status": status,
+            "peak_rss_mb": max(self._peak_rss_mb, get_peak_rss()),
+            "profile_modes": self.profile_modes,
+            "stages": self.stages,
+        }
+
+        os.makedirs(location, exist_ok=True)
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(os.path.join(location, "run_profile.prof"))
+            stats_output = io.StringIO()
+            pstats.Stats(self._profiler, stream=stats_output).sort_stats("cumulative").print_stats(25)
+            report["cprofile_top"] = stats_output.getvalue().splitlines()
+
+        path = os.path.join(location, "run_report.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+        return path
+
+    def write_on_exit(self, location: str):
+        """
+        Makes sure a report is written when the run ends without calling write, e.g. because a stage failed.
+
+        Args:
+            location (str): folder to write the report to.
+        """
+
+        def write_if_unfinished():
+            if self.status == "running":
+                self.write(location, status="incomplete")
+
+        atexit.register(write_if_unfinished)
+
+    @staticmethod
+    def _get_rss() -> float:
+        return round(psutil.Process().memory_info().rss / 1024**2, 2)
@@ -0,0 +1,152 @@
+"""
+Column types of the datasets used by the live generation pipeline. The BMU IDs, record types, names and fuel
+types only take a few hundred distinct values and are stored as categoricals, settlement periods as int8,
+MW levels as float32 and acceptance numbers as int32, which is much more compact than the Python object
+strings, int64 and float64 columns pandas creates by default.
+"""
+
+import numpy as np
+import pandas as pd
+
+UTC_DATETIME = "datetime64[ns, UTC]"
+
+B1610_SCHEMA = {
+    "local_datetime": UTC_DATETIME,
+    "settlementDate": UTC_DATETIME,
+    "settlementPeriod": "int8",
+    "bmUnitID": "category",
+    "quantity": "float32",
+}
+
+# Acceptance numbers only exist for BOALF records, hence the nullable integer type
+PHYBMDATA_SCHEMA = {
+    "local_datetime": UTC_DATETIME,
+    "recordType": "category",
+    "bmUnitID": "category",
+    "settlementDate": UTC_DATETIME,
+    "settlementPeriod": "int8",
+    "timeFrom": UTC_DATETIME,
+    "pnLevelFrom": "float32",
+    "timeTo": UTC_DATETIME,
+    "pnLevelTo": "float32",
+    "melLevelFrom": "float32",
+    "melLevelTo": "float32",
+    "bidOfferAcceptanceNumber": "Int32",
+    "acceptanceTime": UTC_DATETIME,
+    "bidOfferLevelFrom": "float32",
+    "bidOfferLevelTo": "float32",
+}
+
+GENERATION_SCHEMA = {
+    "localDateTime": UTC_DATETIME,
+    "settlementDate": UTC_DATETIME,
+    "settlementPeriod": "int8",
+    "BMUnitID": "category",
+    "quantity": "float32",
+    "dictionaryID": "int32",
+    "commonName": "category",
+    "longitude": "float64",
+    "latitude": "float64",
+    "fuel": "category",
+    "lowCarbonGeneration": "category",
+    "renewableGeneration": "category",
+}
+
+
+def to_category(series: pd.Series) -> pd.Series:
+    """
+    Converts a series to a categorical with only the categories in use, in sorted order, so that the same
+    data always gets the same categories, e.g. after concatenating or filtering dataframes.
+
+    Args:
+        series (pd.Series): series to convert.
+
+    Returns:
+        pd.Series: categorical series.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Counting the codes is much faster than the unique/sort of remove_unused_categories, e.g. for a dataset
+        # read back from Arrow or parquet that already has the categories in use, in sorted order
+        codes = series.cat.codes.to_numpy()
+        used = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories)) > 0
+        if used.all() and series.cat.categories.is_monotonic_increasing:
+            return series
+        series = series.cat.remove_unused_categories()
+        return series.cat.reorder_categories(sorted(series.cat.categories))
+
+    return series.astype("category")
+
+
+def apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """
+    Casts the columns of a dataframe to the types of a schema. Columns that are not in the schema, and
+    columns of the schema that are not in the dataframe, are ignored. Strings as returned by the API are
+    parsed to the datetime and numeric types.
+
+    Args:
+        df (pd.DataFrame): dataframe to cast.
+        schema (dict): column types by column name, e.g. PHYBMDATA_SCHEMA.
+
+    Returns:
+        pd.DataFrame: a copy of the dataframe with the schema applied.
+    """
+    df = df.copy()
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        if dtype == UTC_DATETIME:
+            if str(df[column].dtype) != UTC_DATETIME:
+                df[column] = pd.to_datetime(df[column], utc=True)
+        elif dtype == "category":
+            df[column] = to_category(df[column])
+        elif str(df[column].dtype) != dtype:
+            df[column] = pd.to_numeric(df[column]).astype(dtype)
+
+    return df
+
+
+def widen_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reverts the compact types of a dataframe to the pandas defaults: object strings, int64 and float64.
+
+    Args:
+        df (pd.DataFrame): dataframe to convert.
+
+    Returns:
+        pd.DataFrame: a copy of the dataframe with the default types.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("object")
+        elif pd.api.types.is_integer_dtype(df[column]):
+            df[column] = df[column].astype("float64" if df[column].hasnans else "int64")
+        elif pd.api.types.is_float_dtype(df[column]):
+            df[column] = df[column].astype("float64")
+
+    return df
+
+
+def memory_footprint(frames: dict) -> pd.DataFrame:
+    """
+    Compares the memory used by dataframes with the compact types to the memory they would use with the
+    pandas default types (see widen_dtypes).
+
+    Args:
+        frames (dict): dataframes by name.
+
+    Returns:
+        pd.DataFrame: memory in MB with the default ("before") and compact ("after") types by dataframe name,
+        with the total in the last row.
+    """
+    df_memory = pd.DataFrame(
+        {
+            "before_MB": [widen_dtypes(df).memory_usage(deep=True).sum() / 1024**2 for df in frames.values()],
+            "after_MB": [df.memory_usage(deep=True).sum() / 1024**2 for df in frames.values()],
+        },
+        index=list(frames.keys()),
+    )
+    df_memory.loc["total"] = df_memory.sum()
+    df_memory["reduction_pct"] = 100 * (1 - df_memory["after_MB"] / df_memory["before_MB"])
+
+    return df_memory.round(2)
@@ -0,0 +1,138 @@
+"""
+Helpers for the files written by the live generation pipeline. Outputs are written to a temporary file and moved
+into place with os.replace, so that a run that is interrupted leaves the previous version of a file readable rather
+than a truncated one. Datasets stored as one file per settlement date ("<dataset>_YYYY-MM-DD.parquet") are listed
+and hashed with list_partitions and hash_partitions, and the inputs of the worker processes are exchanged as Arrow
+IPC files.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+def write_parquet_atomically(df: pd.DataFrame, path: str, index: bool = False):
+    """
+    Writes a dataframe to a parquet file through a temporary file that replaces it, so that a run that fails or
+    is stopped while writing leaves the previous version of the file rather than a truncated one.
+
+    Args:
+        df (pd.DataFrame): dataframe to write.
+        path (str): path of the parquet file.
+        index (bool, optional): write the index, None to only keep a range index as metadata (see
+                                pd.DataFrame.to_parquet). Defaults to False.
+    """
+    df.to_parquet(f"{path}.tmp", index=index)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_csv_atomically(df: pd.DataFrame, path: str, index: bool = False):
+    """
+    Writes a dataframe to a CSV file through a temporary file that replaces it, see write_parquet_atomically.
+
+    Args:
+        df (pd.DataFrame): dataframe to write.
+        path (str): path of the CSV file.
+        index (bool, optional): write the index. Defaults to False.
+    """
+    df.to_csv(f"{path}.tmp", index=index)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_json_atomically(data, path: str, **kwargs):
+    """
+    Writes data to a JSON file through a temporary file that replaces it, see write_parquet_atomically.
+
+    Args:
+        data: JSON serialisable data.
+        path (str): path of the JSON file.
+        **kwargs: arguments of json.dump, e.g. indent.
+    """
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(f"{path}.tmp", path)
+
+
+def list_partitions(location: str, dataset_name: str) -> dict:
+    """
+    Lists the daily partitions of a dataset, stored as <dataset_name>_<YYYY-MM-DD>.parquet files.
+
+    Args:
+        location (str): folder containing the partitions.
+        dataset_name (str): name of the dataset, e.g. "PHYBMDATA".
+
+    Returns:
+        dict: partition paths keyed by settlement date (YYYY-MM-DD), in date order.
+    """
+    partitions = {}
+    if not os.path.isdir(location):
+        return partitions
+
+    for file_name in sorted(os.listdir(location)):
+        if file_name.startswith(f"{dataset_name}_") and file_name.endswith(".parquet"):
+            partitions[file_name[len(dataset_name) + 1 : -len(".parquet")]] = os.path.join(location, file_name)
+
+    return partitions
+
+
+def hash_partitions(partitions: dict) -> dict:
+    """
+    Hashes the files of the daily partitions of a dataset, to find the partitions that have changed since an
+    earlier run.
+
+    Args:
+        partitions (dict): partition paths keyed by settlement date, from list_partitions.
+
+    Returns:
+        dict: SHA-256 hash of every partition keyed by settlement date (YYYY-MM-DD).
+    """
+    versions = {}
+    for settlement_date, path in partitions.items():
+        with open(path, "rb") as f:
+            versions[settlement_date] = hashlib.sha256(f.read()).hexdigest()
+
+    return versions
+
+
+def write_arrow_file(df: pd.DataFrame, path: str):
+    """
+    Writes a dataframe (and its index) to an uncompressed Arrow IPC file, which other processes can memory-map
+    rather than unpickle, copying only the records they read into pandas (see read_arrow_BMUs).
+
+    Args:
+        df (pd.DataFrame): dataframe to write.
+        path (str): path of the Arrow file.
+    """
+    import pyarrow
+    import pyarrow.ipc
+
+    table = pyarrow.Table.from_pandas(df.reset_index(), preserve_index=False)
+    with pyarrow.OSFile(path, "wb") as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_arrow_BMUs(path: str, bmus: list) -> pd.DataFrame:
+    """
+    Reads the records of some BMUs from an Arrow IPC file written by write_arrow_file. The file is memory-mapped,
+    so only the records of the BMUs are copied into memory.
+
+    Args:
+        path (str): path of the Arrow file.
+        bmus (list): BMU IDs to read.
+
+    Returns:
+        pd.DataFrame: records of the BMUs, indexed by bmUnitID.
+    """
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+
+    with pyarrow.memory_map(path) as source:
+        table = pyarrow.ipc.open_file(source).read_all()
+        table = table.filter(pyarrow.compute.is_in(table["bmUnitID"], value_set=pyarrow.array(bmus)))
+        df = table.to_pandas()
+
+    return df.set_index("bmUnitID")
@@ -0,0 +1,437 @@
+"""
+The Power Station Dictionary (PSD) and the BMU lookup table compiled from it. The PSD sources are only downloaded
+again when they have changed, and the lookup table gives the station, location and fuel type that are added to
+every row of the combined generation dataset.
+"""
+
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipeline_schema import GENERATION_SCHEMA, apply_schema
+from pipeline_storage import write_csv_atomically, write_parquet_atomically
+
+
+# Sources of the merged Power Station Dictionary (see PSD_dataprep): the URL, the columns that are used and, for the
+# Elexon BMU fuel types, the file in the data directory the download is also saved to
+PSD_SOURCES = {
+    "ids": {
+        "url": "https://raw.githubusercontent.com/OSUKED/Power-Station-Dictionary/shiro/data/dictionary/ids.csv",
+        "columns": ["dictionary_id", "sett_bmu_id", "ngc_bmu_id"],
+    },
+    "locations": {
+        "url": "https://raw.githubusercontent.com/OSUKED/Power-Station-Dictionary/shiro/data/attribute_sources/plant-locations/plant-locations.csv",
+        "columns": ["dictionary_id", "longitude", "latitude"],
+    },
+    "common_names": {
+        "url": "https://raw.githubusercontent.com/OSUKED/Power-Station-Dictionary/shiro/data/attribute_sources/common-names/common-names.csv",
+        "columns": ["dictionary_id", "common_name"],
+    },
+    "fuel_types_psd": {
+        "url": "https://raw.githubusercontent.com/OSUKED/Power-Station-Dictionary/shiro/data/attribute_sources/bmu-fuel-types/fuel_types.csv",
+        "columns": ["ngc_bmu_id", "fuel_type"],
+    },
+    "fuel_types_elexon": {
+        "url": "https://www.bmreports.com/bmrs/cloud_doc/BMUFuelType.xls",
+        "columns": ["SETT_BMU_ID", "FUEL TYPE"],
+        "file": "BMUFuelType.xls",
+    },
+}
+PSD_REQUEST_TIMEOUT = 60
+
+
+def get_PSD_cache_location(location: str) -> str:
+    """
+    Returns the folder of the parsed Power Station Dictionary sources and of their manifest.
+
+    Args:
+        location (str): data directory from create_folder_structure.
+
+    Returns:
+        str: folder of the PSD source cache.
+    """
+    return os.path.join(location, "PSD")
+
+
+def read_PSD_manifest(location_PSD: str) -> dict:
+    """
+    Reads the manifest of the PSD sources: the URL, ETag, Last-Modified header and SHA-256 hash of the content of
+    each source when it was last downloaded.
+
+    Args:
+        location_PSD (str): folder of the PSD source cache.
+
+    Returns:
+        dict: manifest entry by source name, empty if there is no manifest.
+    """
+    path = os.path.join(location_PSD, "sources.json")
+    if not os.path.isfile(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_PSD_manifest(manifest: dict, location_PSD: str):
+    """
+    Writes the manifest of the PSD sources, see read_PSD_manifest.
+
+    Args:
+        manifest (dict): manifest entry by source name.
+        location_PSD (str): folder of the PSD source cache.
+    """
+    path = os.path.join(location_PSD, "sources.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(f"{path}.tmp", path)
+
+
+def fetch_PSD_source(url: str, entry: dict, session=None) -> tuple:
+    """
+    Downloads a PSD source if it changed since it was last downloaded. The request is conditional on the ETag
+    and Last-Modified header of the last download, so that servers can answer with "304 Not Modified", and a
+    full response with the same content hash as the last download is treated as unchanged as well.
+
+    Args:
+        url (str): URL of the source.
+        entry (dict): manifest entry of the last download, empty to download the source unconditionally.
+        session (requests.Session, optional): session to make the request with. Defaults to None.
+
+    Returns:
+        tuple: the content (bytes), or None if the source is unchanged, and the new manifest entry.
+    """
+    import requests
+
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = (session or requests).get(url, headers=headers, timeout=PSD_REQUEST_TIMEOUT)
+    if response.status_code == 304:
+        return None, entry
+    response.raise_for_status()
+
+    new_entry = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": hashlib.sha256(response.content).hexdigest(),
+    }
+    if new_entry["sha256"] == entry.get("sha256"):
+        return None, new_entry
+
+    return response.content, new_entry
+
+
+def parse_PSD_source(content: bytes, url: str, columns: list) -> pd.DataFrame:
+    """
+    Parses a downloaded PSD source, an Excel file for the Elexon BMU fuel types and a CSV for the others.
+
+    Args:
+        content (bytes): content of the source.
+        url (str): URL of the source.
+        columns (list): columns to keep.
+
+    Returns:
+        pd.DataFrame: the columns of the source.
+    """
+    if url.endswith(".xls"):
+        return pd.read_excel(io.BytesIO(content), usecols=columns)
+
+    return pd.read_csv(io.BytesIO(content), usecols=columns)
+
+
+def refresh_PSD_sources(location: str, sources: dict = PSD_SOURCES, force: bool = False, session=None) -> tuple:
+    """
+    Brings the parsed PSD sources up to date. Each source is only downloaded and parsed again if it changed since
+    the last refresh (see fetch_PSD_source), otherwise its parsed version is read from the parquet cache. The new
+    manifest is returned rather than written, so that the caller only writes it (see write_PSD_manifest) once it
+    has used the changed sources: until then, the next refresh finds them changed again.
+
+    Args:
+        location (str): data directory from create_folder_structure.
+        sources (dict, optional): URL, columns and optional file name by source name. Defaults to PSD_SOURCES.
+        force (bool, optional): download and parse all sources again. Defaults to False.
+        session (requests.Session, optional): session to make the requests with. Defaults to None.
+
+    Returns:
+        tuple: the parsed sources by name, whether any of them changed since the last refresh, and the new
+        manifest.
+    """
+    location_PSD = get_PSD_cache_location(location)
+    os.makedirs(location_PSD, exist_ok=True)
+    manifest = read_PSD_manifest(location_PSD)
+
+    frames, changed = {}, False
+    for name, source in sources.items():
+        path = os.path.join(location_PSD, f"{name}.parquet")
+        entry = manifest.get(name, {})
+        if force or entry.get("url") != source["url"] or not os.path.isfile(path):
+            entry = {}
+
+        content, manifest[name] = fetch_PSD_source(source["url"], entry, session=session)
+        if content is None:
+            frames[name] = pd.read_parquet(path)
+            continue
+
+        frames[name] = parse_PSD_source(content, source["url"], source["columns"])
+        write_parquet_atomically(frames[name], path, index=None)
+        if source.get("file"):
+            with open(os.path.join(location, source["file"]), "wb") as f:
+                f.write(content)
+        changed = True
+
+    return frames, changed, manifest
+
+
+def merge_PSD_sources(sources: dict) -> pd.DataFrame:
+    """
+    Splits out the different Settlement BMU IDs of the Power Station Dictionary and joins the power station
+    names, locations and fuel types.
+
+    Args:
+        sources (dict): parsed sources by name, from refresh_PSD_sources.
+
+    Returns:
+        pd.DataFrame: the merged Power Station Dictionary, with one row per Settlement BMU ID.
+    """
+    df_ids = sources["ids"]
+    # Drop any older power stations that don't have a Settlement BMU ID
+    df_ids = df_ids[df_ids["ngc_bmu_id"].notna()]
+
+    # Split the IDs dataset so that each of the Settlement BMU IDs becomes its own row
+    df_sett_ids_long = (
+        pd.DataFrame(df_ids["sett_bmu_id"].str.split(",").tolist(), index=df_ids["dictionary_id"])
+        .stack()
+        .reset_index()
+        .drop(columns="level_1")
+        .rename(columns={0: "sett_bmuID"})
+    )
+    df_sett_ids_long["sett_bmuID"] = df_sett_ids_long["sett_bmuID"].str.strip()
+    df_sett_ids_long["sett_ngc_bmu_matching_ID"] = df_sett_ids_long["sett_bmuID"].str.slice(start=2)
+
+    # Merge the exploded IDs dataset with the common names, locations and psd fuel types
+    df_psd_merged = df_sett_ids_long.merge(sources["common_names"], how="left", on="dictionary_id").merge(
+        sources["locations"], how="left", on="dictionary_id"
+    )
+    df_psd_merged = df_psd_merged.merge(
+        sources["fuel_types_psd"],
+        how="left",
+        left_on="sett_ngc_bmu_matching_ID",
+        right_on="ngc_bmu_id",
+    )
+
+    # Merge the fuel types based on the BMU ID and the SETT_BMU_ID
+    df_psd_merged = df_psd_merged.merge(
+        sources["fuel_types_elexon"],
+        how="left",
+        left_on="sett_bmuID",
+        right_on="SETT_BMU_ID",
+    )
+
+    # Set the final fuel type from the two datasets
+    df_psd_merged["fuel"] = np.where(
+        df_psd_merged["FUEL TYPE"].isnull(), df_psd_merged["fuel_type"], df_psd_merged["FUEL TYPE"]
+    )
+
+    return df_psd_merged.drop(columns=["sett_ngc_bmu_matching_ID", "fuel_type", "SETT_BMU_ID", "FUEL TYPE"])
+
+
+# Dashboard metadata of the BMUs that are not in the Power Station Dictionary
+BMU_METADATA_DEFAULTS = {
+    "dictionaryID": 99999,
+    "commonName": "Unknown Name/Location",
+    "longitude": -2.547855,
+    "latitude": 54.00366,
+    "fuel": "Unknown Fuel",
+}
+BMU_METADATA_COLUMNS = list(BMU_METADATA_DEFAULTS) + ["lowCarbonGeneration", "renewableGeneration"]
+
+# Classification of the PSD/Elexon fuel types, and their names on the dashboard
+LOW_CARBON_FUELS = ["BIOMASS", "NPSHYD", "NUCLEAR", "PS", "WIND", "Wind"]
+RENEWABLE_FUELS = ["BIOMASS", "NPSHYD", "PS", "WIND", "Wind"]
+FUEL_TYPE_FRIENDLY = {
+    "BIOMASS": "Biomass",
+    "CCGT": "Combined-cycle Gas Turbine",
+    "COAL": "Coal",
+    "OCGT": "Open-cycle Gas Turbine",
+    "NPSHYD": "Other Hydro",
+    "NUCLEAR": "Nuclear",
+    "PS": "Pumped Storage Hydro",
+    "WIND": "Wind",
+    "Wind": "Wind",
+}
+
+
+def get_BMU_metadata_path(location: str) -> str:
+    """
+    Returns the path of the compiled BMU metadata written by PSD_dataprep, next to "merged_psd.csv".
+
+    Args:
+        location (str): data directory from create_folder_structure.
+
+    Returns:
+        str: path of the BMU metadata file.
+    """
+    return os.path.join(location, "bmu_metadata.parquet")
+
+
+def compile_BMU_metadata(df_psd_merged: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compiles the merged Power Station Dictionary into a lookup table of the dashboard metadata of each BMU: the
+    names, locations and fuel types with the defaults filled in, the low carbon/renewable split and the friendly
+    fuel type names. The table is indexed by BMU ID, with the first dictionary entry of a BMU ID kept, and its
+    last row holds the defaults for the BMUs that are not in the dictionary.
+
+    Args:
+        df_psd_merged (pd.DataFrame): merged Power Station Dictionary written by PSD_dataprep.
+
+    Returns:
+        pd.DataFrame: the BMU_METADATA_COLUMNS by BMUnitID, with the types of GENERATION_SCHEMA.
+    """
+    df_bmu_metadata = df_psd_merged.dropna(subset=["sett_bmuID"]).drop_duplicates(subset="sett_bmuID")
+    df_bmu_metadata = df_bmu_metadata.rename(
+        columns={
+            "sett_bmuID": "BMUnitID",
+            "dictionary_id": "dictionaryID",
+            "common_name": "commonName",
+        }
+    )
+    df_bmu_metadata = pd.concat([df_bmu_metadata, pd.DataFrame({"BMUnitID": [np.nan]})], ignore_index=True)
+    df_bmu_metadata = df_bmu_metadata.set_index("BMUnitID")[list(BMU_METADATA_DEFAULTS)]
+    df_bmu_metadata = df_bmu_metadata.fillna(BMU_METADATA_DEFAULTS)
+
+    # Split data into renewable/non-renewable
+    df_bmu_metadata["lowCarbonGeneration"] = np.where(
+        df_bmu_metadata["fuel"].isin(LOW_CARBON_FUELS), "Low Carbon Generation", "Carbon Intensive Generation"
+    )
+    df_bmu_metadata["renewableGeneration"] = np.where(
+        df_bmu_metadata["fuel"].isin(RENEWABLE_FUELS), "Renewable Generation", "Non-Renewable Generation"
+    )
+
+    # Give the Fuel Types a more friendly name
+    df_bmu_metadata["fuel"] = df_bmu_metadata["fuel"].replace(to_replace=FUEL_TYPE_FRIENDLY)
+
+    return apply_schema(df_bmu_metadata, GENERATION_SCHEMA)
+
+
+def write_BMU_metadata(df_bmu_metadata: pd.DataFrame, location: str):
+    """
+    Writes the compiled BMU metadata to parquet.
+
+    Args:
+        df_bmu_metadata (pd.DataFrame): output of compile_BMU_metadata.
+        location (str): data directory from create_folder_structure.
+    """
+    write_parquet_atomically(df_bmu_metadata, get_BMU_metadata_path(location), index=None)
+
+
+def update_merged_PSD(location: str, sources: dict = PSD_SOURCES, force: bool = False, session=None) -> bool:
+    """
+    Refreshes the PSD sources (see refresh_PSD_sources) and, if any of them changed or the BMU metadata is missing,
+    rebuilds the merged Power Station Dictionary ("merged_psd.csv") and the compiled BMU metadata. The manifest of
+    the sources is only written once they are, so that a failed rebuild is tried again on the next refresh.
+
+    Args:
+        location (str): data directory from create_folder_structure.
+        sources (dict, optional): URL, columns and optional file name by source name. Defaults to PSD_SOURCES.
+        force (bool, optional): download and parse all sources again. Defaults to False.
+        session (requests.Session, optional): session to make the requests with. Defaults to None.
+
+    Returns:
+        bool: whether the merged Power Station Dictionary was rebuilt.
+    """
+    psd_sources, psd_changed, manifest = refresh_PSD_sources(location, sources=sources, force=force, session=session)
+    psd_rebuilt = psd_changed or not os.path.isfile(get_BMU_metadata_path(location))
+    if psd_rebuilt:
+        df_psd_merged = merge_PSD_sources(psd_sources)
+        write_csv_atomically(df_psd_merged, os.path.join(location, "merged_psd.csv"), index=True)
+        write_BMU_metadata(compile_BMU_metadata(df_psd_merged), location)
+
+    write_PSD_manifest(manifest, get_PSD_cache_location(location))
+
+    return psd_rebuilt
+
+
+def read_BMU_metadata(location: str) -> pd.DataFrame:
+    """
+    Reads the compiled BMU metadata written by PSD_dataprep. If it is missing or older than "merged_psd.csv",
+    e.g. because the CSV was updated without running PSD_dataprep, it is compiled from the CSV instead.
+
+    Args:
+        location (str): data directory from create_folder_structure.
+
+    Returns:
+        pd.DataFrame: output of compile_BMU_metadata.
+    """
+    path = get_BMU_metadata_path(location)
+    path_psd = os.path.join(location, "merged_psd.csv")
+    if os.path.isfile(path) and (not os.path.isfile(path_psd) or os.path.getmtime(path) >= os.path.getmtime(path_psd)):
+        return pd.read_parquet(path)
+
+    return compile_BMU_metadata(pd.read_csv(path_psd, header=0, index_col=0))
+
+
+def get_BMU_metadata_rows(bmu_ids: pd.Series, df_bmu_metadata: pd.DataFrame) -> np.ndarray:
+    """
+    Returns the row of the BMU lookup table of each BMU ID. The rows are looked up once per BMU ID category and
+    taken by category code, rather than merged on the BMU ID strings. BMUs that are not in the lookup table get
+    its last row, the defaults.
+
+    Args:
+        bmu_ids (pd.Series): BMU IDs.
+        df_bmu_metadata (pd.DataFrame): output of compile_BMU_metadata or read_BMU_metadata.
+
+    Returns:
+        np.ndarray: position of the metadata row of each BMU ID.
+    """
+    bmu_ids = bmu_ids.astype("category")
+    # Row of each category, and the default row for missing BMU IDs (code -1 takes the last entry)
+    category_rows = np.append(df_bmu_metadata.index.get_indexer(bmu_ids.cat.categories), -1)
+
+    return category_rows[bmu_ids.cat.codes.to_numpy()]
+
+
+def add_BMU_metadata(df_generation: pd.DataFrame, df_bmu_metadata: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the names, locations, fuel types and low carbon/renewable split of the BMUs to the generation data (see
+    get_BMU_metadata_rows).
+
+    Args:
+        df_generation (pd.DataFrame): output of combine_generation_data.
+        df_bmu_metadata (pd.DataFrame): output of compile_BMU_metadata or read_BMU_metadata.
+
+    Returns:
+        pd.DataFrame: the final combined generation dataset, with the types of GENERATION_SCHEMA.
+    """
+    rows = get_BMU_metadata_rows(df_generation["bmUnitID"], df_bmu_metadata)
+
+    df_generation = df_generation[["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID", "quantity"]]
+    df_generation = df_generation.rename(columns={"local_datetime": "localDateTime", "bmUnitID": "BMUnitID"})
+    df_generation = df_generation.reset_index(drop=True)
+    for column in BMU_METADATA_COLUMNS:
+        df_generation[column] = df_bmu_metadata[column].take(rows).values
+
+    return apply_schema(df_generation, GENERATION_SCHEMA)
+
+
+def add_psd_metadata(df_generation: pd.DataFrame, df_psd_merged: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the Power Station Dictionary metadata to the generation data, compiling the BMU lookup table on the fly
+    (see compile_BMU_metadata and add_BMU_metadata).
+
+    Args:
+        df_generation (pd.DataFrame): output of combine_generation_data.
+        df_psd_merged (pd.DataFrame): merged Power Station Dictionary written by PSD_dataprep.
+
+    Returns:
+        pd.DataFrame: the final combined generation dataset, with the types of GENERATION_SCHEMA.
+    """
+    return add_BMU_metadata(df_generation, compile_BMU_metadata(df_psd_merged))
@@ -0,0 +1,191 @@
+"""
+Calendar of the GB settlement periods. A settlement date runs from midnight to midnight local (Europe/London)
+time and is split into half-hourly settlement periods, numbered from 1, so it has 48 settlement periods, 46 on the
+day the clocks go forward and 50 on the day they go back. The start of every day in UTC and its number of
+settlement periods are precomputed once for CALENDAR_START to CALENDAR_END, so that converting between
+(settlement date, settlement period) and timestamps is integer arithmetic and indexing into these arrays, rather
+than parsing or converting time zones row by row.
+
+As in the rest of the pipeline, settlement dates are represented by midnight UTC of the date, and the start of a
+settlement period in UTC is called local_datetime.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+CALENDAR_START = "2000-01-01"
+CALENDAR_END = "2050-12-31"
+SETTLEMENT_TIMEZONE = "Europe/London"
+
+NANOSECONDS_PER_DAY = 24 * 3600 * 10**9
+NANOSECONDS_PER_PERIOD = 30 * 60 * 10**9
+
+
+@lru_cache(maxsize=None)
+def get_calendar_days() -> tuple:
+    """
+    Precomputes the settlement dates of the calendar.
+
+    Returns:
+        tuple: the settlement dates (midnight UTC, as int64 nanoseconds), the start of each day in UTC (int64
+        nanoseconds), the number of settlement periods of each day, the index of the first settlement period of
+        each day among all settlement periods of the calendar, and the dates as YYYY-MM-DD strings.
+    """
+    settlement_dates = pd.date_range(CALENDAR_START, CALENDAR_END, freq="D")
+    day_starts = settlement_dates.tz_localize(SETTLEMENT_TIMEZONE).tz_convert("UTC")
+    day_ends = (settlement_dates + pd.Timedelta(days=1)).tz_localize(SETTLEMENT_TIMEZONE).tz_convert("UTC")
+
+    day_starts_ns = day_starts.asi8
+    n_periods = ((day_ends.asi8 - day_starts_ns) // NANOSECONDS_PER_PERIOD).astype("int64")
+    first_period = np.cumsum(n_periods) - n_periods
+    labels = np.asarray(settlement_dates.strftime("%Y-%m-%d"), dtype=object)
+
+    return settlement_dates.asi8, day_starts_ns, n_periods, first_period, labels
+
+
+def get_day_index(settlement_date) -> np.ndarray:
+    """
+    Returns the position of settlement dates in the calendar.
+
+    Args:
+        settlement_date: settlement dates (midnight UTC), e.g. the settlementDate column.
+
+    Returns:
+        np.ndarray: int64 day index of each settlement date.
+    """
+    dates_ns, _, _, _, _ = get_calendar_days()
+    settlement_date = pd.DatetimeIndex(pd.Series(settlement_date).to_numpy(dtype="datetime64[ns]"))
+    if settlement_date.hasnans:
+        raise ValueError("Settlement dates must not be missing")
+
+    day_index = (settlement_date.asi8 - dates_ns[0]) // NANOSECONDS_PER_DAY
+    if len(day_index) and (day_index.min() < 0 or day_index.max() >= len(dates_ns)):
+        raise ValueError(f"Settlement dates must be between {CALENDAR_START} and {CALENDAR_END}")
+
+    return day_index
+
+
+def get_settlement_calendar(start_date, end_date) -> pd.DataFrame:
+    """
+    Returns the settlement periods of a range of settlement dates.
+
+    Args:
+        start_date: first settlement date, e.g. "2024-03-31".
+        end_date: last settlement date.
+
+    Returns:
+        pd.DataFrame: settlementDate, settlementPeriod, the start (local_datetime) and end (local_datetime_end) of
+        each settlement period in UTC, and its start in local time (london_datetime).
+    """
+    dates_ns, day_starts_ns, n_periods, first_period, _ = get_calendar_days()
+    first_day, last_day = get_day_index([pd.Timestamp(start_date), pd.Timestamp(end_date)])
+
+    days = np.repeat(np.arange(first_day, last_day + 1), n_periods[first_day : last_day + 1])
+    global_period = first_period[first_day] + np.arange(len(days))
+    settlement_period = global_period - first_period[days] + 1
+    period_start = day_starts_ns[days] + (settlement_period - 1) * NANOSECONDS_PER_PERIOD
+
+    local_datetime = pd.to_datetime(period_start, utc=True)
+    return pd.DataFrame(
+        {
+            "settlementDate": pd.to_datetime(dates_ns[days], utc=True),
+            "settlementPeriod": settlement_period.astype("int8"),
+            "local_datetime": local_datetime,
+            "local_datetime_end": local_datetime + pd.Timedelta(minutes=30),
+            "london_datetime": local_datetime.tz_convert(SETTLEMENT_TIMEZONE),
+        }
+    )
+
+
+def get_periods_in_day(settlement_date) -> np.ndarray:
+    """
+    Returns the number of settlement periods of settlement dates: 48, or 46 or 50 on the clock change days.
+
+    Args:
+        settlement_date: settlement dates (midnight UTC).
+
+    Returns:
+        np.ndarray: number of settlement periods of each settlement date.
+    """
+    return get_calendar_days()[2][get_day_index(settlement_date)]
+
+
+def get_settlement_period_start(settlement_date, settlement_period) -> pd.DatetimeIndex:
+    """
+    Returns the start in UTC of settlement periods.
+
+    Args:
+        settlement_date: settlement dates (midnight UTC).
+        settlement_period: settlement periods, from 1 to the number of settlement periods of the day.
+
+    Returns:
+        pd.DatetimeIndex: start of each settlement period (local_datetime).
+    """
+    _, day_starts_ns, n_periods, _, _ = get_calendar_days()
+    day_index = get_day_index(settlement_date)
+    settlement_period = np.asarray(settlement_period, dtype="int64")
+    if len(settlement_period) and (settlement_period.min() < 1 or (settlement_period > n_periods[day_index]).any()):
+        raise ValueError("Settlement periods must be between 1 and the number of settlement periods of the day")
+
+    return pd.to_datetime(day_starts_ns[day_index] + (settlement_period - 1) * NANOSECONDS_PER_PERIOD, utc=True)
+
+
+def get_settlement_period(timestamp) -> tuple:
+    """
+    Returns the settlement date and settlement period that timestamps fall in.
+
+    Args:
+        timestamp: timezone-aware timestamps.
+
+    Returns:
+        tuple: settlement dates (pd.DatetimeIndex, midnight UTC) and settlement periods (np.ndarray of int8).
+    """
+    dates_ns, day_starts_ns, n_periods, first_period, _ = get_calendar_days()
+    timestamp = pd.DatetimeIndex(pd.Series(timestamp)).tz_convert("UTC")
+    global_period = (timestamp.asi8 - day_starts_ns[0]) // NANOSECONDS_PER_PERIOD
+    if len(global_period) and (global_period.min() < 0 or global_period.max() >= first_period[-1] + n_periods[-1]):
+        raise ValueError(f"Timestamps must be between {CALENDAR_START} and {CALENDAR_END}")
+
+    day_index = np.searchsorted(first_period, global_period, side="right") - 1
+    settlement_period = (global_period - first_period[day_index] + 1).astype("int8")
+
+    return pd.to_datetime(dates_ns[day_index], utc=True), settlement_period
+
+
+def get_settlement_date_labels(settlement_date) -> np.ndarray:
+    """
+    Returns settlement dates in the format YYYY-MM-DD, e.g. to name the daily partitions of a dataset, by looking
+    them up in the calendar instead of formatting every row.
+
+    Args:
+        settlement_date: settlement dates (midnight UTC).
+
+    Returns:
+        np.ndarray: settlement dates as strings.
+    """
+    return get_calendar_days()[4][get_day_index(settlement_date)]
+
+
+def add_settlement_period_start(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sets the local_datetime column of a dataframe with settlementDate and settlementPeriod columns, e.g. as
+    returned by the API, to the start of the settlement period from the calendar. The settlement dates are parsed
+    once per distinct date rather than once per row.
+
+    Args:
+        df (pd.DataFrame): dataframe with settlementDate and settlementPeriod columns.
+
+    Returns:
+        pd.DataFrame: a copy of the dataframe with settlementDate as midnight UTC and local_datetime.
+    """
+    df = df.copy()
+    if str(df["settlementDate"].dtype) != "datetime64[ns, UTC]":
+        codes, dates = pd.factorize(df["settlementDate"])
+        if (codes < 0).any():
+            raise ValueError("Settlement dates must not be missing")
+        df["settlementDate"] = pd.to_datetime(dates, utc=True)[codes]
+    df["local_datetime"] = get_settlement_period_start(df["settlementDate"], pd.to_numeric(df["settlementPeriod"]))
+
+    return df
@@ -0,0 +1,211 @@
+"""
+Synthetic B1610 and Physical BM Data in the format of the BMRS API, to run the pipeline stages offline, e.g. in
+benchmark_pipeline.py. The settlement periods are taken from the settlement calendar, so the clock change days
+have 46 or 50 settlement periods as in the API data.
+"""
+
+import numpy as np
+import pandas as pd
+
+import bmrs_data
+from pipeline_schema import B1610_SCHEMA, apply_schema
+from settlement_calendar import get_settlement_calendar
+
+
+def make_bmu_ids(n_bmu: int, known_bmu_ids: list = None) -> np.ndarray:
+    """
+    Returns BMU IDs for the synthetic data: the known IDs first (e.g. the BMUs of the Power Station Dictionary,
+    so that the PSD join finds matches), then made-up IDs.
+
+    Args:
+        n_bmu (int): number of BMUs.
+        known_bmu_ids (list, optional): real BMU IDs to use first. Defaults to None.
+
+    Returns:
+        np.ndarray: n_bmu BMU IDs.
+    """
+    known_bmu_ids = list(dict.fromkeys(known_bmu_ids or []))[:n_bmu]
+    synthetic_ids = [f"T_SYN-{i:04d}" for i in range(n_bmu - len(known_bmu_ids))]
+
+    return np.array(known_bmu_ids + synthetic_ids, dtype=object)
+
+
+def make_settlement_periods(start_date: str, n_days: int) -> pd.DataFrame:
+    """
+    Returns the settlement periods of n_days days with their settlement date and start time (local_datetime,
+    in UTC as returned by the API).
+
+    Args:
+        start_date (str): first settlement date, e.g. "2024-06-01".
+        n_days (int): number of days.
+
+    Returns:
+        pd.DataFrame: settlementDate, settlementPeriod and local_datetime of each settlement period.
+    """
+    end_date = pd.Timestamp(start_date) + pd.Timedelta(days=n_days - 1)
+
+    return get_settlement_calendar(start_date, end_date)[["settlementDate", "settlementPeriod", "local_datetime"]]
+
+
+def make_synthetic_B1610(
+    n_bmu: int = 100,
+    n_days: int = 7,
+    start_date: str = "2024-06-01",
+    known_bmu_ids: list = None,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Creates synthetic B1610 data (metered generation by BMU and settlement period).
+
+    Args:
+        n_bmu (int): number of BMUs.
+        n_days (int): number of settlement dates.
+        start_date (str): first settlement date.
+        known_bmu_ids (list, optional): real BMU IDs to use, see make_bmu_ids. Defaults to None.
+        seed (int): random seed.
+
+    Returns:
+        pd.DataFrame: B1610 data in the format of setup_update_B1610_data.
+    """
+    rng = np.random.default_rng(seed)
+    bmu_ids = make_bmu_ids(n_bmu, known_bmu_ids)
+    df_periods = make_settlement_periods(start_date, n_days)
+    capacity = rng.uniform(10, 1000, n_bmu)
+
+    df_B1610 = pd.DataFrame(
+        {
+            "local_datetime": np.tile(df_periods["local_datetime"], n_bmu),
+            "settlementDate": np.tile(df_periods["settlementDate"], n_bmu),
+            "settlementPeriod": np.tile(df_periods["settlementPeriod"], n_bmu),
+            "bmUnitID": np.repeat(bmu_ids, len(df_periods)),
+            "quantity": (np.repeat(capacity, len(df_periods)) * rng.uniform(0, 1, n_bmu * len(df_periods))).round(3),
+        }
+    )
+
+    return apply_schema(df_B1610, B1610_SCHEMA)
+
+
+def make_synthetic_PHYBMDATA(
+    n_bmu: int = 100,
+    n_days: int = 1,
+    start_date: str = "2024-06-01",
+    boal_density: float = 0.2,
+    overlap_fraction: float = 0.3,
+    known_bmu_ids: list = None,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Creates synthetic Physical BM Data with one or two FPN records and one MEL record per BMU and settlement
+    period, and bid-offer acceptances (BOALF). As in the API data, acceptances are split into one record per
+    settlement period they cover.
+
+    Args:
+        n_bmu (int): number of BMUs.
+        n_days (int): number of settlement dates.
+        start_date (str): first settlement date.
+        boal_density (float): expected number of acceptances per BMU and settlement period.
+        overlap_fraction (float): fraction of the acceptances that are partly overwritten by a later acceptance
+                                  for the same BMU.
+        known_bmu_ids (list, optional): real BMU IDs to use, see make_bmu_ids. Defaults to None.
+        seed (int): random seed.
+
+    Returns:
+        pd.DataFrame: Physical BM Data in the format of format_PHYBM_data.
+    """
+    rng = np.random.default_rng(seed)
+    bmu_ids = make_bmu_ids(n_bmu, known_bmu_ids)
+    df_periods = make_settlement_periods(start_date, n_days)
+    n_periods = len(df_periods)
+    capacity = rng.uniform(10, 1000, n_bmu)
+
+    # One row per BMU and settlement period
+    bmu = np.repeat(np.arange(n_bmu), n_periods)
+    period = np.tile(np.arange(n_periods), n_bmu)
+    period_start = df_periods["local_datetime"].to_numpy(dtype="datetime64[ns]")[period]
+    period_capacity = capacity[bmu]
+
+    # FPN: half of the settlement periods have a change of level part-way through
+    split = rng.random(len(bmu)) < 0.5
+    split_minute = np.where(split, rng.integers(1, 30, len(bmu)), 30)
+    fpn_levels = rng.uniform(0, 1, (3, len(bmu))) * period_capacity
+    df_fpn = pd.DataFrame(
+        {
+            "recordType": "PN",
+            "bmu": np.r_[bmu, bmu[split]],
+            "period": np.r_[period, period[split]],
+            "timeFrom": np.r_[period_start, period_start[split] + split_minute[split] * np.timedelta64(1, "m")],
+            "timeTo": np.r_[
+                period_start + split_minute * np.timedelta64(1, "m"),
+                period_start[split] + np.timedelta64(30, "m"),
+            ],
+            "pnLevelFrom": np.r_[fpn_levels[0], fpn_levels[1][split]],
+            "pnLevelTo": np.r_[fpn_levels[1], fpn_levels[2][split]],
+        }
+    )
+
+    # MEL: constant within each settlement period
+    mel_level = period_capacity * rng.uniform(0.6, 1.1, len(bmu))
+    df_mel = pd.DataFrame(
+        {
+            "recordType": "MEL",
+            "bmu": bmu,
+            "period": period,
+            "timeFrom": period_start,
+            "timeTo": period_start + np.timedelta64(30, "m"),
+            "melLevelFrom": mel_level,
+            "melLevelTo": mel_level,
+        }
+    )
+
+    # BOALF: acceptances of 5 to 60 minutes, some partly overwritten by a later acceptance
+    n_acceptances = rng.poisson(boal_density * len(bmu))
+    acceptance_row = rng.integers(0, len(bmu), n_acceptances)
+    acceptance_bmu = bmu[acceptance_row]
+    acceptance_start = period[acceptance_row] * 30 + rng.integers(0, 30, n_acceptances)
+    acceptance_length = rng.integers(5, 61, n_acceptances)
+
+    overlapping = rng.random(n_acceptances) < overlap_fraction
+    acceptance_bmu = np.r_[acceptance_bmu, acceptance_bmu[overlapping]]
+    acceptance_start = np.r_[
+        acceptance_start,
+        acceptance_start[overlapping] + rng.integers(0, acceptance_length[overlapping]),
+    ]
+    acceptance_start = np.minimum(acceptance_start, n_periods * 30 - 1)
+    acceptance_length = np.r_[acceptance_length, rng.integers(5, 61, overlapping.sum())]
+    acceptance_end = np.minimum(acceptance_start + acceptance_length, n_periods * 30)
+    acceptance_level = rng.uniform(0, 1, len(acceptance_bmu)) * capacity[acceptance_bmu]
+    acceptance_number = 100000 + np.arange(len(acceptance_bmu))
+
+    # Split the acceptances at the settlement period boundaries
+    first_period = acceptance_start // 30
+    n_records = (acceptance_end - 1) // 30 - first_period + 1
+    record_acceptance = np.repeat(np.arange(len(acceptance_bmu)), n_records)
+    record_period = first_period[record_acceptance] + (
+        np.arange(n_records.sum()) - np.repeat(np.cumsum(n_records) - n_records, n_records)
+    )
+    record_start = np.maximum(acceptance_start[record_acceptance], record_period * 30)
+    record_end = np.minimum(acceptance_end[record_acceptance], (record_period + 1) * 30)
+    first_start = df_periods["local_datetime"].to_numpy(dtype="datetime64[ns]")[0]
+    df_boal = pd.DataFrame(
+        {
+            "recordType": "BOALF",
+            "bmu": acceptance_bmu[record_acceptance],
+            "period": record_period,
+            "timeFrom": first_start + record_start * np.timedelta64(1, "m"),
+            "timeTo": first_start + record_end * np.timedelta64(1, "m"),
+            "bidOfferAcceptanceNumber": acceptance_number[record_acceptance],
+            "acceptanceTime": first_start + (acceptance_start[record_acceptance] - 5) * np.timedelta64(1, "m"),
+            "bidOfferLevelFrom": acceptance_level[record_acceptance],
+            "bidOfferLevelTo": acceptance_level[record_acceptance],
+        }
+    )
+
+    df_PHYBMDATA = pd.concat((df_fpn, df_mel, df_boal), ignore_index=True)
+    df_PHYBMDATA["bmUnitID"] = bmu_ids[df_PHYBMDATA["bmu"]]
+    for column in ["settlementDate", "settlementPeriod", "local_datetime"]:
+        df_PHYBMDATA[column] = df_periods[column].iloc[df_PHYBMDATA["period"]].to_numpy()
+    for column in ["timeFrom", "timeTo", "acceptanceTime"]:
+        df_PHYBMDATA[column] = pd.to_datetime(df_PHYBMDATA[column], utc=True)
+    df_PHYBMDATA = df_PHYBMDATA.reindex(columns=bmrs_data.PHYBMDATA_COLUMNS)
+
+    return bmrs_data.format_PHYBM_data(df_PHYBMDATA.sort_values(["bmUnitID", "timeFrom"], kind="stable"))
@@ -0,0 +1,252 @@
+"""
+Correction of the FPN of the wind BMUs, which tends to overstate their output. A linear correction is fitted per
+BMU on the historic FPN and B1610 data of the same settlement periods, and applied to the Physical BM Data before
+the settlement period generation is calculated.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from backtest import align_generation_estimate
+from pipeline_schema import B1610_SCHEMA, apply_schema
+from pipeline_storage import write_json_atomically, write_parquet_atomically
+from psd import FUEL_TYPE_FRIENDLY
+from settlement_calendar import get_settlement_date_labels, get_settlement_period
+
+
+# Minimum number of settlement periods of FPN and B1610 data for the FPN correction of a wind BMU to be fitted (see
+# update_wind_FPN_correction)
+WIND_CORRECTION_MIN_PERIODS = 96
+
+
+def get_wind_correction_location(location_BMRS_Final: str) -> str:
+    """
+    Returns the folder of the wind FPN correction (see update_wind_FPN_correction).
+
+    Args:
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+
+    Returns:
+        str: path of the WindCorrection folder.
+    """
+    return os.path.join(location_BMRS_Final, "WindCorrection")
+
+
+def summarise_settlement_period_FPN(df_PHYBMDATA: pd.DataFrame) -> pd.DataFrame:
+    """
+    Calculates the mean FPN of each BMU and settlement period, weighting the mean level of each FPN record (linear
+    between pnLevelFrom and pnLevelTo) by its duration.
+
+    Args:
+        df_PHYBMDATA (pd.DataFrame): formatted Physical BM Data (see format_PHYBM_data).
+
+    Returns:
+        pd.DataFrame: mean FPN (quantity, MW) by local_datetime, settlementDate, settlementPeriod and bmUnitID, with
+        the types of B1610_SCHEMA.
+    """
+    keys = ["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID"]
+    df_fpn = df_PHYBMDATA.loc[df_PHYBMDATA["recordType"] == "PN"]
+    duration = (df_fpn["timeTo"] - df_fpn["timeFrom"]).dt.total_seconds().to_numpy()
+    mean_level = (df_fpn["pnLevelFrom"].to_numpy("float64") + df_fpn["pnLevelTo"].to_numpy("float64")) / 2
+
+    df_fpn = df_fpn[keys].assign(energy=mean_level * duration, duration=duration)
+    df_fpn = df_fpn.loc[df_fpn["duration"] > 0].groupby(keys, observed=True, sort=True)[["energy", "duration"]].sum()
+    df_fpn["quantity"] = df_fpn["energy"] / df_fpn["duration"]
+
+    return apply_schema(df_fpn.reset_index()[keys + ["quantity"]], B1610_SCHEMA)
+
+
+def fit_wind_FPN_correction(
+    df_FPN_history: pd.DataFrame, df_B1610: pd.DataFrame, min_periods: int = WIND_CORRECTION_MIN_PERIODS
+) -> pd.DataFrame:
+    """
+    Fits a linear correction (metered = intercept + scale * FPN) of the settlement period FPN of every BMU at once,
+    by least squares on the historic FPN and B1610 data of the same settlement periods, aligned as in the backtest
+    (see align_generation_estimate). The fit only needs the sums of the FPN, metered generation, their squares and
+    products by BMU, which are calculated by a single groupby.
+
+    Args:
+        df_FPN_history (pd.DataFrame): mean FPN by settlement period from summarise_settlement_period_FPN.
+        df_B1610 (pd.DataFrame): B1610 data with the types of B1610_SCHEMA.
+        min_periods (int, optional): minimum number of settlement periods to fit a BMU. Defaults to
+                                     WIND_CORRECTION_MIN_PERIODS.
+
+    Returns:
+        pd.DataFrame: intercept_MW, scale, the number of settlement periods and the RMSE of the FPN before and
+        after the correction, indexed by bmUnitID, for the BMUs that could be fitted.
+    """
+    columns = ["intercept_MW", "scale", "n_periods", "RMSE_before_MW", "RMSE_after_MW"]
+
+    # Only the settlement dates and BMUs in both datasets are compared
+    dates = np.intersect1d(df_FPN_history["settlementDate"].unique(), df_B1610["settlementDate"].unique())
+    df_FPN_history = df_FPN_history.loc[df_FPN_history["settlementDate"].isin(dates)]
+    df_B1610 = df_B1610.loc[
+        df_B1610["settlementDate"].isin(dates)
+        & df_B1610["bmUnitID"].astype(str).isin(df_FPN_history["bmUnitID"].astype(str).unique())
+    ]
+    if df_FPN_history.empty:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name="bmUnitID"))
+
+    df_aligned = align_generation_estimate(df_FPN_history, df_B1610)
+    fpn = df_aligned["estimate_MW"].to_numpy()
+    metered = df_aligned["metered_MW"].to_numpy()
+    df_sums = (
+        pd.DataFrame(
+            {
+                "bmUnitID": df_aligned["bmUnitID"],
+                "n": 1,
+                "x": fpn,
+                "y": metered,
+                "xx": fpn**2,
+                "xy": fpn * metered,
+                "yy": metered**2,
+            }
+        )
+        .groupby("bmUnitID", observed=True)
+        .sum()
+    )
+
+    n = df_sums["n"]
+    mean_x, mean_y = df_sums["x"] / n, df_sums["y"] / n
+    var_x = df_sums["xx"] / n - mean_x**2
+    var_y = df_sums["yy"] / n - mean_y**2
+    cov_xy = df_sums["xy"] / n - mean_x * mean_y
+    fitted = (n >= min_periods) & (var_x > 1e-6)
+
+    df_correction = pd.DataFrame(index=df_sums.index)
+    df_correction["scale"] = cov_xy / var_x.where(fitted)
+    df_correction["intercept_MW"] = mean_y - df_correction["scale"] * mean_x
+    df_correction["n_periods"] = n
+    df_correction["RMSE_before_MW"] = np.sqrt((df_sums["xx"] - 2 * df_sums["xy"] + df_sums["yy"]) / n)
+    df_correction["RMSE_after_MW"] = np.sqrt((var_y - cov_xy * df_correction["scale"]).clip(lower=0))
+    df_correction.index = df_correction.index.astype(str)
+
+    return df_correction.loc[fitted.to_numpy(), columns]
+
+
+def update_wind_FPN_correction(
+    df_PHYBMDATA: pd.DataFrame,
+    df_B1610: pd.DataFrame,
+    df_bmu_metadata: pd.DataFrame,
+    location_BMRS_Final: str,
+    now: pd.Timestamp = None,
+    min_periods: int = WIND_CORRECTION_MIN_PERIODS,
+) -> pd.DataFrame:
+    """
+    Keeps the FPN correction of the wind BMUs (see fit_wind_FPN_correction) up to date, in the WindCorrection
+    folder:
+    * The Physical BM Data is deleted once the B1610 data covers it, so the mean FPN of the wind BMUs of every
+      complete settlement date is kept in "wind_FPN_history.parquet", for the dates the B1610 data still covers.
+      Each date is summarised once, on the first run after it ends.
+    * The correction is refitted and stored in "wind_FPN_correction.parquet" only when the B1610 data has new
+      days. Otherwise, the stored correction is returned.
+    A JSON sidecar records the dates in the history and the latest B1610 date the correction was fitted with.
+
+    Args:
+        df_PHYBMDATA (pd.DataFrame): Physical BM Data from setup_update_PHYBM_data, without the correction.
+        df_B1610 (pd.DataFrame): B1610 data from setup_update_B1610_data.
+        df_bmu_metadata (pd.DataFrame): BMU lookup table from read_BMU_metadata, for the fuel of each BMU.
+        location_BMRS_Final (str): directory with the final combined live generation dataset.
+        now (pd.Timestamp, optional): time of the run. Defaults to the current time.
+        min_periods (int, optional): minimum number of settlement periods to fit a BMU. Defaults to
+                                     WIND_CORRECTION_MIN_PERIODS.
+
+    Returns:
+        pd.DataFrame: the correction from fit_wind_FPN_correction.
+    """
+    location_correction = get_wind_correction_location(location_BMRS_Final)
+    os.makedirs(location_correction, exist_ok=True)
+    path_history = os.path.join(location_correction, "wind_FPN_history.parquet")
+    path_correction = os.path.join(location_correction, "wind_FPN_correction.parquet")
+    path_metadata = os.path.join(location_correction, "wind_FPN_correction.json")
+
+    metadata = {"history_dates": [], "fitted_through": None}
+    if os.path.isfile(path_metadata):
+        with open(path_metadata) as f:
+            metadata = json.load(f)
+
+    # Settlement dates that have ended and are not in the history yet
+    now = datetime.now(timezone.utc) if now is None else now
+    current_date = get_settlement_period([pd.Timestamp(now)])[0][0]
+    settlement_dates = pd.DatetimeIndex(df_PHYBMDATA["settlementDate"].unique())
+    settlement_dates = settlement_dates[settlement_dates < current_date]
+    new_dates = settlement_dates[~np.isin(get_settlement_date_labels(settlement_dates), metadata["history_dates"])]
+
+    B1610_first_date = get_settlement_date_labels([df_B1610["settlementDate"].min()])[0] if len(df_B1610) else None
+    B1610_last_date = get_settlement_date_labels([df_B1610["settlementDate"].max()])[0] if len(df_B1610) else None
+    expired_dates = [day for day in metadata["history_dates"] if B1610_first_date and day < B1610_first_date]
+
+    if len(new_dates) or expired_dates:
+        df_FPN_history = pd.read_parquet(path_history) if os.path.isfile(path_history) else None
+        wind_bmus = df_bmu_metadata.index[df_bmu_metadata["fuel"] == FUEL_TYPE_FRIENDLY["WIND"]]
+        df_new = df_PHYBMDATA.loc[
+            df_PHYBMDATA["settlementDate"].isin(new_dates)
+            & df_PHYBMDATA["bmUnitID"].astype(str).isin(wind_bmus)
+            & (df_PHYBMDATA["recordType"] == "PN")
+        ]
+        df_FPN_history = pd.concat((df_FPN_history, summarise_settlement_period_FPN(df_new)), ignore_index=True)
+        df_FPN_history = df_FPN_history.loc[
+            ~np.isin(get_settlement_date_labels(df_FPN_history["settlementDate"]), expired_dates)
+        ]
+        df_FPN_history = apply_schema(df_FPN_history.reset_index(drop=True), B1610_SCHEMA)
+        write_parquet_atomically(df_FPN_history, path_history)
+
+        history_dates = set(metadata["history_dates"]) | set(get_settlement_date_labels(new_dates))
+        metadata["history_dates"] = sorted(history_dates - set(expired_dates))
+
+    if (
+        not os.path.isfile(path_correction)
+        or metadata["fitted_through"] is None
+        or (B1610_last_date is not None and B1610_last_date > metadata["fitted_through"])
+    ):
+        df_FPN_history = pd.read_parquet(path_history) if os.path.isfile(path_history) else None
+        if df_FPN_history is None:
+            df_FPN_history = apply_schema(pd.DataFrame(columns=list(B1610_SCHEMA)), B1610_SCHEMA)
+        df_correction = fit_wind_FPN_correction(df_FPN_history, df_B1610, min_periods=min_periods)
+        write_parquet_atomically(df_correction, path_correction, index=None)
+        metadata["fitted_through"] = B1610_last_date
+        metadata["n_bmus"] = len(df_correction)
+    else:
+        df_correction = pd.read_parquet(path_correction)
+
+    write_json_atomically(metadata, path_metadata, indent=2)
+
+    return df_correction
+
+
+def apply_wind_FPN_correction(df_PHYBMDATA: pd.DataFrame, df_correction: pd.DataFrame) -> pd.DataFrame:
+    """
+    Applies the FPN correction of the BMUs in df_correction (see fit_wind_FPN_correction) to the levels of their FPN
+    records. As the correction is linear, this corrects their mean FPN of every settlement period in the same way.
+    Corrected levels below 0 are set to 0. The correction is applied before the fingerprints of the Physical BM
+    Data are taken (see fingerprint_physical_data), so that a new correction recalculates the settlement periods
+    of the corrected BMUs.
+
+    Args:
+        df_PHYBMDATA (pd.DataFrame): formatted Physical BM Data (see format_PHYBM_data).
+        df_correction (pd.DataFrame): output of fit_wind_FPN_correction or update_wind_FPN_correction.
+
+    Returns:
+        pd.DataFrame: the Physical BM Data with the corrected FPN levels.
+    """
+    bmu_ids = df_PHYBMDATA["bmUnitID"].astype("category")
+    correction_rows = df_correction.index.get_indexer(bmu_ids.cat.categories.astype(str))
+    rows = np.where(bmu_ids.cat.codes.to_numpy() >= 0, correction_rows[bmu_ids.cat.codes.to_numpy()], -1)
+    selected = (rows >= 0) & (df_PHYBMDATA["recordType"] == "PN").to_numpy()
+    if not selected.any():
+        return df_PHYBMDATA
+
+    intercept = df_correction["intercept_MW"].to_numpy("float64")[rows[selected]]
+    scale = df_correction["scale"].to_numpy("float64")[rows[selected]]
+
+    df_PHYBMDATA = df_PHYBMDATA.copy()
+    for column in ["pnLevelFrom", "pnLevelTo"]:
+        levels = df_PHYBMDATA[column].to_numpy(copy=True)
+        levels[selected] = np.maximum(intercept + scale * levels[selected], 0)
+        df_PHYBMDATA[column] = levels
+
+    return df_PHYBMDATA
@@ -0,0 +1,109 @@
+"""
+Shared fixtures of the tests. The pipeline modules are imported from notebooks/py_versions, as the scripts there
+import each other, and run on synthetic Physical BM Data (see synthetic_data.py) for the BMUs of the checked-in
+B1610 dataset.
+"""
+
+import os
+import sys
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+REPO_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(REPO_FOLDER, "notebooks", "py_versions"))
+
+import generation_calc  # noqa: E402
+import pipeline_fns as plfns  # noqa: E402
+import pipeline_schema  # noqa: E402
+import psd  # noqa: E402
+import synthetic_data  # noqa: E402
+
+# First settlement dates of the two day fixtures: each includes a clock change day, with 46 settlement periods
+# (2024-03-31) and 50 settlement periods (2024-10-27)
+CLOCK_CHANGE_START_DATES = ["2024-03-30", "2024-10-26"]
+
+
+@pytest.fixture(scope="session")
+def known_bmu_ids() -> list:
+    """
+    BMU IDs of the checked-in B1610 dataset.
+    """
+    df_B1610 = pd.read_parquet(os.path.join(REPO_FOLDER, "data", "BMRS", "B1610", "B1610.parquet"))
+    return sorted(df_B1610["bmUnitID"].unique())
+
+
+@pytest.fixture(scope="session", params=CLOCK_CHANGE_START_DATES)
+def df_PHYBMDATA(request, known_bmu_ids) -> pd.DataFrame:
+    """
+    Two days of synthetic Physical BM Data, including a clock change day, with overlapping acceptances.
+    """
+    return synthetic_data.make_synthetic_PHYBMDATA(
+        n_bmu=6,
+        n_days=2,
+        start_date=request.param,
+        boal_density=0.3,
+        overlap_fraction=0.5,
+        known_bmu_ids=known_bmu_ids,
+        seed=0,
+    )
+
+
+@pytest.fixture(scope="session")
+def df_B1610(df_PHYBMDATA, known_bmu_ids) -> pd.DataFrame:
+    """
+    Synthetic B1610 data of the BMUs and settlement dates of df_PHYBMDATA.
+    """
+    settlement_dates = df_PHYBMDATA["settlementDate"].unique()
+    return synthetic_data.make_synthetic_B1610(
+        n_bmu=6,
+        n_days=len(settlement_dates),
+        start_date=f"{settlement_dates.min():%Y-%m-%d}",
+        known_bmu_ids=known_bmu_ids,
+        seed=0,
+    )
+
+
+@pytest.fixture(scope="session")
+def physical_data(df_PHYBMDATA) -> dict:
+    """
+    The FPN, MEL and BOAL records of df_PHYBMDATA, as returned by split_physical_data.
+    """
+    return dict(zip(["fpn", "mel", "boal"], generation_calc.split_physical_data(df_PHYBMDATA)))
+
+
+@pytest.fixture(scope="session")
+def df_B1610_history(df_PHYBMDATA, known_bmu_ids) -> pd.DataFrame:
+    """
+    Synthetic B1610 data of the settlement date before df_PHYBMDATA, as in a live run.
+    """
+    start_date = df_PHYBMDATA["settlementDate"].min() - timedelta(days=1)
+    df_B1610 = synthetic_data.make_synthetic_B1610(
+        n_bmu=6, n_days=1, start_date=f"{start_date:%Y-%m-%d}", known_bmu_ids=known_bmu_ids, seed=0
+    )
+    return pipeline_schema.apply_schema(df_B1610, pipeline_schema.B1610_SCHEMA)
+
+
+@pytest.fixture(scope="session")
+def df_bmu_metadata() -> pd.DataFrame:
+    """
+    BMU lookup table compiled from the checked-in merged Power Station Dictionary.
+    """
+    return psd.read_BMU_metadata(os.path.join(REPO_FOLDER, "data"))
+
+
+@pytest.fixture(scope="session")
+def df_generation(df_B1610_history, df_PHYBMDATA, df_bmu_metadata, tmp_path_factory) -> pd.DataFrame:
+    """
+    The combined generation dataset of df_B1610_history and df_PHYBMDATA, as written by run_generation_stages.
+    """
+    outputs = plfns.run_generation_stages(
+        str(tmp_path_factory.mktemp("generation")),
+        df_B1610_history,
+        df_PHYBMDATA,
+        df_bmu_metadata,
+        write_csv=False,
+        nowcast_resolution=None,
+    )
+    return outputs["df_generation"]
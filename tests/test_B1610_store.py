@@ -0,0 +1,102 @@
+"""
+The B1610 dataset stored as a compressed Arrow file with a record batch per settlement date, see write_B1610_data.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+import bmrs_data
+import pipeline_schema
+import pipeline_storage
+import settlement_calendar
+from conftest import REPO_FOLDER
+
+
+def get_mapped_arrow_files() -> list:
+    with open("/proc/self/maps") as f:
+        return [line.split()[-1] for line in f if line.rstrip().endswith(".arrow")]
+
+
+@pytest.fixture(scope="module")
+def df_B1610() -> pd.DataFrame:
+    df_B1610 = pd.read_parquet(os.path.join(REPO_FOLDER, "data", "BMRS", "B1610", "B1610.parquet"))
+    return pipeline_schema.apply_schema(df_B1610, pipeline_schema.B1610_SCHEMA)
+
+
+def test_read_slices_settlement_dates(df_B1610, tmp_path):
+    location = str(tmp_path)
+    df_written = bmrs_data.write_B1610_data(df_B1610, location)
+    os.remove(bmrs_data.get_B1610_metadata_path(location))
+
+    metadata = bmrs_data.read_B1610_metadata(location)
+    assert metadata["rows"] == len(df_B1610)
+    pd.testing.assert_frame_equal(bmrs_data.read_B1610_data(location), df_written)
+
+    start_date = metadata["max_settlement_date"]
+    df_latest = bmrs_data.read_B1610_data(location, start_date=start_date, metadata=metadata)
+    assert len(df_latest) == metadata["rows_per_day"][start_date]
+
+
+def test_read_settlement_date_range(df_B1610, tmp_path):
+    location = str(tmp_path)
+    df_written = bmrs_data.write_B1610_data(df_B1610, location)
+    days = sorted(bmrs_data.read_B1610_metadata(location)["rows_per_day"])
+    start_date, end_date = days[3], days[5]
+
+    df_days = bmrs_data.read_B1610_data(location, start_date=start_date, end_date=end_date)
+
+    labels = settlement_calendar.get_settlement_date_labels(df_written["settlementDate"])
+    df_expected = df_written.loc[(labels >= start_date) & (labels <= end_date)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(df_days, df_expected, check_categorical=False)
+
+
+def test_file_is_compressed_with_a_batch_per_day(df_B1610, tmp_path):
+    import pyarrow.ipc
+
+    location = str(tmp_path)
+    bmrs_data.write_B1610_data(df_B1610, location)
+    path = bmrs_data.get_B1610_path(location)
+
+    assert os.path.getsize(path) < os.path.getsize(os.path.join(REPO_FOLDER, "data", "BMRS", "B1610", "B1610.parquet"))
+    with pyarrow.ipc.open_file(path) as reader:
+        assert reader.num_record_batches == len(bmrs_data.read_B1610_metadata(location)["rows_per_day"])
+
+
+def test_single_batch_file_is_sliced(df_B1610, tmp_path):
+    import pyarrow
+    import pyarrow.ipc
+
+    location = str(tmp_path)
+    df_written = bmrs_data.write_B1610_data(df_B1610, location)
+    table = pyarrow.Table.from_pandas(df_written, preserve_index=False)
+    with pyarrow.ipc.new_file(bmrs_data.get_B1610_path(location), table.schema) as writer:
+        writer.write_table(table)
+    metadata = bmrs_data.read_B1610_metadata(location)
+
+    start_date = metadata["max_settlement_date"]
+    df_latest = bmrs_data.read_B1610_data(location, start_date=start_date, metadata=metadata)
+    pd.testing.assert_frame_equal(
+        df_latest, df_written.tail(len(df_latest)).reset_index(drop=True), check_categorical=False
+    )
+    assert len(df_latest) == metadata["rows_per_day"][start_date]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads the memory maps from /proc")
+def test_memory_maps_are_released(df_B1610, tmp_path):
+    location = str(tmp_path)
+    bmrs_data.write_B1610_data(df_B1610, location)
+    metadata = bmrs_data.read_B1610_metadata(location)
+    df = bmrs_data.read_B1610_data(location, metadata=metadata)
+
+    path = os.path.join(location, "shard.arrow")
+    pipeline_storage.write_arrow_file(df.set_index("bmUnitID"), path)
+    df_shard = pipeline_storage.read_arrow_BMUs(path, list(df["bmUnitID"].unique()[:3]))
+
+    assert not df.empty and not df_shard.empty
+    assert get_mapped_arrow_files() == []
+
+    bmrs_data.write_B1610_data(df, location)
+    assert bmrs_data.read_B1610_metadata(location)["rows"] == len(df)
@@ -0,0 +1,149 @@
+"""
+The on-disk cache of BMRS responses per report and settlement period, see fetch_cached_settlement_periods.
+"""
+
+import os
+import time
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+import bmrs_fetch
+
+N_PERIODS = 4
+
+
+class StubFetch:
+    """
+    Returns rows_per_period[i] rows for the i-th settlement period of the requests, and counts the requests.
+    """
+
+    def __init__(self, rows_per_period: list):
+        self.rows_per_period = rows_per_period
+        self.period_starts = []
+
+    def __call__(self, start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
+        self.period_starts.append(start_date)
+        n_rows = self.rows_per_period[self.period_index(start_date)]
+        return pd.DataFrame({"period_start": [start_date] * n_rows, "quantity": [1.0] * n_rows})
+
+    def period_index(self, start_date: pd.Timestamp) -> int:
+        return int((start_date - self.start_date) / timedelta(minutes=30))
+
+    def fetch_periods(self, report: str, start_date: pd.Timestamp, cache_location: str) -> pd.DataFrame:
+        self.start_date = start_date
+        end_date = start_date + N_PERIODS * timedelta(minutes=30)
+        return bmrs_fetch.fetch_cached_settlement_periods(report, start_date, end_date, self, cache_location)
+
+
+def get_start_date(days_ago: float) -> pd.Timestamp:
+    return (pd.Timestamp.now(tz="UTC") - timedelta(days=days_ago)).floor("D") + timedelta(hours=10)
+
+
+def get_cache_files(cache_location: str, report: str) -> list:
+    return sorted(os.listdir(os.path.join(cache_location, report)))
+
+
+def set_fetched_at(cache_location: str, report: str, fetched_at: pd.Timestamp):
+    for file_name in get_cache_files(cache_location, report):
+        os.utime(os.path.join(cache_location, report, file_name), (fetched_at.timestamp(), fetched_at.timestamp()))
+
+
+def test_unpublished_B1610_periods_are_requested_again(tmp_path):
+    start_date = get_start_date(days_ago=6)
+
+    df = StubFetch([0] * N_PERIODS).fetch_periods("B1610", start_date, str(tmp_path))
+    assert df.empty
+    assert get_cache_files(str(tmp_path), "B1610") == []
+
+    fetch = StubFetch([3] * N_PERIODS)
+    assert len(fetch.fetch_periods("B1610", start_date, str(tmp_path))) == 3 * N_PERIODS
+    assert len(fetch.period_starts) == N_PERIODS
+
+    fetch_cached = StubFetch([0] * N_PERIODS)
+    assert len(fetch_cached.fetch_periods("B1610", start_date, str(tmp_path))) == 3 * N_PERIODS
+    assert fetch_cached.period_starts == []
+
+
+def test_partial_B1610_periods_are_requested_again(tmp_path):
+    start_date = get_start_date(days_ago=6)
+    StubFetch([4, 4, 1, 0]).fetch_periods("B1610", start_date, str(tmp_path))
+    assert len(get_cache_files(str(tmp_path), "B1610")) == 2
+
+    fetch = StubFetch([4] * N_PERIODS)
+    assert len(fetch.fetch_periods("B1610", start_date, str(tmp_path))) == 4 * N_PERIODS
+    assert [fetch.period_index(period_start) for period_start in fetch.period_starts] == [2, 3]
+
+
+def test_empty_B1610_periods_are_cached_after_the_settlement_run_lag(tmp_path):
+    start_date = get_start_date(days_ago=bmrs_fetch.BMRS_CACHE_SETTLEMENT_LAG["B1610"].days + 5)
+    StubFetch([0] * N_PERIODS).fetch_periods("B1610", start_date, str(tmp_path))
+
+    fetch = StubFetch([3] * N_PERIODS)
+    assert fetch.fetch_periods("B1610", start_date, str(tmp_path)).empty
+    assert fetch.period_starts == []
+
+
+def test_empty_cached_B1610_periods_are_a_miss_within_the_settlement_run_lag(tmp_path):
+    start_date = get_start_date(days_ago=6)
+    os.makedirs(os.path.join(tmp_path, "B1610"))
+    path = bmrs_fetch.get_BMRS_cache_path(str(tmp_path), "B1610", f"{start_date:%Y-%m-%d}", 21)
+    pd.DataFrame({"period_start": [], "quantity": []}).to_parquet(path)
+
+    assert bmrs_fetch.read_BMRS_cache(path, "B1610", start_date + timedelta(minutes=30)) is None
+
+
+def test_unreadable_cache_files_are_a_miss(tmp_path):
+    start_date = get_start_date(days_ago=6)
+    StubFetch([3] * N_PERIODS).fetch_periods("B1610", start_date, str(tmp_path))
+    file_names = get_cache_files(str(tmp_path), "B1610")
+    with open(os.path.join(tmp_path, "B1610", file_names[0]), "wb") as f:
+        f.write(b"PAR1 truncated")
+
+    fetch = StubFetch([3] * N_PERIODS)
+    assert len(fetch.fetch_periods("B1610", start_date, str(tmp_path))) == 3 * N_PERIODS
+    assert [fetch.period_index(period_start) for period_start in fetch.period_starts] == [0]
+    assert not any(file_name.endswith(".tmp") for file_name in get_cache_files(str(tmp_path), "B1610"))
+
+    pd.read_parquet(os.path.join(tmp_path, "B1610", file_names[0]))
+
+
+@pytest.mark.parametrize("fetched_minutes_ago, n_requests", [(10, 0), (30, 4)])
+def test_PHYBMDATA_expires_after_the_TTL(tmp_path, fetched_minutes_ago, n_requests):
+    start_date = pd.Timestamp.now(tz="UTC").floor("30min") - N_PERIODS * timedelta(minutes=30)
+    StubFetch([2] * N_PERIODS).fetch_periods("PHYBMDATA", start_date, str(tmp_path))
+    set_fetched_at(str(tmp_path), "PHYBMDATA", pd.Timestamp.now(tz="UTC") - timedelta(minutes=fetched_minutes_ago))
+
+    fetch = StubFetch([2] * N_PERIODS)
+    fetch.fetch_periods("PHYBMDATA", start_date, str(tmp_path))
+    assert len(fetch.period_starts) == n_requests
+
+
+@pytest.mark.parametrize("fetched_hours_after_end, n_requests", [(1, 4), (4, 0)])
+def test_settled_PHYBMDATA_does_not_expire(tmp_path, fetched_hours_after_end, n_requests):
+    start_date = get_start_date(days_ago=2)
+    StubFetch([2] * N_PERIODS).fetch_periods("PHYBMDATA", start_date, str(tmp_path))
+    # The last settlement period ends N_PERIODS half hours after the start date
+    fetched_at = start_date + N_PERIODS * timedelta(minutes=30) + timedelta(hours=fetched_hours_after_end)
+    set_fetched_at(str(tmp_path), "PHYBMDATA", fetched_at)
+
+    fetch = StubFetch([2] * N_PERIODS)
+    fetch.fetch_periods("PHYBMDATA", start_date, str(tmp_path))
+    assert len(fetch.period_starts) == n_requests
+
+
+def test_evict_deletes_the_oldest_files(tmp_path):
+    os.makedirs(os.path.join(tmp_path, "B1610"))
+    now = time.time()
+    paths = []
+    for i in range(4):
+        path = os.path.join(tmp_path, "B1610", f"B1610_2024-01-01_{i:02d}.parquet")
+        with open(path, "wb") as f:
+            f.write(b"0" * 100)
+        os.utime(path, (now - 100 * (4 - i), now - 100 * (4 - i)))
+        paths.append(path)
+
+    assert bmrs_fetch.evict_BMRS_cache(str(tmp_path), max_bytes=250) == paths[:2]
+    assert get_cache_files(str(tmp_path), "B1610") == [os.path.basename(path) for path in paths[2:]]
+    assert bmrs_fetch.evict_BMRS_cache(str(tmp_path), max_bytes=250) == []
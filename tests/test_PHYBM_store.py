@@ -0,0 +1,87 @@
+"""
+The Physical BM Data stored as one parquet partition per settlement date, see upsert_PHYBM_partitions.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bmrs_data
+import settlement_calendar
+
+
+def get_settlement_dates(df: pd.DataFrame) -> list:
+    return sorted(set(settlement_calendar.get_settlement_date_labels(df["settlementDate"])))
+
+
+def sort_records(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(bmrs_data.PHYBMDATA_KEY_COLUMNS, kind="stable").reset_index(drop=True)
+
+
+@pytest.fixture
+def location_PHYBMDATA(df_PHYBMDATA, tmp_path) -> str:
+    location = str(tmp_path)
+    bmrs_data.upsert_PHYBM_partitions(df_PHYBMDATA, location)
+    return location
+
+
+def test_partitions_hold_the_data_of_each_settlement_date(df_PHYBMDATA, location_PHYBMDATA):
+    assert list(bmrs_data.list_PHYBM_partitions(location_PHYBMDATA)) == get_settlement_dates(df_PHYBMDATA)
+    pd.testing.assert_frame_equal(
+        sort_records(bmrs_data.read_PHYBM_partitions(location_PHYBMDATA)),
+        sort_records(df_PHYBMDATA),
+        check_categorical=False,
+    )
+
+
+def test_upsert_replaces_records_and_only_rewrites_changed_partitions(df_PHYBMDATA, location_PHYBMDATA):
+    partitions = bmrs_data.list_PHYBM_partitions(location_PHYBMDATA)
+    modified_times = {date: os.stat(path).st_mtime_ns for date, path in partitions.items()}
+    last_date = max(partitions)
+
+    labels = settlement_calendar.get_settlement_date_labels(df_PHYBMDATA["settlementDate"])
+    df_revised = df_PHYBMDATA.loc[(labels == last_date) & df_PHYBMDATA["recordType"].eq("PN")].copy()
+    df_revised["pnLevelTo"] += np.float32(10)
+
+    assert bmrs_data.upsert_PHYBM_partitions(df_revised, location_PHYBMDATA) == [last_date]
+    assert bmrs_data.upsert_PHYBM_partitions(df_revised, location_PHYBMDATA) == []
+    assert all(
+        os.stat(path).st_mtime_ns == modified_times[date] for date, path in partitions.items() if date != last_date
+    )
+
+    df_stored = bmrs_data.read_PHYBM_partitions(location_PHYBMDATA)
+    assert len(df_stored) == len(df_PHYBMDATA)
+    df_stored_PN = sort_records(df_stored.loc[df_stored["settlementDate"].isin(df_revised["settlementDate"])])
+    np.testing.assert_array_equal(
+        df_stored_PN.loc[df_stored_PN["recordType"] == "PN", "pnLevelTo"], sort_records(df_revised)["pnLevelTo"]
+    )
+
+
+def test_drop_partitions_before_a_date(df_PHYBMDATA, location_PHYBMDATA):
+    first_date, *later_dates = get_settlement_dates(df_PHYBMDATA)
+
+    assert bmrs_data.drop_PHYBM_partitions(location_PHYBMDATA, before_date=pd.Timestamp(later_dates[0])) == [first_date]
+    assert list(bmrs_data.list_PHYBM_partitions(location_PHYBMDATA)) == later_dates
+
+
+def test_failed_write_keeps_the_previous_partition(df_PHYBMDATA, location_PHYBMDATA, monkeypatch):
+    partitions = bmrs_data.list_PHYBM_partitions(location_PHYBMDATA)
+    df_before = bmrs_data.read_PHYBM_partitions(location_PHYBMDATA)
+    to_parquet = pd.DataFrame.to_parquet
+
+    def fail_after_writing_half(df, path, **kwargs):
+        to_parquet(df.iloc[: len(df) // 2], path, **kwargs)
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) // 2)
+        raise OSError("disk full")
+
+    df_revised = df_PHYBMDATA.assign(pnLevelTo=df_PHYBMDATA["pnLevelTo"] + np.float32(10))
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", fail_after_writing_half)
+    with pytest.raises(OSError):
+        bmrs_data.upsert_PHYBM_partitions(df_revised, location_PHYBMDATA)
+    monkeypatch.undo()
+
+    assert bmrs_data.list_PHYBM_partitions(location_PHYBMDATA) == partitions
+    pd.testing.assert_frame_equal(bmrs_data.read_PHYBM_partitions(location_PHYBMDATA), df_before)
@@ -0,0 +1,208 @@
+"""
+The conditional refresh of the Power Station Dictionary sources against a local HTTP server, which answers
+"304 Not Modified" to requests with the current ETag of a source and serves some sources without an ETag.
+"""
+
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import psd
+
+PSD_CONTENTS = {
+    "ids.csv": 'dictionary_id,sett_bmu_id,ngc_bmu_id\n10000,"E_MARK-1, E_MARK-2","MARK-1, MARK-2"\n',
+    "plant-locations.csv": "dictionary_id,longitude,latitude\n10000,-3.603516,57.480403\n",
+    "common-names.csv": "dictionary_id,common_name\n10000,Rothes Bio-Plant CHP\n",
+    "fuel_types.csv": "ngc_bmu_id,fuel_type\nMARK-1,BIOMASS\n",
+    "BMUFuelType.csv": "SETT_BMU_ID,FUEL TYPE\nE_MARK-2,BIOMASS\n",
+}
+CHANGED_PSD_CONTENTS = {
+    "common-names.csv": "dictionary_id,common_name\n10000,Rothes CHP\n",
+    "fuel_types.csv": "ngc_bmu_id,fuel_type\nMARK-1,BIOMASS\nMARK-2,BIOMASS\n",
+}
+# Sources served without an ETag, which can only be found to be unchanged by their content hash
+PSD_FILES_WITHOUT_ETAG = ["fuel_types.csv"]
+
+
+class PSDServer:
+    """
+    Serves PSD_CONTENTS, and records the path and If-None-Match header of each request.
+    """
+
+    def __init__(self):
+        self.contents = {path: content.encode() for path, content in PSD_CONTENTS.items()}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.lstrip("/")
+                server.requests.append((path, self.headers.get("If-None-Match")))
+                if path not in server.contents:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                etag = None if path in PSD_FILES_WITHOUT_ETAG else server.get_etag(path)
+                if etag is not None and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(server.contents[path])))
+                self.end_headers()
+                self.wfile.write(server.contents[path])
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def get_etag(self, path: str) -> str:
+        return f'"{hashlib.sha256(self.contents[path]).hexdigest()[:16]}"'
+
+    def get_sources(self) -> dict:
+        sources = {
+            name: {**source, "url": f"{self.url}/{os.path.basename(source['url'])}"}
+            for name, source in psd.PSD_SOURCES.items()
+        }
+        sources["fuel_types_elexon"]["url"] = f"{self.url}/BMUFuelType.csv"
+        sources["fuel_types_elexon"]["file"] = "BMUFuelType.csv"
+        return sources
+
+    def get_requested_paths(self) -> list:
+        paths = [path for path, _ in self.requests]
+        self.requests.clear()
+        return sorted(paths)
+
+
+@pytest.fixture
+def psd_server():
+    server = PSDServer()
+    thread = threading.Thread(target=server.httpd.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.fixture
+def merge_calls(monkeypatch) -> list:
+    """
+    Records the calls to merge_PSD_sources, i.e. the rebuilds of the merged Power Station Dictionary.
+    """
+    calls = []
+    merge_PSD_sources = psd.merge_PSD_sources
+
+    def record_merge(sources):
+        calls.append(sorted(sources))
+        return merge_PSD_sources(sources)
+
+    monkeypatch.setattr(psd, "merge_PSD_sources", record_merge)
+    return calls
+
+
+def read_merged_psd(location: str) -> pd.DataFrame:
+    return pd.read_csv(os.path.join(location, "merged_psd.csv"), index_col=0)
+
+
+def test_first_refresh_downloads_all_sources(psd_server, merge_calls, tmp_path):
+    location = str(tmp_path)
+    assert psd.update_merged_PSD(location, sources=psd_server.get_sources())
+
+    assert psd_server.get_requested_paths() == sorted(PSD_CONTENTS)
+    assert len(merge_calls) == 1
+    assert read_merged_psd(location)["sett_bmuID"].tolist() == ["E_MARK-1", "E_MARK-2"]
+    assert read_merged_psd(location)["fuel"].tolist() == ["BIOMASS", "BIOMASS"]
+    assert os.path.isfile(psd.get_BMU_metadata_path(location))
+    assert os.path.isfile(os.path.join(location, "BMUFuelType.csv"))
+
+    manifest = psd.read_PSD_manifest(psd.get_PSD_cache_location(location))
+    assert manifest["ids"]["etag"] == psd_server.get_etag("ids.csv")
+    assert manifest["fuel_types_psd"]["etag"] is None
+
+
+def test_unchanged_sources_are_skipped(psd_server, merge_calls, tmp_path):
+    location, sources = str(tmp_path), psd_server.get_sources()
+    psd.update_merged_PSD(location, sources=sources)
+    psd_server.requests.clear()
+    merged_psd_mtime = os.stat(os.path.join(location, "merged_psd.csv")).st_mtime_ns
+
+    psd_sources, changed, _ = psd.refresh_PSD_sources(location, sources=sources)
+    assert not changed
+    # The sources with an ETag are requested conditionally, and the others are compared by content hash
+    assert all(
+        etag == (None if path in PSD_FILES_WITHOUT_ETAG else psd_server.get_etag(path))
+        for path, etag in psd_server.requests
+    )
+    assert psd_sources["ids"].columns.tolist() == psd.PSD_SOURCES["ids"]["columns"]
+
+    assert not psd.update_merged_PSD(location, sources=sources)
+    assert len(merge_calls) == 1
+    assert os.stat(os.path.join(location, "merged_psd.csv")).st_mtime_ns == merged_psd_mtime
+
+
+@pytest.mark.parametrize("path", list(CHANGED_PSD_CONTENTS))
+def test_changed_source_rebuilds_merged_table(psd_server, merge_calls, tmp_path, path):
+    location, sources = str(tmp_path), psd_server.get_sources()
+    psd.update_merged_PSD(location, sources=sources)
+
+    psd_server.contents[path] = CHANGED_PSD_CONTENTS[path].encode()
+
+    assert psd.update_merged_PSD(location, sources=sources)
+    assert len(merge_calls) == 2
+    df_psd_merged = read_merged_psd(location)
+    if path == "common-names.csv":
+        assert (df_psd_merged["common_name"] == "Rothes CHP").all()
+    else:
+        assert df_psd_merged["ngc_bmu_id"].notna().all()
+
+    assert not psd.update_merged_PSD(location, sources=sources)
+    assert len(merge_calls) == 2
+
+
+def test_failed_rebuild_is_tried_again(psd_server, merge_calls, monkeypatch, tmp_path):
+    location, sources = str(tmp_path), psd_server.get_sources()
+    psd.update_merged_PSD(location, sources=sources)
+    manifest = psd.read_PSD_manifest(psd.get_PSD_cache_location(location))
+    psd_server.contents["common-names.csv"] = CHANGED_PSD_CONTENTS["common-names.csv"].encode()
+
+    def fail_to_write(df_bmu_metadata, location):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(psd, "write_BMU_metadata", fail_to_write)
+        with pytest.raises(OSError):
+            psd.update_merged_PSD(location, sources=sources)
+    assert psd.read_PSD_manifest(psd.get_PSD_cache_location(location)) == manifest
+
+    assert psd.update_merged_PSD(location, sources=sources)
+    assert len(merge_calls) == 3
+    assert (read_merged_psd(location)["common_name"] == "Rothes CHP").all()
+
+
+def test_missing_metadata_rebuilds_merged_table(psd_server, merge_calls, tmp_path):
+    location, sources = str(tmp_path), psd_server.get_sources()
+    psd.update_merged_PSD(location, sources=sources)
+    os.remove(psd.get_BMU_metadata_path(location))
+
+    assert psd.update_merged_PSD(location, sources=sources)
+    assert len(merge_calls) == 2
+
+
+def test_forced_refresh_downloads_all_sources(psd_server, merge_calls, tmp_path):
+    location, sources = str(tmp_path), psd_server.get_sources()
+    psd.update_merged_PSD(location, sources=sources)
+    psd_server.requests.clear()
+
+    assert psd.update_merged_PSD(location, sources=sources, force=True)
+    assert all(etag is None for _, etag in psd_server.requests)
+    assert len(merge_calls) == 2
@@ -0,0 +1,40 @@
+"""
+The analytic mode of calculate_settlement_period_generation must match the minutely mode within a tolerance on
+data where acceptances override the FPN and the MEL caps the generation.
+"""
+
+import numpy as np
+
+import generation_calc
+
+# Largest difference allowed between the analytic and the minutely mean generation of a BMU and settlement period.
+# With step segments on whole minutes, both integrate the same levels, so only floating point error is allowed.
+ANALYTIC_TOLERANCE_MW = 1e-6
+ANALYTIC_RELATIVE_TOLERANCE = 1e-9
+
+KEY_COLUMNS = ["local_datetime", "settlementDate", "settlementPeriod", "bmUnitID"]
+
+
+def test_fixture_is_capped_and_overridden(physical_data):
+    df_fpn, df_mel = physical_data["fpn"].reset_index(), physical_data["mel"].reset_index()
+    df_levels = df_fpn.merge(df_mel, on=["bmUnitID", "local_datetime"], suffixes=("_fpn", "_mel"))
+
+    assert (df_levels["LevelFrom_fpn"] > df_levels["LevelFrom_mel"]).any()
+    assert physical_data["boal"]["Accept ID"].nunique() > 1
+
+
+def test_analytic_matches_minutely(physical_data):
+    df_fpn, df_mel, df_boal = physical_data["fpn"], physical_data["mel"], physical_data["boal"]
+    df_minutely = generation_calc.calculate_settlement_period_generation(df_fpn, df_mel, df_boal, mode="minutely")
+    df_analytic = generation_calc.calculate_settlement_period_generation(df_fpn, df_mel, df_boal, mode="analytic")
+
+    df_compared = df_minutely.merge(
+        df_analytic, on=KEY_COLUMNS, how="outer", suffixes=("_minutely", "_analytic"), indicator=True
+    )
+    assert (df_compared["_merge"] == "both").all()
+    np.testing.assert_allclose(
+        df_compared["quantity_analytic"],
+        df_compared["quantity_minutely"],
+        rtol=ANALYTIC_RELATIVE_TOLERANCE,
+        atol=ANALYTIC_TOLERANCE_MW,
+    )
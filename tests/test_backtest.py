@@ -0,0 +1,110 @@
+"""
+The backtest of the BM derived estimate against the B1610 data, see run_backtest.
+"""
+
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+import bmrs_data
+import bmrs_fetch
+import pipeline_schema
+import settlement_calendar
+
+
+class StubB1610Client:
+    """
+    Serves get_B1610 from B1610 data, in the format of the BMRS API.
+    """
+
+    def __init__(self, df_B1610: pd.DataFrame):
+        self.df_B1610 = df_B1610
+        self.requests = []
+
+    def get_B1610(self, start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
+        self.requests.append((start_date, end_date))
+        # Dates without a time zone are local dates, as for the BMRS API
+        start_date, end_date = (
+            pd.Timestamp(date).tz_localize("Europe/London") if pd.Timestamp(date).tz is None else pd.Timestamp(date)
+            for date in (start_date, end_date)
+        )
+        df = self.df_B1610.loc[
+            (self.df_B1610["local_datetime"] >= start_date) & (self.df_B1610["local_datetime"] < end_date)
+        ]
+        return df.assign(
+            settlementDate=df["settlementDate"].dt.strftime("%Y-%m-%d"), local_datetime=df["local_datetime"].astype(str)
+        ).rename(columns={"bmUnitID": "bMUnitID"})
+
+
+@pytest.fixture
+def location_backtest(df_PHYBMDATA, tmp_path) -> str:
+    location_backtest = backtest.get_backtest_location(str(tmp_path))
+    os.makedirs(os.path.join(location_backtest, "PHYBMDATA"))
+    bmrs_data.upsert_PHYBM_partitions(df_PHYBMDATA, os.path.join(location_backtest, "PHYBMDATA"))
+    return location_backtest
+
+
+def get_settlement_dates(df: pd.DataFrame) -> list:
+    return sorted(set(settlement_calendar.get_settlement_date_labels(df["settlementDate"])))
+
+
+def write_B1610_dates(df_B1610: pd.DataFrame, location: str, settlement_dates: list):
+    os.makedirs(location, exist_ok=True)
+    df_B1610 = df_B1610.loc[
+        np.isin(settlement_calendar.get_settlement_date_labels(df_B1610["settlementDate"]), settlement_dates)
+    ]
+    bmrs_data.write_B1610_data(pipeline_schema.apply_schema(df_B1610, pipeline_schema.B1610_SCHEMA), location)
+
+
+def test_only_dates_with_B1610_data_are_compared(df_B1610, df_bmu_metadata, location_backtest):
+    settlement_dates = get_settlement_dates(df_B1610)
+    location_B1610 = os.path.join(location_backtest, "B1610")
+    write_B1610_dates(df_B1610, location_B1610, settlement_dates[:1])
+
+    df_backtest = backtest.run_backtest(
+        os.path.join(location_backtest, "PHYBMDATA"),
+        location_B1610,
+        df_bmu_metadata,
+        settlement_dates[0],
+        settlement_dates[-1],
+    )
+
+    assert get_settlement_dates(df_backtest) == settlement_dates[:1]
+    assert (df_backtest["metered_MW"] > 0).any()
+    assert df_backtest[["estimate_MW", "metered_MW", "error_MW"]].notna().all().all()
+    assert backtest.calculate_backtest_metrics(df_backtest, by="fuel")["nMAE"].notna().any()
+
+
+def test_no_overlap_raises(df_B1610, df_bmu_metadata, location_backtest):
+    settlement_dates = get_settlement_dates(df_B1610)
+    location_B1610 = os.path.join(location_backtest, "B1610")
+    write_B1610_dates(df_B1610, location_B1610, settlement_dates[:1])
+
+    with pytest.raises(ValueError, match="both Physical BM Data and B1610 data"):
+        backtest.run_backtest(
+            os.path.join(location_backtest, "PHYBMDATA"),
+            location_B1610,
+            df_bmu_metadata,
+            settlement_dates[1],
+            settlement_dates[-1],
+        )
+
+
+def test_missing_B1610_dates_are_fetched_into_the_backtest_folder(df_B1610, location_backtest, monkeypatch):
+    client = StubB1610Client(df_B1610)
+    monkeypatch.setattr(bmrs_fetch, "get_client", lambda: client)
+    settlement_dates = get_settlement_dates(df_B1610)
+    location_B1610 = os.path.join(location_backtest, "B1610")
+    start_date, end_date = pd.Timestamp(settlement_dates[0]), pd.Timestamp(settlement_dates[-1])
+
+    assert backtest.backfill_missing_B1610_data(location_B1610, start_date, start_date) == settlement_dates[:1]
+    assert backtest.backfill_missing_B1610_data(location_B1610, start_date, end_date) == settlement_dates[1:]
+    assert backtest.backfill_missing_B1610_data(location_B1610, start_date, end_date) == []
+
+    assert bmrs_data.read_B1610_metadata(location_B1610)["rows"] == len(df_B1610)
+    assert min(request_start for request_start, _ in client.requests) == start_date
+    assert max(request_end for _, request_end in client.requests) <= end_date + timedelta(days=1)
@@ -0,0 +1,110 @@
+"""
+The changefeed of the combined generation dataset, see update_changefeed.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import generation_outputs
+import pipeline_fns as plfns
+import pipeline_storage
+import settlement_calendar
+
+
+def revise_physical_data(df_PHYBMDATA: pd.DataFrame) -> pd.DataFrame:
+    """
+    Revises the Physical BM Data as a later run would find it: the FPN levels of the last settlement date are
+    raised and the records of one BMU are withdrawn.
+    """
+    labels = settlement_calendar.get_settlement_date_labels(df_PHYBMDATA["settlementDate"])
+    last_date = df_PHYBMDATA["recordType"].eq("PN") & (labels == labels.max())
+    df_revised = df_PHYBMDATA.copy()
+    df_revised.loc[last_date, ["pnLevelFrom", "pnLevelTo"]] += np.float32(10)
+
+    withdrawn_bmu = df_PHYBMDATA["bmUnitID"].astype(str).min()
+    return df_revised.loc[df_revised["bmUnitID"] != withdrawn_bmu].reset_index(drop=True)
+
+
+def run_stages(location: str, df_B1610: pd.DataFrame, df_PHYBMDATA: pd.DataFrame, df_bmu_metadata: pd.DataFrame):
+    plfns.run_generation_stages(
+        location, df_B1610, df_PHYBMDATA, df_bmu_metadata, write_csv=False, correct_wind_FPN=False, mode="analytic"
+    )
+
+
+@pytest.fixture
+def location_published(df_B1610_history, df_PHYBMDATA, df_bmu_metadata, tmp_path) -> str:
+    location = str(tmp_path)
+    run_stages(location, df_B1610_history, df_PHYBMDATA, df_bmu_metadata)
+    return location
+
+
+def test_changes_reproduce_the_dataset(df_B1610_history, df_PHYBMDATA, df_bmu_metadata, location_published):
+    df_snapshot, sequence = generation_outputs.read_changefeed_snapshot(location_published)
+    pd.testing.assert_frame_equal(df_snapshot, generation_outputs.read_generation_data(location_published))
+
+    run_stages(location_published, df_B1610_history, revise_physical_data(df_PHYBMDATA), df_bmu_metadata)
+
+    df_changes = generation_outputs.read_changes(location_published, sequence)
+    assert set(df_changes["operation"]) == {"update", "delete"}
+    df_generation = generation_outputs.read_generation_data(location_published)
+    pd.testing.assert_frame_equal(
+        generation_outputs.apply_changes(df_snapshot, df_changes),
+        df_generation.sort_values(generation_outputs.CHANGEFEED_KEY_COLUMNS, kind="stable").reset_index(drop=True),
+        check_categorical=False,
+    )
+
+
+def test_state_has_the_keys_and_hashes_of_each_settlement_date(location_published):
+    location_state = generation_outputs.get_changefeed_state_location(location_published)
+    state_partitions = pipeline_storage.list_partitions(location_state, "Changefeed_State")
+    generation_partitions = pipeline_storage.list_partitions(
+        generation_outputs.get_generation_location(location_published), "Generation_Combined"
+    )
+    assert list(state_partitions) == list(generation_partitions)
+
+    df_state = generation_outputs.read_changefeed_state(location_published, list(state_partitions))
+    df_generation = generation_outputs.read_generation_data(location_published)
+    df_generation = df_generation.sort_values(generation_outputs.CHANGEFEED_KEY_COLUMNS, kind="stable").reset_index(
+        drop=True
+    )
+    for path in state_partitions.values():
+        assert pd.read_parquet(path).columns.tolist() == generation_outputs.CHANGEFEED_STATE_COLUMNS
+    np.testing.assert_array_equal(df_state["localDateTime"], df_generation["localDateTime"])
+    np.testing.assert_array_equal(df_state["rowHash"], generation_outputs.hash_generation_rows(df_generation))
+
+
+def test_unchanged_state_is_not_rewritten(df_B1610_history, df_PHYBMDATA, df_bmu_metadata, location_published):
+    state_partitions = pipeline_storage.list_partitions(
+        generation_outputs.get_changefeed_state_location(location_published), "Changefeed_State"
+    )
+    modified_times = {date: os.stat(path).st_mtime_ns for date, path in state_partitions.items()}
+
+    run_stages(location_published, df_B1610_history, revise_physical_data(df_PHYBMDATA), df_bmu_metadata)
+
+    first_date = min(state_partitions)
+    assert os.stat(state_partitions[first_date]).st_mtime_ns == modified_times[first_date]
+    assert any(os.stat(path).st_mtime_ns != modified_times[date] for date, path in state_partitions.items())
+
+
+def test_single_state_file_is_split(df_B1610_history, df_PHYBMDATA, df_bmu_metadata, location_published):
+    location_state = generation_outputs.get_changefeed_state_location(location_published)
+    df_state = generation_outputs.read_changefeed_state(
+        location_published, list(pipeline_storage.list_partitions(location_state, "Changefeed_State"))
+    )
+    for file_name in os.listdir(location_state):
+        os.remove(os.path.join(location_state, file_name))
+    os.rmdir(location_state)
+    path_single_state = os.path.join(
+        generation_outputs.get_changefeed_location(location_published), "changefeed_state.parquet"
+    )
+    df_state.to_parquet(path_single_state, index=False)
+    sequence = generation_outputs.read_changefeed_manifest(location_published)["sequence"]
+
+    run_stages(location_published, df_B1610_history, revise_physical_data(df_PHYBMDATA), df_bmu_metadata)
+
+    assert not os.path.isfile(path_single_state)
+    df_changes = generation_outputs.read_changes(location_published, sequence)
+    assert set(df_changes["operation"]) == {"update", "delete"}
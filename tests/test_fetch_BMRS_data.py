@@ -0,0 +1,123 @@
+"""
+fetch_BMRS_data against a stand-in for the ElexonDataPortal client, which serves a canned response for each
+settlement period, can be told to fail, and records when it was called.
+"""
+
+import random
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+import bmrs_fetch
+
+START_DATE = pd.Timestamp("2024-10-26 00:00", tz="UTC")
+END_DATE = pd.Timestamp("2024-10-26 12:00", tz="UTC")
+
+
+class CannedBMRSClient:
+    """
+    Serves get_B1610 with one row per settlement period of the requested range, in a random order of completion
+    across threads. The first failures[period_start] requests covering a settlement period raise a ConnectionError.
+    """
+
+    def __init__(self, failures: dict = None, max_delay: float = 0.02, seed: int = 0):
+        self.failures = dict(failures or {})
+        self.max_delay = max_delay
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = []
+
+    def get_B1610(self, start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
+        period_starts = pd.date_range(start_date, end_date, freq="30min", inclusive="left")
+
+        with self.lock:
+            self.requests.append((time.monotonic(), start_date, end_date))
+            delay = self.random.uniform(0, self.max_delay)
+            failing = [period_start for period_start in period_starts if self.failures.get(period_start, 0) > 0]
+            for period_start in failing:
+                self.failures[period_start] -= 1
+
+        time.sleep(delay)
+        if failing:
+            raise ConnectionError(f"Injected failure for {failing[0]}")
+
+        return canned_responses(period_starts)
+
+
+def canned_responses(period_starts) -> pd.DataFrame:
+    """
+    The canned response of each settlement period: its start and a quantity derived from it.
+    """
+    return pd.DataFrame(
+        {
+            "period_start": period_starts,
+            "quantity": [period_start.hour * 2 + period_start.minute / 30 for period_start in period_starts],
+        }
+    )
+
+
+def expected_data(start_date: pd.Timestamp = START_DATE, end_date: pd.Timestamp = END_DATE) -> pd.DataFrame:
+    return canned_responses(pd.date_range(start_date, end_date, freq="30min", inclusive="left"))
+
+
+def fetch(client: CannedBMRSClient, **kwargs) -> pd.DataFrame:
+    kwargs = {
+        "chunk_size": timedelta(hours=1),
+        "max_workers": 4,
+        "backoff_seconds": 0,
+        "max_requests_per_second": None,
+        **kwargs,
+    }
+    return bmrs_fetch.fetch_BMRS_data("B1610", START_DATE, END_DATE, fetch_client=client, **kwargs)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_chunks_are_reassembled_in_date_order(seed):
+    client = CannedBMRSClient(seed=seed)
+    df = fetch(client)
+
+    pd.testing.assert_frame_equal(df, expected_data())
+    assert len(client.requests) == 12
+
+
+def test_failed_chunks_are_retried():
+    failures = {START_DATE + timedelta(hours=1): 2, START_DATE + timedelta(hours=5, minutes=30): 1}
+    client = CannedBMRSClient(failures=failures)
+    df = fetch(client, n_attempts=3)
+
+    pd.testing.assert_frame_equal(df, expected_data())
+    assert len(client.requests) == 12 + 3
+    assert not any(client.failures.values())
+
+
+def test_failure_is_raised_after_the_last_attempt():
+    client = CannedBMRSClient(failures={START_DATE + timedelta(hours=3): 3})
+
+    with pytest.raises(ConnectionError):
+        fetch(client, n_attempts=3)
+
+
+def test_requests_are_rate_limited():
+    max_requests_per_second = 50
+    client = CannedBMRSClient(max_delay=0)
+    fetch(client, max_requests_per_second=max_requests_per_second)
+
+    request_times = pd.Series(sorted(request_time for request_time, _, _ in client.requests))
+    # The i-th request is released no earlier than i intervals after the first, less one interval for the time
+    # between the rate limiter releasing a request and the client receiving it
+    min_elapsed = (request_times.index - 1) / max_requests_per_second
+    assert (request_times - request_times[0] >= min_elapsed).all()
+
+
+def test_settlement_periods_are_cached(tmp_path):
+    client = CannedBMRSClient()
+    df = fetch(client, cache_location=str(tmp_path))
+    df_cached = fetch(client, cache_location=str(tmp_path))
+
+    pd.testing.assert_frame_equal(df, expected_data())
+    pd.testing.assert_frame_equal(df_cached, expected_data())
+    assert len(client.requests) == 24
+    assert all(end_date - start_date == timedelta(minutes=30) for _, start_date, end_date in client.requests)
@@ -0,0 +1,136 @@
+"""
+The query service over the combined generation dataset, see generation_service.py.
+"""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+from datetime import timedelta
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import generation_outputs
+import generation_service
+import pipeline_fns as plfns
+import settlement_calendar
+
+
+def run_stages(location: str, df_B1610: pd.DataFrame, df_PHYBMDATA: pd.DataFrame, df_bmu_metadata: pd.DataFrame):
+    plfns.run_generation_stages(
+        location, df_B1610, df_PHYBMDATA, df_bmu_metadata, write_csv=False, correct_wind_FPN=False, mode="analytic"
+    )
+
+
+def sort_rows(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(["localDateTime", "BMUnitID"], kind="stable", ignore_index=True)
+
+
+def assert_index_of(store: generation_service.GenerationStore, location: str):
+    df_generation = sort_rows(generation_outputs.read_generation_data(location))
+    pd.testing.assert_frame_equal(
+        store.index.df_generation,
+        df_generation.assign(quantity=df_generation["quantity"].astype("float64")),
+        check_categorical=False,
+    )
+
+
+@pytest.fixture
+def location_published(df_B1610_history, df_PHYBMDATA, df_bmu_metadata, tmp_path) -> str:
+    location = str(tmp_path)
+    run_stages(location, df_B1610_history, df_PHYBMDATA, df_bmu_metadata)
+    return location
+
+
+def test_index_selects_the_rows_of_a_group(df_generation):
+    index = generation_service.GenerationIndex(df_generation)
+    df_sorted = index.df_generation
+    start = df_sorted["localDateTime"].iloc[len(df_sorted) // 3]
+    end = start + timedelta(hours=6)
+    in_range = (df_sorted["localDateTime"] >= start) & (df_sorted["localDateTime"] < end)
+
+    bmu, station, fuel = df_sorted[["BMUnitID", "dictionaryID", "fuel"]].iloc[-1]
+    for column, key, url_key in [
+        ("BMUnitID", bmu, bmu),
+        ("dictionaryID", station, str(station)),
+        ("fuel", fuel, fuel.upper()),
+    ]:
+        pd.testing.assert_frame_equal(
+            index.select(column, url_key, start, end), df_sorted.loc[in_range & (df_sorted[column] == key)]
+        )
+
+    latest = df_sorted["localDateTime"] == df_sorted["localDateTime"].max()
+    pd.testing.assert_frame_equal(index.select("BMUnitID", bmu), df_sorted.loc[latest & (df_sorted["BMUnitID"] == bmu)])
+    pd.testing.assert_frame_equal(index.select_time_range(), df_sorted.loc[latest])
+    assert index.select("BMUnitID", "unknown") is None
+
+
+def test_store_follows_the_changefeed(df_B1610_history, df_PHYBMDATA, df_bmu_metadata, location_published):
+    store = generation_service.GenerationStore(location_published)
+    assert store.reload()
+    assert store.index.sequence == generation_outputs.read_changefeed_manifest(location_published)["sequence"]
+    assert_index_of(store, location_published)
+    assert not store.reload()
+
+    labels = settlement_calendar.get_settlement_date_labels(df_PHYBMDATA["settlementDate"])
+    df_revised = df_PHYBMDATA.copy()
+    df_revised.loc[labels == labels.max(), ["pnLevelFrom", "pnLevelTo"]] += np.float32(10)
+    run_stages(location_published, df_B1610_history, df_revised, df_bmu_metadata)
+
+    assert store.reload()
+    assert store.index.sequence == generation_outputs.read_changefeed_manifest(location_published)["sequence"]
+    assert_index_of(store, location_published)
+
+
+def test_store_reads_the_partitions_without_a_changefeed(df_generation, tmp_path):
+    location = str(tmp_path)
+    generation_outputs.write_generation_data(df_generation, location)
+
+    store = generation_service.GenerationStore(location)
+    assert store.reload()
+    assert store.index.sequence is None
+    assert_index_of(store, location)
+    assert not store.reload()
+
+
+def test_server_answers_queries(location_published):
+    store = generation_service.GenerationStore(location_published)
+    store.reload()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), generation_service.GenerationRequestHandler)
+    server.store = store
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def get(path: str) -> tuple:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}{path}") as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as error:
+            return error.code, json.load(error)
+
+    try:
+        df_sorted = store.index.df_generation
+        status, body = get("/status")
+        assert (status, body["rows"], body["sequence"]) == (200, len(df_sorted), store.index.sequence)
+
+        bmu = df_sorted["BMUnitID"].iloc[-1]
+        status, body = get(f"/bmu/{bmu}?start=2000-01-01T00:00Z")
+        assert (status, body["BMUnitID"]) == (200, bmu)
+        assert len(body["data"]) == (df_sorted["BMUnitID"] == bmu).sum()
+
+        status, body = get("/latest?by=fuel")
+        latest = df_sorted["localDateTime"] == df_sorted["localDateTime"].max()
+        assert status == 200
+        np.testing.assert_allclose(
+            sum(row["quantity"] for row in body["data"]), df_sorted.loc[latest, "quantity"].sum()
+        )
+
+        assert get("/bmu/unknown")[0] == 404
+        assert get("/station/abc")[0] == 400
+        assert get(f"/bmu/{bmu}?start=2024-01-01T00:00")[0] == 400
+        assert get("/latest?by=region")[0] == 400
+    finally:
+        server.shutdown()
+        server.server_close()
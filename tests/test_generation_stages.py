@@ -0,0 +1,34 @@
+"""
+The stages run after the update of the B1610 and Physical BM Data, see run_generation_stages.
+"""
+
+import pipeline_fns as plfns
+import pipeline_instrumentation
+
+# Stages that return dataframes, so that their output rows are recorded
+STAGES_WITH_OUTPUT_ROWS = [
+    "update_wind_FPN_correction",
+    "find_dirty_settlement_periods",
+    "filter_and_rename_physical_Data",
+    "calculate_settlement_period_generation",
+    "add_BMU_metadata",
+    "write_generation_data",
+    "update_nowcast",
+]
+
+
+def test_stages_record_their_rows(df_B1610_history, df_PHYBMDATA, df_bmu_metadata, tmp_path):
+    run_report = pipeline_instrumentation.RunReport("test", profile="")
+
+    outputs = plfns.run_generation_stages(
+        str(tmp_path), df_B1610_history, df_PHYBMDATA, df_bmu_metadata, write_csv=False, run_report=run_report
+    )
+
+    stages = {stage["name"]: stage for stage in run_report.stages}
+    assert set(STAGES_WITH_OUTPUT_ROWS) <= set(stages)
+    for name in STAGES_WITH_OUTPUT_ROWS:
+        assert stages[name]["rows_in"] > 0, name
+        assert stages[name]["rows_out"] is not None, name
+
+    assert stages["find_dirty_settlement_periods"]["rows_in"] == len(df_PHYBMDATA)
+    assert stages["write_generation_data"]["rows_out"] == len(outputs["df_generation"])
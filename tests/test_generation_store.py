@@ -0,0 +1,77 @@
+"""
+The combined generation dataset stored as one parquet partition per settlement date, see write_generation_data.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import generation_outputs
+import pipeline_schema
+import pipeline_storage
+import settlement_calendar
+
+
+def get_settlement_dates(df: pd.DataFrame) -> list:
+    return sorted(set(settlement_calendar.get_settlement_date_labels(df["settlementDate"])))
+
+
+def list_generation_partitions(location: str) -> dict:
+    return pipeline_storage.list_partitions(generation_outputs.get_generation_location(location), "Generation_Combined")
+
+
+def test_dataset_is_read_back(df_generation, tmp_path):
+    location = str(tmp_path)
+    assert generation_outputs.write_generation_data(df_generation, location, write_csv=True) == get_settlement_dates(
+        df_generation
+    )
+
+    df_read = generation_outputs.read_generation_data(location)
+    pd.testing.assert_frame_equal(
+        df_read, pipeline_schema.apply_schema(df_generation.reset_index(drop=True), pipeline_schema.GENERATION_SCHEMA)
+    )
+    df_csv = pd.read_csv(os.path.join(location, "Generation_Combined.csv"))
+    pd.testing.assert_frame_equal(
+        pipeline_schema.apply_schema(df_csv, pipeline_schema.GENERATION_SCHEMA), df_read, check_categorical=False
+    )
+
+    start_datetime = df_generation["localDateTime"].quantile(0.5)
+    df_later = generation_outputs.read_generation_data(location, start_datetime=start_datetime)
+    assert (df_later["localDateTime"] > start_datetime).all()
+    assert len(df_later) == (df_generation["localDateTime"] > start_datetime).sum()
+
+
+def test_only_changed_partitions_are_rewritten(df_generation, tmp_path):
+    location = str(tmp_path)
+    generation_outputs.write_generation_data(df_generation, location)
+    partitions = list_generation_partitions(location)
+    modified_times = {date: os.stat(path).st_mtime_ns for date, path in partitions.items()}
+    first_date, *later_dates = partitions
+
+    labels = settlement_calendar.get_settlement_date_labels(df_generation["settlementDate"])
+    df_revised = df_generation.loc[labels != first_date].copy()
+    df_revised.loc[labels[labels != first_date] == later_dates[-1], "quantity"] += np.float32(1)
+
+    assert generation_outputs.write_generation_data(df_revised, location) == [later_dates[-1]]
+    assert list(list_generation_partitions(location)) == later_dates
+    assert all(os.stat(partitions[date]).st_mtime_ns == modified_times[date] for date in later_dates[:-1])
+
+
+def test_failed_write_keeps_the_previous_partition(df_generation, tmp_path, monkeypatch):
+    location = str(tmp_path)
+    generation_outputs.write_generation_data(df_generation, location)
+    df_before = generation_outputs.read_generation_data(location)
+    to_parquet = pd.DataFrame.to_parquet
+
+    def fail_after_writing_half(df, path, **kwargs):
+        to_parquet(df.iloc[: len(df) // 2], path, **kwargs)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", fail_after_writing_half)
+    with pytest.raises(OSError):
+        generation_outputs.write_generation_data(df_generation.assign(quantity=df_generation["quantity"] + 1), location)
+    monkeypatch.undo()
+
+    pd.testing.assert_frame_equal(generation_outputs.read_generation_data(location), df_before)
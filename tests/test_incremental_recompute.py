@@ -0,0 +1,107 @@
+"""
+Recalculating only the dirty settlement periods (see find_dirty_settlement_periods) must give the same outputs as
+recalculating everything from the revised Physical BM Data.
+"""
+
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import generation_calc
+import generation_outputs
+import nowcast
+import pipeline_fns as plfns
+
+NOWCAST_RESOLUTION = "5min"
+
+
+def revise_physical_data(df_PHYBMDATA: pd.DataFrame, start: pd.Timestamp) -> pd.DataFrame:
+    """
+    Revises the Physical BM Data as a later run would find it: the FPN levels of one BMU are raised for an hour
+    from start, and the acceptances of another BMU are withdrawn over the same hour.
+    """
+    revised_bmu, withdrawn_bmu = sorted(df_PHYBMDATA["bmUnitID"].astype(str).unique())[:2]
+    in_hour = (df_PHYBMDATA["local_datetime"] >= start) & (df_PHYBMDATA["local_datetime"] < start + timedelta(hours=1))
+
+    df_revised = df_PHYBMDATA.copy()
+    revised = in_hour & df_PHYBMDATA["bmUnitID"].eq(revised_bmu) & df_PHYBMDATA["recordType"].eq("PN")
+    df_revised.loc[revised, ["pnLevelFrom", "pnLevelTo"]] += np.float32(10)
+    withdrawn = in_hour & df_PHYBMDATA["bmUnitID"].eq(withdrawn_bmu) & df_PHYBMDATA["recordType"].eq("BOALF")
+    return df_revised.loc[~withdrawn].reset_index(drop=True)
+
+
+def get_revision_start(df_PHYBMDATA: pd.DataFrame) -> pd.Timestamp:
+    # midday of the last settlement date, well inside the data
+    return df_PHYBMDATA["settlementDate"].max() + timedelta(hours=12)
+
+
+def run_stages(location: str, df_B1610: pd.DataFrame, df_PHYBMDATA: pd.DataFrame, df_bmu_metadata, mode: str):
+    plfns.run_generation_stages(
+        location,
+        df_B1610,
+        df_PHYBMDATA,
+        df_bmu_metadata,
+        mode=mode,
+        write_csv=False,
+        correct_wind_FPN=False,
+        nowcast_resolution=None,
+    )
+
+
+def read_rollups(location: str) -> dict:
+    location_rollups = generation_outputs.get_rollup_location(location)
+    return {
+        file_name: pd.read_parquet(os.path.join(location_rollups, file_name))
+        for file_name in sorted(os.listdir(location_rollups))
+        if file_name.endswith(".parquet")
+    }
+
+
+@pytest.mark.parametrize("mode", ["minutely", "analytic"])
+def test_dataset_and_rollups_match_a_full_recompute(df_B1610_history, df_PHYBMDATA, df_bmu_metadata, tmp_path, mode):
+    df_revised = revise_physical_data(df_PHYBMDATA, get_revision_start(df_PHYBMDATA))
+    location_incremental, location_full = str(tmp_path / "incremental"), str(tmp_path / "full")
+
+    run_stages(location_incremental, df_B1610_history, df_PHYBMDATA, df_bmu_metadata, mode)
+    df_fingerprints = generation_calc.read_physical_data_fingerprints(location_incremental, mode=mode)
+    df_dirty = generation_calc.find_dirty_settlement_periods(
+        generation_calc.fingerprint_physical_data(df_revised), df_fingerprints
+    )
+    assert 0 < len(df_dirty) < len(df_fingerprints) / 10
+
+    run_stages(location_incremental, df_B1610_history, df_revised, df_bmu_metadata, mode)
+    run_stages(location_full, df_B1610_history, df_revised, df_bmu_metadata, mode)
+
+    pd.testing.assert_frame_equal(
+        generation_outputs.read_generation_data(location_incremental),
+        generation_outputs.read_generation_data(location_full),
+    )
+    rollups_incremental, rollups_full = read_rollups(location_incremental), read_rollups(location_full)
+    assert list(rollups_incremental) == list(rollups_full)
+    for file_name, df_rollup in rollups_full.items():
+        pd.testing.assert_frame_equal(rollups_incremental[file_name], df_rollup, obj=file_name)
+
+
+def test_nowcast_matches_a_full_recompute(df_PHYBMDATA, df_bmu_metadata, tmp_path):
+    now = get_revision_start(df_PHYBMDATA) - timedelta(minutes=20)
+    later = now + timedelta(minutes=30)
+    df_revised = revise_physical_data(df_PHYBMDATA, get_revision_start(df_PHYBMDATA))
+    location_incremental, location_full = str(tmp_path / "incremental"), str(tmp_path / "full")
+
+    nowcast.update_nowcast(df_PHYBMDATA, df_bmu_metadata, location_incremental, resolution=NOWCAST_RESOLUTION, now=now)
+    df_incremental = nowcast.update_nowcast(
+        df_revised, df_bmu_metadata, location_incremental, resolution=NOWCAST_RESOLUTION, now=later
+    )
+    df_full = nowcast.update_nowcast(
+        df_revised, df_bmu_metadata, location_full, resolution=NOWCAST_RESOLUTION, now=later
+    )
+
+    assert not df_full.empty
+    pd.testing.assert_frame_equal(df_incremental.reset_index(drop=True), df_full.reset_index(drop=True))
+    path = os.path.join(
+        nowcast.get_nowcast_location(location_incremental), f"Generation_Nowcast_{NOWCAST_RESOLUTION}.parquet"
+    )
+    pd.testing.assert_frame_equal(pd.read_parquet(path), df_full.reset_index(drop=True))
@@ -0,0 +1,70 @@
+"""
+The sub-half-hourly nowcast of the generation of each BMU, see update_nowcast.
+"""
+
+import json
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import generation_calc
+import nowcast
+import pipeline_schema
+
+
+def get_now(df_PHYBMDATA: pd.DataFrame) -> pd.Timestamp:
+    # during the last settlement date, so that the data covers the whole nowcast
+    return df_PHYBMDATA["settlementDate"].max() + timedelta(hours=10, minutes=40)
+
+
+@pytest.mark.parametrize("resolution", nowcast.NOWCAST_RESOLUTIONS)
+def test_intervals_cover_the_window(df_PHYBMDATA, df_bmu_metadata, tmp_path, resolution):
+    now = get_now(df_PHYBMDATA)
+    start, end = nowcast.get_nowcast_window(now)
+    assert (start, end) == (now.floor("30min"), now.floor("30min") + nowcast.NOWCAST_PERIODS * timedelta(minutes=30))
+
+    df_nowcast = nowcast.update_nowcast(df_PHYBMDATA, df_bmu_metadata, str(tmp_path), resolution=resolution, now=now)
+
+    assert list(df_nowcast.columns) == list(pipeline_schema.GENERATION_SCHEMA)
+    assert (df_nowcast["quantity"] > 0).all()
+    assert df_nowcast["localDateTime"].min() == start
+    assert df_nowcast["localDateTime"].max() == end - pd.Timedelta(resolution)
+    assert (df_nowcast["localDateTime"] == df_nowcast["localDateTime"].dt.floor(resolution)).all()
+    assert not df_nowcast.duplicated(["localDateTime", "BMUnitID"]).any()
+
+    location_nowcast = nowcast.get_nowcast_location(str(tmp_path))
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(os.path.join(location_nowcast, f"Generation_Nowcast_{resolution}.parquet")),
+        df_nowcast.reset_index(drop=True),
+    )
+    with open(os.path.join(location_nowcast, f"Generation_Nowcast_{resolution}.json")) as f:
+        metadata = json.load(f)
+    assert (metadata["resolution"], metadata["rows"]) == (resolution, len(df_nowcast))
+    assert (pd.Timestamp(metadata["start"]), pd.Timestamp(metadata["end"])) == (start, end)
+
+
+def test_intervals_average_to_the_settlement_period_generation(df_PHYBMDATA, df_bmu_metadata, tmp_path):
+    now = get_now(df_PHYBMDATA)
+    df_nowcast = nowcast.update_nowcast(df_PHYBMDATA, df_bmu_metadata, str(tmp_path), resolution="5min", now=now)
+
+    df_settlement_periods = generation_calc.calculate_settlement_period_generation(
+        *generation_calc.split_physical_data(df_PHYBMDATA), mode="minutely"
+    )
+    df_settlement_periods = df_settlement_periods.loc[df_settlement_periods["quantity"] > 0]
+    df_settlement_periods = df_settlement_periods.set_index(["local_datetime", "bmUnitID"])["quantity"]
+
+    # BMU settlement periods generating throughout, whose six intervals are all in the nowcast
+    intervals = df_nowcast.groupby([df_nowcast["localDateTime"].dt.floor("30min"), "BMUnitID"], observed=True)
+    df_mean = intervals["quantity"].mean().loc[intervals.size() == 6]
+    assert len(df_mean) > 0
+    np.testing.assert_allclose(
+        df_mean.to_numpy(), df_settlement_periods.loc[df_mean.index.to_list()].to_numpy(), rtol=1e-5
+    )
+
+
+def test_unknown_resolution_is_rejected(df_PHYBMDATA, df_bmu_metadata, tmp_path):
+    with pytest.raises(ValueError):
+        nowcast.update_nowcast(df_PHYBMDATA, df_bmu_metadata, str(tmp_path), resolution="10min")
@@ -0,0 +1,28 @@
+"""
+calculate_settlement_period_generation must give the same output whatever its number of workers, including on
+the clock change days of the fixtures.
+"""
+
+import pandas as pd
+import pytest
+
+import generation_calc
+
+N_WORKERS = [2, 3]
+
+
+@pytest.mark.parametrize("mode, segment_shape", [("minutely", "step"), ("analytic", "step"), ("analytic", "linear")])
+def test_output_does_not_depend_on_n_workers(physical_data, mode, segment_shape):
+    df_fpn, df_mel, df_boal = physical_data["fpn"], physical_data["mel"], physical_data["boal"]
+    df_expected = generation_calc.calculate_settlement_period_generation(
+        df_fpn, df_mel, df_boal, mode=mode, segment_shape=segment_shape, n_workers=1
+    )
+    assert set(df_expected.groupby("settlementDate")["settlementPeriod"].max()) & {46, 50}
+
+    for n_workers in N_WORKERS:
+        assert len(generation_calc.split_BMU_shards(df_fpn, df_mel, df_boal, n_workers)) == n_workers
+
+        df = generation_calc.calculate_settlement_period_generation(
+            df_fpn, df_mel, df_boal, mode=mode, segment_shape=segment_shape, n_workers=n_workers
+        )
+        pd.testing.assert_frame_equal(df, df_expected)
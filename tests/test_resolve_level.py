@@ -0,0 +1,45 @@
+"""
+The vectorised engine of resolve_level must return the same dataframe as the original resample loop.
+"""
+
+import pandas as pd
+import pytest
+
+import generation_calc
+from settlement_calendar import get_periods_in_day
+
+RESOLVE_FUNCTIONS = {
+    "fpn": generation_calc.resolve_FPN_MEL_level,
+    "mel": generation_calc.resolve_FPN_MEL_level,
+    "boal": generation_calc.resolve_applied_bid_offer_level,
+}
+
+
+def test_fixture_includes_clock_change_day(df_PHYBMDATA):
+    assert set(get_periods_in_day(df_PHYBMDATA["settlementDate"].unique())) & {46, 50}
+
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+@pytest.mark.parametrize("record_type", list(RESOLVE_FUNCTIONS))
+def test_vectorised_matches_resample(physical_data, record_type):
+    df_linear = generation_calc.convert_physical_data_to_long(physical_data[record_type])
+    resolve = RESOLVE_FUNCTIONS[record_type]
+
+    pd.testing.assert_frame_equal(resolve(df_linear, engine="vectorised"), resolve(df_linear, engine="resample"))
+
+
+def test_vectorised_keeps_latest_acceptance(physical_data):
+    df_linear = generation_calc.convert_physical_data_to_long(physical_data["boal"])
+    resolved = generation_calc.resolve_applied_bid_offer_level(df_linear)
+
+    # Where acceptances overlap, the one with the highest acceptance number (the latest) is applied
+    df_latest = df_linear.reset_index().sort_values("Accept ID")
+    df_latest["Time"] = df_latest["Time"].dt.floor("T")
+    latest = df_latest.groupby(["Time", "bmUnitID"], observed=True)["Accept ID"].last()
+    assert (resolved.loc[latest.index, "Accept ID"] >= latest).all()
+
+
+def test_unknown_engine(physical_data):
+    df_linear = generation_calc.convert_physical_data_to_long(physical_data["fpn"])
+    with pytest.raises(ValueError):
+        generation_calc.resolve_FPN_MEL_level(df_linear, engine="loop")
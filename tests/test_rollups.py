@@ -0,0 +1,83 @@
+"""
+The rollups of the combined generation dataset, see update_generation_rollups.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import generation_outputs
+import pipeline_schema
+import settlement_calendar
+
+
+def read_rollups(location: str) -> dict:
+    location_rollups = generation_outputs.get_rollup_location(location)
+    return {
+        name: pd.read_parquet(os.path.join(location_rollups, f"Generation_Rollup_{name}.parquet"))
+        for name in generation_outputs.calculate_generation_rollups(
+            pd.DataFrame(columns=list(pipeline_schema.GENERATION_SCHEMA))
+        )
+    }
+
+
+def assert_rollups_of(df_generation: pd.DataFrame, location: str):
+    rollups = read_rollups(location)
+    for name, df_expected in generation_outputs.calculate_generation_rollups(df_generation).items():
+        keys = [column for column in df_expected.columns if column not in ["quantity", "BMUs"]]
+        df_expected = pipeline_schema.apply_schema(
+            df_expected, {column: pipeline_schema.GENERATION_SCHEMA[column] for column in keys}
+        )
+        df_expected = df_expected.sort_values(keys, kind="stable").reset_index(drop=True)
+        df_expected["BMUs"] = df_expected["BMUs"].astype("int32")
+        pd.testing.assert_frame_equal(rollups[name], df_expected, check_categorical=False, obj=name)
+
+
+@pytest.fixture
+def location_rollups(df_generation, tmp_path) -> str:
+    location = str(tmp_path)
+    generation_outputs.write_generation_data(df_generation, location)
+    generation_outputs.update_generation_rollups(location)
+    return location
+
+
+def test_rollups_sum_the_dataset(df_generation, location_rollups):
+    assert_rollups_of(df_generation, location_rollups)
+
+    df_daily = read_rollups(location_rollups)["fuel_daily"]
+    np.testing.assert_allclose(df_daily["quantity"].sum(), df_generation["quantity"].astype("float64").sum())
+    assert generation_outputs.update_generation_rollups(location_rollups) == []
+
+
+def test_only_changed_settlement_dates_are_recalculated(df_generation, location_rollups):
+    labels = settlement_calendar.get_settlement_date_labels(df_generation["settlementDate"])
+    first_date, *later_dates = sorted(set(labels))
+    df_revised = df_generation.loc[labels != first_date].copy()
+    df_revised.loc[labels[labels != first_date] == later_dates[-1], "quantity"] += np.float32(5)
+
+    generation_outputs.write_generation_data(df_revised, location_rollups)
+    assert generation_outputs.update_generation_rollups(location_rollups, write_csv=True) == [
+        first_date,
+        later_dates[-1],
+    ]
+    assert_rollups_of(df_revised, location_rollups)
+
+    path_csv = os.path.join(
+        generation_outputs.get_rollup_location(location_rollups), "Generation_Rollup_fuel_daily.csv"
+    )
+    assert len(pd.read_csv(path_csv)) == len(read_rollups(location_rollups)["fuel_daily"])
+
+
+def test_missing_rollup_is_rebuilt(df_generation, location_rollups):
+    os.remove(
+        os.path.join(
+            generation_outputs.get_rollup_location(location_rollups), "Generation_Rollup_station_daily.parquet"
+        )
+    )
+
+    assert generation_outputs.update_generation_rollups(location_rollups) == sorted(
+        set(settlement_calendar.get_settlement_date_labels(df_generation["settlementDate"]))
+    )
+    assert_rollups_of(df_generation, location_rollups)
@@ -0,0 +1,103 @@
+"""
+The instrumentation of pipeline runs, see pipeline_instrumentation.RunReport.
+"""
+
+import json
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pipeline_instrumentation
+
+ALLOCATION_MB = 200
+
+
+def make_module() -> types.ModuleType:
+    module = types.ModuleType("stub_pipeline")
+
+    def double(df: pd.DataFrame) -> pd.DataFrame:
+        return pd.concat([df, df])
+
+    def double_twice(df: pd.DataFrame) -> pd.DataFrame:
+        return module.double(module.double(df))
+
+    for function in (double, double_twice):
+        function.__module__ = module.__name__
+        setattr(module, function.__name__, function)
+    return module
+
+
+@pytest.mark.skipif(not pipeline_instrumentation.reset_peak_rss(), reason="the peak RSS can only be reset on Linux")
+def test_stages_record_their_own_peak_rss(tmp_path):
+    run_report = pipeline_instrumentation.RunReport("test", profile="")
+
+    with run_report.stage("allocate"):
+        # Touches every page, so that the allocation is resident
+        allocation = np.ones(ALLOCATION_MB * 1024**2, dtype=np.uint8)
+        del allocation
+    with run_report.stage("idle"):
+        pass
+
+    allocate, idle = run_report.stages
+    assert allocate["peak_rss_mb"] >= allocate["rss_start_mb"] + 0.9 * ALLOCATION_MB
+    assert idle["peak_rss_mb"] < allocate["peak_rss_mb"] - 0.9 * ALLOCATION_MB
+    with open(run_report.write(str(tmp_path))) as f:
+        assert json.load(f)["peak_rss_mb"] >= allocate["peak_rss_mb"]
+
+
+def test_instrument_counts_calls_and_restores_the_module():
+    module = make_module()
+    original_functions = dict(vars(module))
+    df = pd.DataFrame({"value": range(3)})
+
+    run_report = pipeline_instrumentation.RunReport("test", profile="")
+    restore = run_report.instrument(module)
+    assert len(module.double_twice(df)) == 12
+    restore()
+
+    assert vars(module) == original_functions
+    [stage] = run_report.stages
+    assert stage["name"] == "double_twice"
+    assert (stage["rows_in"], stage["rows_out"]) == (3, 12)
+    assert stage["calls"]["double"]["count"] == 2
+
+
+def test_instrumenting_again_does_not_stack_wrappers():
+    module = make_module()
+    df = pd.DataFrame({"value": range(3)})
+
+    first_report = pipeline_instrumentation.RunReport("first", profile="")
+    first_report.instrument(module)
+    second_report = pipeline_instrumentation.RunReport("second", profile="")
+    restore = second_report.instrument(module)
+    module.double_twice(df)
+
+    assert first_report.stages == []
+    assert [stage["name"] for stage in second_report.stages] == ["double_twice"]
+    assert second_report.stages[0]["calls"]["double"]["count"] == 2
+
+    # Restores the functions as instrumented for the first report
+    restore()
+    module.double_twice(df)
+    assert [stage["name"] for stage in first_report.stages] == ["double_twice"]
+
+
+def test_instrument_records_calls_between_modules():
+    module = make_module()
+    caller = types.ModuleType("stub_caller")
+    # Imports double as "from stub_pipeline import double" would
+    caller.double = module.double
+    exec("def quadruple(df):\n    return double(double(df))", vars(caller))
+    df = pd.DataFrame({"value": range(3)})
+
+    run_report = pipeline_instrumentation.RunReport("test", profile="")
+    restore = run_report.instrument([module, caller])
+    assert len(caller.quadruple(df)) == 12
+    restore()
+
+    assert caller.double is module.double is not None and not hasattr(caller.double, "_uninstrumented")
+    [stage] = run_report.stages
+    assert stage["name"] == "quadruple"
+    assert stage["calls"]["double"]["count"] == 2
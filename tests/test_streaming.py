@@ -0,0 +1,66 @@
+"""
+Streaming the settlement dates with stream_generation_data must write the same files as the batch path of
+run_generation_stages.
+"""
+
+import os
+
+import pytest
+
+import generation_calc
+import generation_outputs
+import pipeline_fns as plfns
+import pipeline_storage
+
+# Small enough that the BMUs of each settlement date are split into several batches
+MEMORY_BUDGET_MB = 0.05
+
+
+def run_stages(location: str, df_B1610, df_PHYBMDATA, df_bmu_metadata, mode: str, stream_by_settlement_day: bool):
+    plfns.run_generation_stages(
+        location,
+        df_B1610,
+        df_PHYBMDATA,
+        df_bmu_metadata,
+        mode=mode,
+        write_csv=True,
+        correct_wind_FPN=False,
+        nowcast_resolution=None,
+        stream_by_settlement_day=stream_by_settlement_day,
+        memory_budget_mb=MEMORY_BUDGET_MB,
+    )
+
+
+def read_outputs(location: str) -> dict:
+    paths = dict(
+        pipeline_storage.list_partitions(generation_outputs.get_generation_location(location), "Generation_Combined")
+    )
+    paths["csv"] = os.path.join(location, "Generation_Combined.csv")
+    outputs = {}
+    for name, path in paths.items():
+        with open(path, "rb") as f:
+            outputs[name] = f.read()
+    return outputs
+
+
+@pytest.mark.parametrize("mode", ["minutely", "analytic"])
+def test_streamed_files_match_the_batch_path(
+    df_B1610_history, df_PHYBMDATA, df_bmu_metadata, physical_data, tmp_path, mode
+):
+    df_fpn, df_mel, df_boal = physical_data["fpn"], physical_data["mel"], physical_data["boal"]
+    day_fpn, day_mel, day_boal = generation_calc.select_settlement_day(
+        df_fpn, df_mel, df_boal, df_fpn["settlementDate"].max()
+    )
+    bmu_batches = generation_calc.split_BMU_batches(
+        day_fpn, day_mel, day_boal, mode=mode, memory_budget_mb=MEMORY_BUDGET_MB
+    )
+    assert len(bmu_batches) > 1
+
+    location_batch, location_streamed = str(tmp_path / "batch"), str(tmp_path / "streamed")
+    for location, stream_by_settlement_day in ((location_batch, False), (location_streamed, True)):
+        os.makedirs(location)
+        run_stages(location, df_B1610_history, df_PHYBMDATA, df_bmu_metadata, mode, stream_by_settlement_day)
+
+    outputs_batch = read_outputs(location_batch)
+    assert len(outputs_batch) > 2
+    assert read_outputs(location_streamed) == outputs_batch